@@ -1,14 +1,13 @@
 from fastapi import APIRouter, HTTPException
 from app.models.user import UserCreate, UserLogin, UserOut, TokenResponse
+from app.services.database import users_db
+from app.utils.auth import JWT_SECRET, JWT_ALGORITHM
 import sqlite3
-import os
 import jwt
 from passlib.context import CryptContext
 from datetime import datetime, timedelta, timezone
 import uuid
 
-JWT_SECRET = os.environ.get("JWT_SECRET")
-JWT_ALGORITHM = os.environ.get("JWT_ALGORITHM")
 JWT_EXPIRE_MINUTES = 60 * 24 * 7  # 7 days
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -16,52 +15,28 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 auth_router = APIRouter()
 router = auth_router
 
-DB_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../db'))
-os.makedirs(DB_DIR, exist_ok=True)
-DB_PATH = os.path.join(DB_DIR, 'users.db')
+USER_COLUMNS = 'id, username, email, password_hash'
 
-def init_user_db():
-    with sqlite3.connect(DB_PATH) as conn:
-        c = conn.cursor()
-        c.execute('''CREATE TABLE IF NOT EXISTS users (
-            id TEXT PRIMARY KEY,
-            username TEXT UNIQUE NOT NULL,
-            email TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL
-        )''')
-        conn.commit()
-
-init_user_db()
+def _user_row_to_dict(row):
+    if row:
+        return {"id": row[0], "username": row[1], "email": row[2], "password_hash": row[3]}
+    return None
 
 def get_user_by_email(email: str):
-    with sqlite3.connect(DB_PATH) as conn:
-        c = conn.cursor()
-        c.execute('SELECT id, username, email, password_hash FROM users WHERE email = ?', (email,))
-        row = c.fetchone()
-        if row:
-            return {"id": row[0], "username": row[1], "email": row[2], "password_hash": row[3]}
-        return None
+    return _user_row_to_dict(users_db.fetchone(f'SELECT {USER_COLUMNS} FROM users WHERE email = ?', (email,)))
 
 def get_user_by_username(username: str):
-    with sqlite3.connect(DB_PATH) as conn:
-        c = conn.cursor()
-        c.execute('SELECT id, username, email, password_hash FROM users WHERE username = ?', (username,))
-        row = c.fetchone()
-        if row:
-            return {"id": row[0], "username": row[1], "email": row[2], "password_hash": row[3]}
-        return None
+    return _user_row_to_dict(users_db.fetchone(f'SELECT {USER_COLUMNS} FROM users WHERE username = ?', (username,)))
 
 def create_user(username: str, email: str, password: str):
     password_hash = pwd_context.hash(password)
     user_id = str(uuid.uuid4())
-    with sqlite3.connect(DB_PATH) as conn:
-        c = conn.cursor()
-        try:
-            c.execute('INSERT INTO users (id, username, email, password_hash) VALUES (?, ?, ?, ?)', (user_id, username, email, password_hash))
-            conn.commit()
-            return get_user_by_email(email)
-        except sqlite3.IntegrityError:
-            return None
+    try:
+        with users_db.transaction() as conn:
+            conn.execute('INSERT INTO users (id, username, email, password_hash) VALUES (?, ?, ?, ?)', (user_id, username, email, password_hash))
+    except sqlite3.IntegrityError:
+        return None
+    return get_user_by_email(email)
 
 def verify_password(plain, hashed):
     return pwd_context.verify(plain, hashed)
@@ -1,89 +1,230 @@
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query, Depends
+from starlette.concurrency import run_in_threadpool
+from typing import Any, Dict, Optional, Set
+import os
+import json
+import asyncio
 import logging
-from app.services.vector_store import VectorStore
-from app.services.llm_client import LLMClient
+from app.services.registry import get_vector_store, get_llm_client, get_conversation_summarizer, get_reranker
 from app.services.rag_engine import RAGEngine
+from app.services.streaming import TokenStreamer, ClientDisconnected, SlowClientError, SLOW_CLIENT_CLOSE_CODE, run_until_disconnect
 from app.models.conversation import ConversationSession
 from app.utils.citations import extract_citations_from_chunks
-from app.utils.deps import verify_token
+from app.utils.token_budget import split_budget
+from app.utils.auth import AuthenticationError, Principal, authenticate
 from app.models import CitationModel
-import jwt
-import os
 
 logger = logging.getLogger("chat_with_pdf_api")
 chat_ws_router = APIRouter()
 
-JWT_SECRET = os.environ.get("JWT_SECRET")
-JWT_ALGORITHM = os.environ.get("JWT_ALGORITHM")
+# Stored messages loaded per turn; aggregate_conversation_context only keeps the most recent turns anyway.
+CHAT_HISTORY_TAIL = 5
+# A persistent chat socket with no frames (pings included) for this long is closed.
+CHAT_WS_IDLE_TIMEOUT = float(os.environ.get("CHAT_WS_IDLE_TIMEOUT", "600"))
 
-def verify_user_jwt(token: str) -> str:
-    try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        return payload.get("user_id")
-    except Exception:
-        return None
+class ChatConnection:
+    """
+    State kept warm for one chat socket: the loaded session, its RAGEngine and the LLM client.
+    Each turn streams its answer, then persists in the background so the next message is not held up.
+    """
+    def __init__(self, websocket: WebSocket, session: ConversationSession, principal: Principal):
+        self.websocket = websocket
+        self.session = session
+        self.principal = principal
+        self.rag = RAGEngine(get_vector_store(), session.document_id, reranker=get_reranker())
+        self.llm_client = get_llm_client()
+        self.generation: Optional[asyncio.Task] = None
+        self.closed = False
+        # save() appends whatever is unsaved, so flushes must not overlap.
+        self._save_lock = asyncio.Lock()
+        self._flushes: Set[asyncio.Task] = set()
 
-def get_vector_store():
-    return VectorStore()
+    @property
+    def busy(self) -> bool:
+        return self.generation is not None and not self.generation.done()
+
+    async def send(self, frame: Dict[str, Any]):
+        if not self.closed:
+            await self.websocket.send_json(frame)
+
+    async def answer(self, message: str):
+        """
+        Answers one message. If it is cancelled or the client goes away, the LLM stream is aborted
+        and the partial answer is kept; a cancelled frame is sent if the client is still there.
+        """
+        session = self.session
+        session.add_message("user", message)
+        streamer = TokenStreamer(self.send)
+        try:
+            retrieved = await run_in_threadpool(self.rag.retrieve, message)
+            budget = split_budget(self.llm_client.prompt_overhead(message, mode="chat"))
+            context = self.rag.aggregate_conversation_context(
+                [m.content for m in session.history], retrieved, max_tokens=budget.context,
+                summary=session.summary, history_tokens=budget.history
+            )
+            full_response = await streamer.stream(self.llm_client.chat_stream(message, context, max_tokens=budget.generation))
+        except (asyncio.CancelledError, ClientDisconnected, SlowClientError) as e:
+            if streamer.text:
+                session.add_message("assistant", streamer.text)
+            self.flush()
+            if isinstance(e, asyncio.CancelledError):
+                try:
+                    await self.send({"type": "cancelled", "conversation_id": session.session_id, "done": True})
+                except Exception:
+                    pass
+            raise
+        session.add_message("assistant", full_response)
+        self.flush()
+        citations = [c.to_dict() for c in extract_citations_from_chunks(retrieved, full_response)]
+        await self.send({
+            "citations": citations,
+            "conversation_id": session.session_id,
+            "done": True
+        })
+
+    def flush(self):
+        """Persists unsaved messages in the background."""
+        task = asyncio.create_task(self._save())
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _save(self):
+        async with self._save_lock:
+            try:
+                await self.session.asave(principal=self.principal)
+                # Only the recent tail feeds the prompt; stored messages beyond it need not stay in memory.
+                self.session.trim_history(CHAT_HISTORY_TAIL)
+                get_conversation_summarizer().schedule(self.session)
+            except Exception as e:
+                logger.error(f"Saving conversation {self.session.session_id} failed: {e}")
+
+    def start_turn(self, message: str):
+        self.generation = asyncio.create_task(self._run_turn(message))
+
+    async def _run_turn(self, message: str):
+        try:
+            await self.answer(message)
+        except asyncio.CancelledError:
+            raise
+        except (WebSocketDisconnect, ClientDisconnected):
+            logger.info(f"Client left conversation {self.session.session_id} mid-answer; LLM stream aborted")
+        except SlowClientError as e:
+            await self.drop_slow_client(e)
+        except Exception as e:
+            logger.error(f"WebSocket error: {e}")
+            try:
+                await self.send({"error": str(e)})
+            except Exception:
+                pass
+
+    async def drop_slow_client(self, error: Exception):
+        logger.warning(f"Closing chat socket for conversation {self.session.session_id}: {error}")
+        self.closed = True
+        try:
+            await self.websocket.close(code=SLOW_CLIENT_CLOSE_CODE)
+        except Exception:
+            pass
+
+    def cancel(self) -> bool:
+        if not self.busy:
+            return False
+        self.generation.cancel()
+        return True
+
+    async def close(self):
+        """Stops any generation and waits for pending saves."""
+        self.closed = True
+        if self.busy:
+            self.generation.cancel()
+            await asyncio.gather(self.generation, return_exceptions=True)
+        if self._flushes:
+            await asyncio.gather(*list(self._flushes), return_exceptions=True)
+
+
+async def _serve_chat_frames(websocket: WebSocket, connection: ChatConnection):
+    """
+    Persistent protocol: {"type": "message", "message": "..."} starts a turn (one at a time),
+    {"type": "ping"} is answered with a pong, {"type": "cancel"} stops the in-flight answer.
+    The socket closes after CHAT_WS_IDLE_TIMEOUT seconds without frames while no answer is running.
+    """
+    await connection.send({"type": "ready", "conversation_id": connection.session.session_id})
+    while True:
+        try:
+            frame = await asyncio.wait_for(websocket.receive_json(), CHAT_WS_IDLE_TIMEOUT)
+        except asyncio.TimeoutError:
+            if connection.busy:
+                continue
+            logger.info(f"Closing idle chat socket for conversation {connection.session.session_id}")
+            await websocket.close()
+            return
+        except json.JSONDecodeError:
+            await connection.send({"error": "Frames must be JSON."})
+            continue
+        frame_type = frame.get("type", "message") if isinstance(frame, dict) else None
+        if frame_type == "ping":
+            await connection.send({"type": "pong"})
+        elif frame_type == "cancel":
+            connection.cancel()
+        elif frame_type == "message":
+            message = frame.get("message")
+            if not isinstance(message, str) or not message.strip():
+                await connection.send({"error": "message must be a non-empty string."})
+            elif connection.busy:
+                await connection.send({"error": "A response is already in progress; send cancel first."})
+            else:
+                connection.start_turn(message)
+        else:
+            await connection.send({"error": f"Unknown frame type: {frame_type}"})
 
-def get_llm_client():
-    return LLMClient()
 
 @chat_ws_router.websocket("/chat/stream")
 async def chat_stream(
     websocket: WebSocket,
     conversation_id: str = Query(...),
-    message: str = Query(...),
     token: str = Query(...),
+    message: Optional[str] = Query(None, description="Single-shot mode: answer this message and close"),
 ):
+    """
+    Without `message` the socket stays open for many turns (see _serve_chat_frames), reusing the
+    authenticated principal, the loaded session and its RAGEngine. With `message` it answers once and closes.
+    """
     await websocket.accept()
     logger.debug(f"[MultiTurnWS] Token received: {token}")
-    user_id = verify_user_jwt(token)
-    if not user_id:
+    try:
+        principal = authenticate(token)
+    except AuthenticationError:
         await websocket.send_json({"error": "Invalid or missing token"})
         await websocket.close()
         return
+    connection = None
     try:
-        session = ConversationSession.load(conversation_id, user_token=token)
+        session = await ConversationSession.aload(conversation_id, principal=principal, tail=CHAT_HISTORY_TAIL)
         if not session:
             await websocket.send_json({"error": "Conversation not found"})
             await websocket.close()
             return
-        session.add_message("user", message)
-        vector_store = VectorStore()
-        rag = RAGEngine(vector_store, session.document_id)
-        retrieved = rag.retrieve(message)
-        context = rag.aggregate_conversation_context(
-            [m.content for m in session.history], retrieved
-        )
-        llm_client = LLMClient()
-        full_response = ""
-        if hasattr(llm_client, 'chat_stream'):
-            async for chunk in llm_client.chat_stream(message, context):
-                await websocket.send_json({"token": chunk})
-                full_response += chunk
+        connection = ChatConnection(websocket, session, principal)
+        if message is None:
+            await _serve_chat_frames(websocket, connection)
         else:
-            full_response = llm_client.chat(message, context)
-            await websocket.send_json({"token": full_response})
-        session.add_message("assistant", full_response)
-        session.save(user_token=token)
-        citations = [c.to_dict() for c in extract_citations_from_chunks(retrieved, full_response)]
-        await websocket.send_json({
-            "citations": citations,
-            "conversation_id": session.session_id,
-            "done": True
-        })
-        await websocket.close()
-    except WebSocketDisconnect:
+            await run_until_disconnect(websocket, connection.answer(message))
+            await connection.close()
+            await websocket.close()
+    except (WebSocketDisconnect, ClientDisconnected):
         logger.info("WebSocket disconnected")
+    except SlowClientError as e:
+        await connection.drop_slow_client(e)
     except Exception as e:
         logger.error(f"WebSocket error: {e}")
         await websocket.send_json({"error": str(e)})
         await websocket.close()
+    finally:
+        if connection is not None:
+            await connection.close()
 
 
 @chat_ws_router.websocket("/chat/deep_query/stream")
-async def deep_query_stream(websocket):
+async def deep_query_stream(websocket: WebSocket):
     await websocket.accept()
     try:
         data = await websocket.receive_json()
@@ -97,8 +238,8 @@ async def deep_query_stream(websocket):
             await websocket.close()
             return
         try:
-            user = verify_token(token)
-        except Exception as e:
+            authenticate(token)
+        except AuthenticationError as e:
             logger.warning(f"[DeepDiveWS] Invalid token: {e}")
             await websocket.send_json({"error": "Invalid or expired token."})
             await websocket.close()
@@ -107,24 +248,29 @@ async def deep_query_stream(websocket):
             await websocket.send_json({"error": "document_id and non-empty query are required."})
             await websocket.close()
             return
-        vector_store = get_vector_store()
-        llm_client = get_llm_client()
-        rag = RAGEngine(vector_store, document_id)
-        retrieved = rag.retrieve(query)
-        context = rag.aggregate_context(retrieved)
-        answer_gen = llm_client.deep_dive(query, context)
-        answer = ""
-        async for token in answer_gen:
-            logger.debug(f"[DeepDiveWS] Streaming token: {token}")
-            answer += token
-            await websocket.send_json({"token": token})
-        citations = [CitationModel(**c.to_dict()) for c in extract_citations_from_chunks(retrieved, answer)]
-        logger.debug(f"[DeepDiveWS] Final answer: {answer}")
-        logger.debug(f"[DeepDiveWS] Citations: {citations}")
-        await websocket.send_json({"citations": [c.model_dump() for c in citations], "done": True})
+        await run_until_disconnect(websocket, _deep_dive_answer(websocket, document_id, query))
         await websocket.close()
+    except (WebSocketDisconnect, ClientDisconnected):
+        logger.info("[DeepDiveWS] Client disconnected; LLM stream aborted")
+    except SlowClientError as e:
+        logger.warning(f"[DeepDiveWS] Closing slow client: {e}")
+        await websocket.close(code=SLOW_CLIENT_CLOSE_CODE)
     except Exception as e:
         logger.error(f"[DeepDiveWS] Error: {e}")
         await websocket.send_json({"error": str(e)})
         await websocket.close()
 
+
+async def _deep_dive_answer(websocket: WebSocket, document_id: str, query: str):
+    vector_store = get_vector_store()
+    llm_client = get_llm_client()
+    rag = RAGEngine(vector_store, document_id, reranker=get_reranker())
+    retrieved = await run_in_threadpool(rag.retrieve, query)
+    budget = split_budget(llm_client.prompt_overhead(query, mode="deep-dive"), history_share=0.0)
+    context = rag.aggregate_context(retrieved, max_tokens=budget.chunks)
+    streamer = TokenStreamer(websocket.send_json)
+    answer = await streamer.stream(llm_client.deep_dive(query, context, max_tokens=budget.generation))
+    citations = [CitationModel(**c.to_dict()) for c in extract_citations_from_chunks(retrieved, answer)]
+    logger.debug(f"[DeepDiveWS] Final answer: {answer}")
+    logger.debug(f"[DeepDiveWS] Citations: {citations}")
+    await websocket.send_json({"citations": [c.model_dump() for c in citations], "done": True})
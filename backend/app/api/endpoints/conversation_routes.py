@@ -1,42 +1,54 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query
+from typing import Optional
 import logging
 from app.models.conversation import ConversationSession
+from app.services.database import conversations_db
 from app.models import MessageModel, ConversationHistoryResponse, ConversationDeleteResponse
 from app.utils.deps import get_current_user
+from app.utils.auth import Principal
+from app.services.registry import get_vector_store
 
 logger = logging.getLogger("chat_with_pdf_api")
 conversation_router = APIRouter()
 
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
 @conversation_router.get("/conversations/{conversation_id}", summary="Get conversation history", response_model=ConversationHistoryResponse)
-def get_conversation(conversation_id: str, user: dict = Depends(get_current_user)):
-    user_token = user["token"]
+def get_conversation(
+    conversation_id: str,
+    before_id: Optional[int] = Query(None, description="Return messages older than this message id (next_before_id of the previous page)"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Page size; omit to return the whole history"),
+    principal: Principal = Depends(get_current_user)
+):
     try:
-        session = ConversationSession.load(conversation_id, user_token=user_token)
+        session = ConversationSession.load(conversation_id, principal=principal, tail=0)
         if not session:
             logger.warning(f"Get conversation: not found {conversation_id}")
             raise HTTPException(status_code=404, detail="Conversation not found")
-        history = [MessageModel(**m.to_dict()) for m in session.history]
+        # One extra row tells whether older messages remain.
+        messages = session.fetch_messages(before_id=before_id, limit=limit + 1 if limit else None)
+        next_before_id = None
+        if limit and len(messages) > limit:
+            messages = messages[-limit:]
+            next_before_id = messages[0].id
+        history = [MessageModel(**m.to_dict()) for m in messages]
         logger.info(f"Fetched conversation history for {conversation_id}")
-        return ConversationHistoryResponse(conversation_id=session.session_id, history=history)
+        return ConversationHistoryResponse(conversation_id=session.session_id, history=history, next_before_id=next_before_id)
     except Exception as e:
         logger.error(f"Error fetching conversation {conversation_id}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @conversation_router.delete("/conversations/{conversation_id}", summary="Reset conversation", response_model=ConversationDeleteResponse)
-def reset_conversation(conversation_id: str, user: dict = Depends(get_current_user)):
-    user_token = user["token"]
+def reset_conversation(conversation_id: str, principal: Principal = Depends(get_current_user)):
     try:
-        db_path = ConversationSession._get_db_path()
-        import sqlite3
-        session = ConversationSession.load(conversation_id, user_token=user_token)
+        session = ConversationSession.load(conversation_id, principal=principal, tail=0)
         if not session:
             logger.warning(f"Reset conversation: not found {conversation_id}")
             raise HTTPException(status_code=404, detail="Conversation not found")
-        with sqlite3.connect(db_path) as conn:
-            c = conn.cursor()
-            c.execute('DELETE FROM sessions WHERE session_id = ?', (conversation_id,))
-            c.execute('DELETE FROM messages WHERE session_id = ?', (conversation_id,))
-            conn.commit()
+        with conversations_db.transaction() as conn:
+            conn.execute('DELETE FROM sessions WHERE session_id = ?', (conversation_id,))
+            conn.execute('DELETE FROM messages WHERE session_id = ?', (conversation_id,))
         logger.info(f"Reset conversation {conversation_id}")
         return {"message": f"Conversation {conversation_id} reset."}
     except Exception as e:
@@ -44,11 +56,10 @@ def reset_conversation(conversation_id: str, user: dict = Depends(get_current_us
         raise HTTPException(status_code=500, detail=str(e))
 
 @conversation_router.get("/conversations/by-document/{document_id}", summary="Get conversation by document_id for current user")
-def get_conversation_by_document(document_id: str, user: dict = Depends(get_current_user)):
-    user_token = user["token"]
-    user_id = user["payload"].get("user_id")
+def get_conversation_by_document(document_id: str, principal: Principal = Depends(get_current_user)):
+    user_id = principal.user_id
     try:
-        session = ConversationSession.find_by_document_and_user(document_id, user_id, user_token=user_token)
+        session = ConversationSession.find_by_document_and_user(document_id, user_id, principal=principal, tail=0)
         if not session:
             logger.warning(f"No conversation found for document {document_id} and user {user_id}")
             raise HTTPException(status_code=404, detail="Conversation not found for this document and user")
@@ -57,31 +68,35 @@ def get_conversation_by_document(document_id: str, user: dict = Depends(get_curr
         logger.error(f"Error finding conversation for document {document_id}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@conversation_router.get("/conversations", summary="List all conversations for current user")
-def list_conversations(user: dict = Depends(get_current_user)):
-    user_token = user["token"]
-    user_id = user["payload"].get("user_id")
+@conversation_router.get("/conversations", summary="List conversations for current user, most recent first")
+def list_conversations(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    include_documents: bool = Query(False, description="Use document names from the vector store as titles"),
+    principal: Principal = Depends(get_current_user)
+):
+    user_id = principal.user_id
     try:
-        ConversationSession._init_db()
-        db_path = ConversationSession._get_db_path()
-        import sqlite3
-        with sqlite3.connect(db_path) as conn:
-            c = conn.cursor()
-            c.execute('''SELECT session_id, document_id, updated_at FROM sessions WHERE user_id = ? ORDER BY updated_at DESC''', (user_id,))
-            rows = c.fetchall()
-            conversations = []
-            for row in rows:
-                session_id, document_id, updated_at = row
-                c.execute('''SELECT content FROM messages WHERE session_id = ? ORDER BY id DESC LIMIT 1''', (session_id,))
-                last_msg_row = c.fetchone()
-                last_message = last_msg_row[0] if last_msg_row else ""
-                conversations.append({
-                    "id": session_id,
-                    "title": f"Document {document_id}",
-                    "lastMessage": last_message,
-                    "date": updated_at,
-                })
-        return {"conversations": conversations}
+        rows, next_cursor = ConversationSession.list_for_user(user_id, principal=principal, limit=limit, cursor=cursor)
+        document_names = {}
+        if include_documents:
+            vector_store = get_vector_store()
+            for document_id in {row["document_id"] for row in rows}:
+                document_names[document_id] = vector_store.load_metadata(document_id).get("name")
+        conversations = [
+            {
+                "id": row["session_id"],
+                "title": document_names.get(row["document_id"]) or f"Document {row['document_id']}",
+                "documentId": row["document_id"],
+                "lastMessage": row["last_message"],
+                "messageCount": row["message_count"],
+                "date": row["updated_at"],
+            }
+            for row in rows
+        ]
+        return {"conversations": conversations, "next_cursor": next_cursor}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error listing conversations for user {user_id}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
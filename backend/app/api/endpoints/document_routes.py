@@ -1,28 +1,37 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, WebSocket, WebSocketDisconnect, Query, status
+from starlette.concurrency import run_in_threadpool
+import os
 import uuid
+import hashlib
+import asyncio
 import logging
 import datetime
-from app.services.pdf_processor import PDFTextExtractor
+from app.services.ingestion import ingestion_queue, job_progress, find_reusable_document, UPLOAD_DIR, JOB_COMPLETED, JOB_FAILED
+from app.services.pdf_processor import EXTRACTION_PROFILES, DEFAULT_EXTRACTION_PROFILE
 from app.services.vector_store import VectorStore
-from app.models.document import DocumentUploadResponse, DocumentListResponse, DocumentDeleteResponse, ErrorResponse, DocumentInfo
-from app.utils.deps import get_current_user
+from app.services.registry import get_vector_store
+from app.models.document import DocumentUploadResponse, DocumentListResponse, DocumentDeleteResponse, ErrorResponse, DocumentInfo, IngestionJobResponse
+from app.utils.deps import get_current_user, verify_token
+from app.utils.auth import Principal
 from app.models.conversation import ConversationSession
 
 logger = logging.getLogger("chat_with_pdf_api")
 document_router = APIRouter()
 
-def get_vector_store():
-    return VectorStore()
+JOB_PROGRESS_POLL_SECONDS = 0.5
 
-@document_router.post("/documents/upload", summary="Upload and process a PDF document", response_model=DocumentUploadResponse, responses={400: {"model": ErrorResponse}, 500: {"model": ErrorResponse}})
+@document_router.post("/documents/upload", summary="Upload a PDF document and queue it for processing", status_code=status.HTTP_202_ACCEPTED, response_model=DocumentUploadResponse, responses={400: {"model": ErrorResponse}, 429: {"model": ErrorResponse}, 500: {"model": ErrorResponse}})
 def upload_document(
     file: UploadFile = File(...),
+    profile: str = Query(DEFAULT_EXTRACTION_PROFILE, description="Extraction profile: text-only, text+tables or full"),
     vector_store: VectorStore = Depends(get_vector_store),
-    user: dict = Depends(get_current_user)
+    principal: Principal = Depends(get_current_user)
 ):
     if not file.filename.lower().endswith(('.pdf',)):
         logger.warning(f"Upload rejected: invalid file type {file.filename}")
         raise HTTPException(status_code=400, detail="Only PDF files are supported.")
+    if profile not in EXTRACTION_PROFILES:
+        raise HTTPException(status_code=400, detail=f"Unknown extraction profile. Expected one of: {', '.join(EXTRACTION_PROFILES)}.")
     # Check file size (max 50MB)
     file.file.seek(0, 2)
     file_size = file.file.tell()
@@ -30,33 +39,105 @@ def upload_document(
     if file_size > 50 * 1024 * 1024:
         logger.warning(f"Upload rejected: file too large {file.filename}")
         raise HTTPException(status_code=400, detail="File too large (max 50MB).")
+    user_id = principal.user_id
+    if ingestion_queue.is_full():
+        logger.warning(f"Upload rejected: ingestion queue full ({file.filename})")
+        raise HTTPException(status_code=429, detail="Too many documents are being processed. Please try again later.")
     try:
         file_id = str(uuid.uuid4())
-        file_path = f"/tmp/{file_id}_{file.filename}"
-        with open(file_path, "wb") as f_out:
-            f_out.write(file.file.read())
+        os.makedirs(UPLOAD_DIR, exist_ok=True)
+        file_path = os.path.join(UPLOAD_DIR, f"{file_id}_{os.path.basename(file.filename)}")
+        file_hash = _save_upload(file, file_path)
         logger.info(f"File saved: {file_path}")
-        pdf_processor = PDFTextExtractor(file_path)
-        doc_data = pdf_processor.preprocess_document()
-        metadata = doc_data["metadata"]
-        doc_chunks = doc_data["pages"]
-        collection_name = metadata.get("document_id", file_id)
-        upload_time = datetime.datetime.now(datetime.timezone.utc).isoformat()
-        vector_store.save_metadata(collection_name, name=file.filename, upload_time=upload_time)
-        vector_store.add_chunks(collection_name, doc_chunks)
-        user_id = user["payload"].get("user_id")
-        session = ConversationSession(user_id=user_id, document_id=collection_name, user_token=user["token"])
-        session.save(user_token=user["token"])
-        logger.info(f"Document processed and ingested: {collection_name}, conversation {session.session_id}")
-        return {"document_id": collection_name, "conversation_id": session.session_id, "message": "Document uploaded and processed."}
+        existing_job = find_reusable_document(file_hash, profile, vector_store)
+        if existing_job:
+            os.remove(file_path)
+            collection_name = existing_job["document_id"]
+        else:
+            collection_name = file_id
+            upload_time = datetime.datetime.now(datetime.timezone.utc).isoformat()
+            vector_store.save_metadata(collection_name, name=file.filename, upload_time=upload_time)
+        session = ConversationSession(user_id=user_id, document_id=collection_name, principal=principal)
+        session.save(principal=principal)
+        if existing_job:
+            # The original job may belong to another user; the caller gets its own job that tracks it.
+            job = ingestion_queue.store.create_follower(user_id, session.session_id, file.filename, existing_job)
+            logger.info(f"Duplicate upload of {collection_name} reused, job {job['job_id']} follows {existing_job['job_id']}, conversation {session.session_id}")
+            return {
+                "document_id": collection_name,
+                "conversation_id": session.session_id,
+                "message": "Document already uploaded; reusing the existing index.",
+                "job_id": job["job_id"],
+                "status": job["status"]
+            }
+        job = ingestion_queue.submit(user_id, collection_name, session.session_id, file.filename, file_path, profile, file_hash, vector_store.embedding_namespace)
+        logger.info(f"Document queued for ingestion: {collection_name}, job {job['job_id']}, conversation {session.session_id}")
+        return {
+            "document_id": collection_name,
+            "conversation_id": session.session_id,
+            "message": "Document uploaded and queued for processing.",
+            "job_id": job["job_id"],
+            "status": job["status"]
+        }
     except Exception as e:
         logger.error(f"Error uploading document: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def _save_upload(file: UploadFile, file_path: str) -> str:
+    """Writes the upload to file_path and returns the sha256 of its content."""
+    digest = hashlib.sha256()
+    with open(file_path, "wb") as f_out:
+        while True:
+            block = file.file.read(1024 * 1024)
+            if not block:
+                break
+            digest.update(block)
+            f_out.write(block)
+    return digest.hexdigest()
+
+def _get_job_for_user(job_id: str, user_id: str) -> dict:
+    job = ingestion_queue.store.get(job_id)
+    if not job or str(job["user_id"]) != str(user_id):
+        raise HTTPException(status_code=404, detail="Ingestion job not found")
+    return job
+
+@document_router.get("/documents/jobs/{job_id}", summary="Get ingestion job status and progress", response_model=IngestionJobResponse)
+def get_ingestion_job(job_id: str, principal: Principal = Depends(get_current_user)):
+    job = _get_job_for_user(job_id, principal.user_id)
+    return job_progress(job)
+
+@document_router.websocket("/documents/jobs/{job_id}/progress")
+async def ingestion_job_progress(websocket: WebSocket, job_id: str, token: str = Query(...)):
+    """
+    Pushes job progress whenever it changes, until the job completes or fails.
+    """
+    await websocket.accept()
+    try:
+        user_id = verify_token(token).user_id
+        job = await run_in_threadpool(_get_job_for_user, job_id, user_id)
+    except HTTPException as e:
+        await websocket.send_json({"error": e.detail})
+        await websocket.close()
+        return
+    last_sent = None
+    try:
+        while True:
+            view = job_progress(job)
+            if view != last_sent:
+                await websocket.send_json(view)
+                last_sent = view
+            if job["status"] in (JOB_COMPLETED, JOB_FAILED):
+                break
+            await asyncio.sleep(JOB_PROGRESS_POLL_SECONDS)
+            job = await run_in_threadpool(ingestion_queue.store.get, job_id)
+        await websocket.close()
+    except WebSocketDisconnect:
+        logger.info(f"Job progress websocket disconnected: {job_id}")
+
 @document_router.get("/documents", summary="List uploaded documents", response_model=DocumentListResponse)
 def list_documents(
     vector_store: VectorStore = Depends(get_vector_store),
-    user: dict = Depends(get_current_user)
+    principal: Principal = Depends(get_current_user)
 ):
     try:
         docs = vector_store.list_collections()
@@ -76,6 +157,7 @@ def list_documents(
 def delete_document(document_id: str, vector_store: VectorStore = Depends(get_vector_store)):
     try:
         vector_store.delete_collection(document_id)
+        ingestion_queue.store.forget_document(document_id)
         logger.info(f"Deleted document: {document_id}")
         return {"message": f"Document {document_id} deleted."}
     except Exception as e:
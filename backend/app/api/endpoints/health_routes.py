@@ -1,6 +1,7 @@
 from fastapi import APIRouter
 import logging
 from app.models import HealthCheckResponse
+from app.services.registry import registry
 
 logger = logging.getLogger("chat_with_pdf_api")
 health_router = APIRouter()
@@ -8,4 +9,4 @@ health_router = APIRouter()
 @health_router.get("/health", summary="Health check", response_model=HealthCheckResponse)
 def health_check():
     logger.info("Health check endpoint called")
-    return {"status": "ok"}
+    return {"status": "ok", "services": registry.stats()}
@@ -4,6 +4,7 @@ import logging
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.requests import Request
 import time
+from contextlib import asynccontextmanager
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
@@ -11,8 +12,28 @@ from slowapi.errors import RateLimitExceeded
 from app.api.endpoints import api_router
 from app.api.endpoints.exception_handlers import add_exception_handlers
 from app.api.endpoints import auth_routes
+from app.services.registry import registry
+from app.services.ingestion import ingestion_queue
+from app.models.conversation import init_conversation_db
+from app.services.database import close_all as close_databases
 
-app = FastAPI(title="Chat-with-PDF API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    logger = logging.getLogger("chat_with_pdf_api")
+    init_conversation_db()
+    try:
+        registry.warm_up()
+        logger.info(f"Services warmed up: {registry.stats()}")
+    except Exception as e:
+        # Not fatal: services are loaded lazily on first use instead.
+        logger.error(f"Service warm-up failed: {e}")
+    ingestion_queue.resume_pending()
+    yield
+    ingestion_queue.shutdown()
+    await registry.shutdown()
+    close_databases()
+
+app = FastAPI(title="Chat-with-PDF API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -1,31 +1,66 @@
 import uuid
-from typing import List, Optional, Dict, Any
+import json
+import base64
+from typing import List, Optional, Dict, Any, Tuple
 from datetime import datetime, timezone
-import os
-import sqlite3
-import jwt
+from app.services.database import conversations_db
+from app.utils.auth import Principal
 
-JWT_SECRET = os.environ.get("JWT_SECRET")
-JWT_ALGORITHM = os.environ.get("JWT_ALGORITHM")
-
-def verify_user_jwt(token: str) -> Optional[str]:
+def authorize(principal: Optional[Principal], user_id: Optional[str] = None) -> Principal:
     """
-    Verifies the JWT and returns the user_id if valid, else None.
+    Checks that the caller (already authenticated, see app.utils.auth) acts for user_id.
+    Raises PermissionError; no token is decoded here.
     """
+    if principal is None:
+        raise PermissionError("Missing authentication token.")
+    if user_id is not None and principal.user_id != str(user_id):
+        raise PermissionError("Authentication failed for user_id: {}".format(user_id))
+    return principal
+
+# message_count/last_message are bumped by the rows appended in the same transaction.
+# summary is only written on insert; afterwards it belongs to save_summary() so a stale session cannot overwrite it.
+UPSERT_SESSION_SQL = '''INSERT INTO sessions (session_id, user_id, document_id, parent_session_id, created_at, updated_at, summary, last_message, message_count)
+                         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                         ON CONFLICT(session_id) DO UPDATE SET
+                             updated_at = excluded.updated_at,
+                             last_message = COALESCE(excluded.last_message, sessions.last_message),
+                             message_count = sessions.message_count + excluded.message_count'''
+INSERT_MESSAGE_SQL = '''INSERT INTO messages (session_id, role, content, timestamp) VALUES (?, ?, ?, ?)'''
+SELECT_SESSION_SQL = 'SELECT session_id, user_id, document_id, parent_session_id, created_at, updated_at, summary, message_count, summary_upto_id FROM sessions WHERE session_id = ?'
+# Compare-and-set on summary_upto_id so two concurrent folds cannot both apply.
+UPDATE_SUMMARY_SQL = 'UPDATE sessions SET summary = ?, summary_upto_id = ? WHERE session_id = ? AND summary_upto_id = ?'
+# Newest first so LIMIT reads only the requested tail through idx_messages_session_id; callers reverse the rows.
+SELECT_MESSAGES_SQL = 'SELECT id, role, content, timestamp FROM messages WHERE session_id = ? {before_clause} ORDER BY id DESC {limit_clause}'
+# Keyset pagination: (updated_at, session_id) < cursor uses idx_sessions_user_updated_id without an OFFSET scan.
+LIST_SESSIONS_SQL = '''SELECT session_id, document_id, updated_at, last_message, message_count FROM sessions
+                        WHERE user_id = ? {cursor_clause}
+                        ORDER BY updated_at DESC, session_id DESC LIMIT ?'''
+
+def encode_cursor(updated_at: str, session_id: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([updated_at, session_id]).encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """Raises ValueError for a cursor that was not produced by encode_cursor."""
     try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        return payload.get("user_id")
-    except Exception:
-        return None
+        updated_at, session_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return str(updated_at), str(session_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+def init_conversation_db():
+    """Runs the conversation schema migration; called once at application startup."""
+    ConversationSession._init_db()
 
 class Message:
-    def __init__(self, role: str, content: str, timestamp: Optional[datetime] = None):
+    def __init__(self, role: str, content: str, timestamp: Optional[datetime] = None, id: Optional[int] = None):
+        self.id = id  # row id in messages, None until loaded from the database
         self.role = role  # 'user' or 'assistant'
         self.content = content
         self.timestamp = timestamp or datetime.now(timezone.utc)
 
     def to_dict(self) -> Dict[str, Any]:
         return {
+            "id": self.id,
             "role": self.role,
             "content": self.content,
             "timestamp": self.timestamp.isoformat()
@@ -38,13 +73,9 @@ class ConversationSession:
         document_id: str,
         session_id: Optional[str] = None,
         parent_session_id: Optional[str] = None,
-        user_token: Optional[str] = None
+        principal: Optional[Principal] = None
     ):
-        if not user_token:
-            raise PermissionError("Missing authentication token.")
-        token_user_id = verify_user_jwt(user_token)
-        if not token_user_id or str(token_user_id) != str(user_id):
-            raise PermissionError("Authentication failed for user_id: {}".format(user_id))
+        authorize(principal, user_id)
         self.session_id = session_id or str(uuid.uuid4())
         self.user_id = user_id
         self.document_id = document_id
@@ -53,6 +84,12 @@ class ConversationSession:
         self.created_at = datetime.now(timezone.utc)
         self.updated_at = self.created_at
         self.summary: Optional[str] = None
+        # Messages with id <= summary_upto_id are covered by summary.
+        self.summary_upto_id = 0
+        # Total stored messages; history may hold only the most recent of them (see load(tail=...)).
+        self.message_count = 0
+        # Number of leading messages in history that are already stored; save() only appends the rest.
+        self._persisted_count = 0
 
     def add_message(self, role: str, content: str):
         msg = Message(role, content)
@@ -73,12 +110,13 @@ class ConversationSession:
             self.summary = "\n".join(m.content for m in self.history[-max_tokens:])
         return self.summary
 
-    def branch(self) -> 'ConversationSession':
+    def branch(self, principal: Principal) -> 'ConversationSession':
         """Create a new session branched from this one."""
         return ConversationSession(
             user_id=self.user_id,
             document_id=self.document_id,
-            parent_session_id=self.session_id
+            parent_session_id=self.session_id,
+            principal=principal
         )
 
     def to_dict(self) -> Dict[str, Any]:
@@ -95,105 +133,143 @@ class ConversationSession:
 
     @staticmethod
     def _get_db_path():
-        backend_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../..'))
-        db_dir = os.path.join(backend_dir, 'db')
-        os.makedirs(db_dir, exist_ok=True)
-        return os.path.join(db_dir, 'conversations.db')
+        return conversations_db.path
 
     @staticmethod
     def _init_db():
-        db_path = ConversationSession._get_db_path()
-        with sqlite3.connect(db_path) as conn:
-            c = conn.cursor()
-            c.execute('''CREATE TABLE IF NOT EXISTS sessions (
-                session_id TEXT PRIMARY KEY,
-                user_id TEXT,
-                document_id TEXT,
-                parent_session_id TEXT,
-                created_at TEXT,
-                updated_at TEXT,
-                summary TEXT
-            )''')
-            c.execute('''CREATE TABLE IF NOT EXISTS messages (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                session_id TEXT,
-                role TEXT,
-                content TEXT,
-                timestamp TEXT,
-                FOREIGN KEY(session_id) REFERENCES sessions(session_id)
-            )''')
-            conn.commit()
-
-    def save(self, user_token: Optional[str] = None):
-        if not user_token:
-            raise PermissionError("Missing authentication token.")
-        token_user_id = verify_user_jwt(user_token)
-        if not token_user_id or str(token_user_id) != str(self.user_id):
-            raise PermissionError("Authentication failed for user_id: {}".format(self.user_id))
-        self._init_db()
-        db_path = self._get_db_path()
-        with sqlite3.connect(db_path) as conn:
-            c = conn.cursor()
-            c.execute('''INSERT OR REPLACE INTO sessions (session_id, user_id, document_id, parent_session_id, created_at, updated_at, summary)
-                         VALUES (?, ?, ?, ?, ?, ?, ?)''',
-                      (self.session_id, self.user_id, self.document_id, self.parent_session_id, self.created_at.isoformat(), self.updated_at.isoformat(), self.summary))
-            c.execute('DELETE FROM messages WHERE session_id = ?', (self.session_id,))
-            for m in self.history:
-                c.execute('''INSERT INTO messages (session_id, role, content, timestamp)
-                             VALUES (?, ?, ?, ?)''',
-                          (self.session_id, m.role, m.content, m.timestamp.isoformat()))
-            conn.commit()
+        """
+        Creates the schema and indexes. Runs once per process (at startup via init_conversation_db); later calls are no-ops.
+        """
+        conversations_db.migrate()
+
+    def save(self, principal: Optional[Principal] = None):
+        authorize(principal, self.user_id)
+        # Messages added while this runs (asave from a live chat socket) are left for the next save.
+        end = len(self.history)
+        new_messages = self.history[self._persisted_count:end]
+        last_message = new_messages[-1].content if new_messages else None
+        with conversations_db.transaction() as conn:
+            conn.execute(UPSERT_SESSION_SQL,
+                         (self.session_id, self.user_id, self.document_id, self.parent_session_id, self.created_at.isoformat(), self.updated_at.isoformat(), self.summary,
+                          last_message, len(new_messages)))
+            conn.executemany(INSERT_MESSAGE_SQL,
+                             [(self.session_id, m.role, m.content, m.timestamp.isoformat()) for m in new_messages])
+        self.message_count += len(new_messages)
+        self._persisted_count = end
+
+    def trim_history(self, keep: int):
+        """Drops stored messages from the in-memory history beyond the `keep` most recent; unsaved ones always stay."""
+        drop = min(self._persisted_count, max(len(self.history) - keep, 0))
+        if drop:
+            del self.history[:drop]
+            self._persisted_count -= drop
+
+    async def asave(self, principal: Optional[Principal] = None):
+        """save() on the database thread pool, for use from async handlers."""
+        await conversations_db.run(self.save, principal=principal)
+
+    def fetch_messages(self, before_id: Optional[int] = None, limit: Optional[int] = None) -> List[Message]:
+        """
+        Reads stored messages oldest first: the latest `limit` of them (all if None) with id < before_id.
+        """
+        params: List[Any] = [self.session_id]
+        before_clause = limit_clause = ""
+        if before_id is not None:
+            before_clause = "AND id < ?"
+            params.append(before_id)
+        if limit is not None:
+            limit_clause = "LIMIT ?"
+            params.append(limit)
+        rows = conversations_db.fetchall(SELECT_MESSAGES_SQL.format(before_clause=before_clause, limit_clause=limit_clause), params)
+        return [Message(role, content, datetime.fromisoformat(ts), id=id_) for id_, role, content, ts in reversed(rows)]
+
+    def unsummarized_messages(self, keep_recent: int = 0) -> List[Message]:
+        """Stored messages not yet folded into the summary, excluding the keep_recent most recent ones."""
+        rows = conversations_db.fetchall(
+            'SELECT id, role, content, timestamp FROM messages WHERE session_id = ? AND id > ? ORDER BY id ASC',
+            (self.session_id, self.summary_upto_id)
+        )
+        if keep_recent > 0:
+            rows = rows[:-keep_recent]
+        return [Message(role, content, datetime.fromisoformat(ts), id=id_) for id_, role, content, ts in rows]
+
+    def save_summary(self, summary: str, upto_id: int) -> bool:
+        """
+        Stores a summary covering every message up to upto_id. Returns False if another
+        writer advanced the summary since this session was loaded.
+        """
+        with conversations_db.transaction() as conn:
+            updated = conn.execute(UPDATE_SUMMARY_SQL, (summary, upto_id, self.session_id, self.summary_upto_id)).rowcount
+        if updated:
+            self.summary = summary
+            self.summary_upto_id = upto_id
+        return bool(updated)
 
     @staticmethod
-    def load(session_id: str, user_token: Optional[str] = None) -> Optional['ConversationSession']:
-        if not user_token:
-            raise PermissionError("Missing authentication token.")
-        token_user_id = verify_user_jwt(user_token)
-        if not token_user_id:
-            raise PermissionError("Invalid authentication token.")
-        ConversationSession._init_db()
-        db_path = ConversationSession._get_db_path()
-        with sqlite3.connect(db_path) as conn:
-            c = conn.cursor()
-            c.execute('SELECT session_id, user_id, document_id, parent_session_id, created_at, updated_at, summary FROM sessions WHERE session_id = ?', (session_id,))
-            row = c.fetchone()
-            db_user_id = row[1] if row else None
-            if not row:
-                return None
-            if str(db_user_id) != str(token_user_id):
-                raise PermissionError(f"User {token_user_id} not authorized for session {session_id}")
-            session = ConversationSession(
-                user_id=row[1],
-                document_id=row[2],
-                session_id=row[0],
-                parent_session_id=row[3],
-                user_token=user_token
-            )
-            session.created_at = datetime.fromisoformat(row[4])
-            session.updated_at = datetime.fromisoformat(row[5])
-            session.summary = row[6]
-            c.execute('SELECT role, content, timestamp FROM messages WHERE session_id = ? ORDER BY id ASC', (session_id,))
-            session.history = [Message(role, content, datetime.fromisoformat(ts)) for role, content, ts in c.fetchall()]
-            return session
+    def load(session_id: str, principal: Optional[Principal] = None, tail: Optional[int] = None) -> Optional['ConversationSession']:
+        """
+        Loads a session and its history. tail=N loads only the N most recent messages (0 loads none),
+        which is all the chat path needs; save() still appends correctly since it only writes new messages.
+        """
+        authorize(principal)
+        row = conversations_db.fetchone(SELECT_SESSION_SQL, (session_id,))
+        db_user_id = row[1] if row else None
+        if not row:
+            return None
+        if str(db_user_id) != principal.user_id:
+            raise PermissionError(f"User {principal.user_id} not authorized for session {session_id}")
+        session = ConversationSession(
+            user_id=row[1],
+            document_id=row[2],
+            session_id=row[0],
+            parent_session_id=row[3],
+            principal=principal
+        )
+        session.created_at = datetime.fromisoformat(row[4])
+        session.updated_at = datetime.fromisoformat(row[5])
+        session.summary = row[6]
+        session.message_count = row[7] or 0
+        session.summary_upto_id = row[8] or 0
+        session.history = session.fetch_messages(limit=tail) if tail != 0 else []
+        session._persisted_count = len(session.history)
+        return session
 
     @staticmethod
-    def find_by_document_and_user(document_id: str, user_id: str, user_token: str) -> Optional['ConversationSession']:
+    async def aload(session_id: str, principal: Optional[Principal] = None, tail: Optional[int] = None) -> Optional['ConversationSession']:
+        """load() on the database thread pool, for use from async handlers."""
+        return await conversations_db.run(ConversationSession.load, session_id, principal=principal, tail=tail)
+
+    @staticmethod
+    def find_by_document_and_user(document_id: str, user_id: str, principal: Principal, tail: Optional[int] = None) -> Optional['ConversationSession']:
         """
         Find a conversation session for a given document and user.
         Returns the ConversationSession if found, else None.
         """
-        if not user_token:
-            raise PermissionError("Missing authentication token.")
-        token_user_id = verify_user_jwt(user_token)
-        if not token_user_id or str(token_user_id) != str(user_id):
-            raise PermissionError(f"Authentication failed for user_id: {user_id}")
-        ConversationSession._init_db()
-        db_path = ConversationSession._get_db_path()
-        with sqlite3.connect(db_path) as conn:
-            c = conn.cursor()
-            c.execute('''SELECT session_id FROM sessions WHERE document_id = ? AND user_id = ? ORDER BY updated_at DESC LIMIT 1''', (document_id, user_id))
-            row = c.fetchone()
-            if not row:
-                return None
-            session_id = row[0]
-            return ConversationSession.load(session_id, user_token=user_token)
+        authorize(principal, user_id)
+        row = conversations_db.fetchone('''SELECT session_id FROM sessions WHERE document_id = ? AND user_id = ? ORDER BY updated_at DESC LIMIT 1''', (document_id, user_id))
+        if not row:
+            return None
+        session_id = row[0]
+        return ConversationSession.load(session_id, principal=principal, tail=tail)
+
+    @staticmethod
+    def list_for_user(user_id: str, principal: Principal, limit: int = 50, cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        One page of the user's sessions, most recently updated first, from a single indexed query.
+        Returns (rows, next_cursor); next_cursor is None on the last page.
+        """
+        authorize(principal, user_id)
+        params: List[Any] = [user_id]
+        cursor_clause = ""
+        if cursor:
+            cursor_clause = "AND (updated_at, session_id) < (?, ?)"
+            params.extend(decode_cursor(cursor))
+        # Fetch one extra row to know whether another page exists.
+        params.append(limit + 1)
+        rows = conversations_db.fetchall(LIST_SESSIONS_SQL.format(cursor_clause=cursor_clause), params)
+        page = [
+            {"session_id": r[0], "document_id": r[1], "updated_at": r[2], "last_message": r[3] or "", "message_count": r[4] or 0}
+            for r in rows[:limit]
+        ]
+        next_cursor = encode_cursor(page[-1]["updated_at"], page[-1]["session_id"]) if len(rows) > limit else None
+        return page, next_cursor
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 
 class DocumentInfo(BaseModel):
     document_id: str
@@ -10,6 +10,26 @@ class DocumentUploadResponse(BaseModel):
     document_id: str
     conversation_id: str
     message: str
+    job_id: Optional[str] = None
+    status: Optional[str] = None
+
+class IngestionJobResponse(BaseModel):
+    job_id: str
+    document_id: str
+    conversation_id: Optional[str]
+    filename: Optional[str]
+    profile: Optional[str] = None
+    status: str
+    pages_total: int = 0
+    pages_extracted: int = 0
+    chunks_total: int = 0
+    chunks_embedded: int = 0
+    progress: float = 0.0
+    eta_seconds: Optional[float] = None
+    error: Optional[str] = None
+    created_at: Optional[str] = None
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
 
 class DocumentListResponse(BaseModel):
     documents: List[DocumentInfo]
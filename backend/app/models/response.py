@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Optional, Dict, Any
 
 class CitationModel(BaseModel):
     document_id: str
@@ -11,6 +11,7 @@ class CitationModel(BaseModel):
     formatted: str
 
 class MessageModel(BaseModel):
+    id: Optional[int] = None
     role: str
     content: str
     timestamp: str
@@ -18,9 +19,11 @@ class MessageModel(BaseModel):
 class ConversationHistoryResponse(BaseModel):
     conversation_id: str
     history: List[MessageModel]
+    next_before_id: Optional[int] = None
 
 class ConversationDeleteResponse(BaseModel):
     message: str
 
 class HealthCheckResponse(BaseModel):
     status: str
+    services: Optional[Dict[str, Any]] = None
@@ -0,0 +1,249 @@
+import os
+import sqlite3
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger("chat_with_pdf_api")
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..'))
+# Threads (and therefore connections) used by the async façade of each database.
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "4"))
+
+# WAL lets readers proceed while a writer commits; NORMAL sync is durable across app crashes in WAL mode.
+DEFAULT_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA mmap_size=134217728",
+)
+
+
+class SQLiteDatabase:
+    """
+    Shared SQLite access: one connection per thread (reused across calls, with sqlite3's prepared
+    statement cache), WAL journal mode, a schema migration that runs once, and an async façade that
+    runs queries on a small dedicated thread pool.
+    """
+    def __init__(self, path: str, schema: Sequence[str] = (), added_columns: Sequence[Tuple[str, ...]] = (), indexes: Sequence[str] = (), pool_size: int = DB_POOL_SIZE):
+        """
+        added_columns: (table, column, declaration[, backfill_sql]) for columns introduced after the
+        table was first created; backfill_sql runs once, right after the column is added.
+        indexes: statements run after added_columns, so they can cover added columns.
+        """
+        self.path = path
+        self.schema = schema
+        self.added_columns = added_columns
+        self.indexes = indexes
+        self.pool_size = pool_size
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._migrate_lock = threading.RLock()
+        self._migrated = False
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def connection(self) -> sqlite3.Connection:
+        """Returns this thread's connection, opening it (and migrating the schema) on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            # Autocommit mode; writes are grouped explicitly with transaction().
+            conn = sqlite3.connect(self.path, isolation_level=None, cached_statements=256, check_same_thread=False)
+            for pragma in DEFAULT_PRAGMAS:
+                conn.execute(pragma)
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+            self.migrate()
+        return conn
+
+    def migrate(self):
+        """Creates tables/indexes and adds missing columns. Runs once per process."""
+        if self._migrated:
+            return
+        with self._migrate_lock:
+            if self._migrated:
+                return
+            with self.transaction() as conn:
+                for statement in self.schema:
+                    conn.execute(statement)
+                for table, column, declaration, *backfill in self.added_columns:
+                    columns = {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+                    if column not in columns:
+                        conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {declaration}')
+                        for statement in backfill:
+                            conn.execute(statement)
+                for statement in self.indexes:
+                    conn.execute(statement)
+            self._migrated = True
+        logger.info(f"Database ready: {self.path}")
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """
+        Write transaction. BEGIN IMMEDIATE takes the write lock up front, so concurrent writers
+        wait on busy_timeout instead of failing on a read-to-write lock upgrade.
+        """
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def execute(self, sql: str, params: Sequence[Any] = ()) -> sqlite3.Cursor:
+        return self.connection().execute(sql, params)
+
+    def fetchone(self, sql: str, params: Sequence[Any] = ()) -> Optional[tuple]:
+        return self.connection().execute(sql, params).fetchone()
+
+    def fetchall(self, sql: str, params: Sequence[Any] = ()) -> List[tuple]:
+        return self.connection().execute(sql, params).fetchall()
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Runs fn(*args, **kwargs) on the database thread pool without blocking the event loop."""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix=f"sqlite-{os.path.basename(self.path)}")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, lambda: fn(*args, **kwargs))
+
+    def close(self):
+        with self._lock:
+            for conn in self._connections:
+                try:
+                    conn.close()
+                except sqlite3.ProgrammingError:
+                    pass
+            self._connections.clear()
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+        self._local = threading.local()
+
+
+CONVERSATION_SCHEMA = (
+    '''CREATE TABLE IF NOT EXISTS sessions (
+        session_id TEXT PRIMARY KEY,
+        user_id TEXT,
+        document_id TEXT,
+        parent_session_id TEXT,
+        created_at TEXT,
+        updated_at TEXT,
+        summary TEXT,
+        last_message TEXT,
+        message_count INTEGER NOT NULL DEFAULT 0,
+        summary_upto_id INTEGER NOT NULL DEFAULT 0
+    )''',
+    '''CREATE TABLE IF NOT EXISTS messages (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        session_id TEXT,
+        role TEXT,
+        content TEXT,
+        timestamp TEXT,
+        FOREIGN KEY(session_id) REFERENCES sessions(session_id)
+    )''',
+    'CREATE INDEX IF NOT EXISTS idx_messages_session_id ON messages(session_id, id)',
+    'CREATE INDEX IF NOT EXISTS idx_sessions_user_updated_id ON sessions(user_id, updated_at, session_id)',
+    'CREATE INDEX IF NOT EXISTS idx_sessions_document_user ON sessions(document_id, user_id, updated_at)',
+)
+
+# Denormalized listing columns, kept current by ConversationSession.save so the sidebar needs no join.
+CONVERSATION_ADDED_COLUMNS = (
+    ('sessions', 'last_message', 'TEXT',
+     '''UPDATE sessions SET last_message = (
+            SELECT content FROM messages WHERE messages.session_id = sessions.session_id ORDER BY id DESC LIMIT 1
+        )'''),
+    ('sessions', 'message_count', 'INTEGER NOT NULL DEFAULT 0',
+     '''UPDATE sessions SET message_count = (
+            SELECT COUNT(*) FROM messages WHERE messages.session_id = sessions.session_id
+        )'''),
+    # Id of the newest message folded into sessions.summary; later messages are not summarized yet.
+    ('sessions', 'summary_upto_id', 'INTEGER NOT NULL DEFAULT 0'),
+)
+
+USER_SCHEMA = (
+    '''CREATE TABLE IF NOT EXISTS users (
+        id TEXT PRIMARY KEY,
+        username TEXT UNIQUE NOT NULL,
+        email TEXT UNIQUE NOT NULL,
+        password_hash TEXT NOT NULL
+    )''',
+)
+
+JOB_SCHEMA = (
+    '''CREATE TABLE IF NOT EXISTS jobs (
+        job_id TEXT PRIMARY KEY,
+        user_id TEXT,
+        document_id TEXT,
+        conversation_id TEXT,
+        filename TEXT,
+        file_path TEXT,
+        file_hash TEXT,
+        profile TEXT,
+        embedder TEXT,
+        status TEXT,
+        pages_total INTEGER DEFAULT 0,
+        pages_extracted INTEGER DEFAULT 0,
+        chunks_total INTEGER DEFAULT 0,
+        chunks_embedded INTEGER DEFAULT 0,
+        error TEXT,
+        created_at TEXT,
+        started_at TEXT,
+        finished_at TEXT,
+        source_job_id TEXT
+    )''',
+)
+
+JOB_ADDED_COLUMNS = (
+    ('jobs', 'profile', 'TEXT'),
+    ('jobs', 'file_hash', 'TEXT'),
+    ('jobs', 'source_job_id', 'TEXT'),
+    ('jobs', 'embedder', 'TEXT'),
+)
+
+JOB_INDEXES = (
+    'CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status)',
+    'DROP INDEX IF EXISTS idx_jobs_file_hash',
+    'CREATE INDEX IF NOT EXISTS idx_jobs_file_hash_embedder ON jobs(file_hash, profile, embedder)',
+)
+
+EMBEDDING_CACHE_SCHEMA = (
+    '''CREATE TABLE IF NOT EXISTS embeddings (
+        key TEXT PRIMARY KEY,
+        vector BLOB NOT NULL,
+        size INTEGER NOT NULL,
+        last_access REAL NOT NULL
+    )''',
+    # Covers both the LRU scan and SUM(size), so neither reads the vector blobs.
+    'DROP INDEX IF EXISTS idx_embeddings_last_access',
+    'CREATE INDEX IF NOT EXISTS idx_embeddings_last_access_size ON embeddings(last_access, size)',
+)
+
+# conversations.db has always lived in <repo>/db (three levels above app/models); keep it there so existing data is found.
+conversations_db = SQLiteDatabase(
+    os.path.join(os.path.abspath(os.path.join(BACKEND_DIR, '..')), 'db', 'conversations.db'),
+    schema=CONVERSATION_SCHEMA,
+    added_columns=CONVERSATION_ADDED_COLUMNS
+)
+users_db = SQLiteDatabase(os.path.join(BACKEND_DIR, 'db', 'users.db'), schema=USER_SCHEMA)
+jobs_db = SQLiteDatabase(
+    os.path.join(BACKEND_DIR, 'db', 'ingestion_jobs.db'),
+    schema=JOB_SCHEMA,
+    added_columns=JOB_ADDED_COLUMNS,
+    indexes=JOB_INDEXES
+)
+embedding_cache_db = SQLiteDatabase(os.path.join(BACKEND_DIR, 'db', 'embedding_cache.db'), schema=EMBEDDING_CACHE_SCHEMA)
+
+
+def close_all():
+    for db in (conversations_db, users_db, jobs_db, embedding_cache_db):
+        db.close()
@@ -0,0 +1,213 @@
+"""
+Embedding backends behind the SentenceTransformer.encode interface used by VectorStore.
+
+  torch      SentenceTransformer on full-precision torch (default).
+  onnx       The same transformer exported to ONNX, run with ONNX Runtime.
+  onnx-int8  The ONNX export with dynamic int8 quantization of its weights: faster on CPU and a
+             quarter of the size; vectors stay close to torch's (tests/test_embedder_parity.py).
+
+The ONNX backends load a directory produced once by export_onnx (needs torch, sentence-transformers
+and onnx; serving only needs onnxruntime and tokenizers):
+
+    cd backend
+    python -m app.services.embedders --model all-MiniLM-L6-v2
+    EMBEDDING_BACKEND=onnx-int8 uvicorn app.main:app
+"""
+import os
+import sys
+import json
+import logging
+import argparse
+from typing import Any, Dict, List, Optional, Union
+
+import numpy as np
+
+logger = logging.getLogger("chat_with_pdf_api")
+
+BACKEND_TORCH = "torch"
+BACKEND_ONNX = "onnx"
+BACKEND_ONNX_INT8 = "onnx-int8"
+EMBEDDING_BACKENDS = (BACKEND_TORCH, BACKEND_ONNX, BACKEND_ONNX_INT8)
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", BACKEND_TORCH)
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..'))
+# One subdirectory per model (see onnx_model_dir).
+ONNX_MODEL_DIR = os.environ.get("ONNX_MODEL_DIR", os.path.join(BACKEND_DIR, "models", "onnx"))
+# Intra-op threads for ONNX Runtime; 0 lets it use every core.
+ONNX_THREADS = int(os.environ.get("ONNX_THREADS", "0"))
+
+ONNX_FILENAMES = {BACKEND_ONNX: "model.onnx", BACKEND_ONNX_INT8: "model.int8.onnx"}
+CONFIG_FILENAME = "embedder_config.json"
+
+
+def onnx_model_dir(model_name: str, base_dir: Optional[str] = None) -> str:
+    return os.path.join(base_dir or ONNX_MODEL_DIR, model_name.replace("/", "__"))
+
+
+class TorchEmbedder:
+    """SentenceTransformer on torch."""
+    backend = BACKEND_TORCH
+
+    def __init__(self, model_name: str, device: Optional[str] = None):
+        from sentence_transformers import SentenceTransformer
+        self.model_name = model_name
+        # Embedding-cache namespace: vectors from different backends are not mixed.
+        self.name = model_name
+        self.model = SentenceTransformer(model_name, device=device)
+
+    def encode(self, texts: Union[str, List[str]], batch_size: int = 32, show_progress_bar: bool = False, convert_to_numpy: bool = True, **kwargs):
+        return self.model.encode(texts, batch_size=batch_size, show_progress_bar=show_progress_bar, convert_to_numpy=convert_to_numpy, **kwargs)
+
+
+class OnnxEmbedder:
+    """
+    The transformer of a SentenceTransformer exported to ONNX, with pooling and normalization
+    redone in numpy from the exported embedder_config.json. Returns float32 numpy arrays.
+    """
+    def __init__(self, model_dir: str, quantized: bool = True, threads: int = ONNX_THREADS):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+        with open(os.path.join(model_dir, CONFIG_FILENAME)) as f:
+            self.config: Dict[str, Any] = json.load(f)
+        self.model_name = self.config["model_name"]
+        self.backend = BACKEND_ONNX_INT8 if quantized else BACKEND_ONNX
+        self.name = f"{self.model_name}@{self.backend}"
+        self.pooling = self.config["pooling"]
+        self.normalize = self.config["normalize"]
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=self.config["max_seq_length"])
+        self.tokenizer.enable_padding(pad_id=self.config["pad_token_id"], pad_token=self.config["pad_token"])
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads > 0:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(os.path.join(model_dir, ONNX_FILENAMES[self.backend]), options, providers=["CPUExecutionProvider"])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+
+    @property
+    def dimension(self) -> int:
+        return self.config["dimension"]
+
+    def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        arrays = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        hidden = self.session.run(None, {name: arrays[name] for name in self.input_names})[0]
+        if self.pooling == "cls":
+            return hidden[:, 0]
+        mask = arrays["attention_mask"][..., None].astype(np.float32)
+        return (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+    def encode(self, texts: Union[str, List[str]], batch_size: int = 32, show_progress_bar: bool = False, convert_to_numpy: bool = True,
+               normalize_embeddings: bool = False, **kwargs) -> np.ndarray:
+        single = isinstance(texts, str)
+        if single:
+            texts = [texts]
+        out = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        # Longest first, like SentenceTransformer, so each batch pads to similar lengths.
+        order = sorted(range(len(texts)), key=lambda i: -len(texts[i]))
+        for start in range(0, len(order), batch_size):
+            idx = order[start:start + batch_size]
+            out[idx] = self._embed_batch([texts[i] for i in idx])
+        if self.normalize or normalize_embeddings:
+            out /= np.clip(np.linalg.norm(out, axis=1, keepdims=True), 1e-12, None)
+        return out[0] if single else out
+
+
+def create_embedder(model_name: str, backend: str = EMBEDDING_BACKEND, onnx_dir: Optional[str] = None):
+    """The embedder for backend; ONNX backends load the export in onnx_model_dir(model_name)."""
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend: {backend}. Expected one of {EMBEDDING_BACKENDS}")
+    if backend == BACKEND_TORCH:
+        return TorchEmbedder(model_name)
+    model_dir = onnx_dir or onnx_model_dir(model_name)
+    if not os.path.exists(os.path.join(model_dir, ONNX_FILENAMES[backend])):
+        raise FileNotFoundError(
+            f"No ONNX export of {model_name} in {model_dir}; run: python -m app.services.embedders --model {model_name}"
+        )
+    return OnnxEmbedder(model_dir, quantized=backend == BACKEND_ONNX_INT8)
+
+
+def _pooling_mode(config: Dict[str, Any]) -> Optional[str]:
+    """mean or cls from a Pooling config (pooling_mode in sentence-transformers 6, flags before); None otherwise."""
+    if "pooling_mode" in config:
+        return config["pooling_mode"] if config["pooling_mode"] in ("mean", "cls") else None
+    if config.get("pooling_mode_cls_token"):
+        return "cls"
+    if config.get("pooling_mode_mean_tokens"):
+        return "mean"
+    return None
+
+
+def export_onnx(model_name: str, out_dir: Optional[str] = None, quantize: bool = True, opset: int = 17) -> str:
+    """
+    Exports the transformer of a SentenceTransformer to out_dir/model.onnx (plus model.int8.onnx
+    with dynamic int8 weights if quantize), its tokenizer and the pooling config. Returns out_dir.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    st = SentenceTransformer(model_name, device="cpu")
+    modules = {type(module).__name__: module for module in st}
+    pooling = _pooling_mode(modules["Pooling"].get_config_dict()) if "Pooling" in modules else None
+    if pooling is None:
+        raise ValueError(f"{model_name}: only models with mean or CLS pooling can be exported")
+    out_dir = out_dir or onnx_model_dir(model_name)
+    os.makedirs(out_dir, exist_ok=True)
+    transformer = st[0]
+    tokenizer = transformer.tokenizer
+    hf_model = transformer.auto_model.eval()
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+
+    class _LastHiddenState(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *inputs):
+            return self.model(**dict(zip(input_names, inputs)))[0]
+
+    axes = {0: "batch", 1: "sequence"}
+    onnx_path = os.path.join(out_dir, ONNX_FILENAMES[BACKEND_ONNX])
+    with torch.no_grad():
+        torch.onnx.export(
+            _LastHiddenState(hf_model), tuple(sample[name] for name in input_names), onnx_path,
+            input_names=input_names, output_names=["last_hidden_state"],
+            dynamic_axes={name: axes for name in input_names + ["last_hidden_state"]},
+            opset_version=opset, dynamo=False,
+        )
+    tokenizer.save_pretrained(out_dir)
+    config = {
+        "model_name": model_name,
+        # Mean and CLS pooling keep the transformer's hidden size.
+        "dimension": hf_model.config.hidden_size,
+        "max_seq_length": st.max_seq_length,
+        "pooling": pooling,
+        "normalize": "Normalize" in modules,
+        "pad_token": tokenizer.pad_token,
+        "pad_token_id": tokenizer.pad_token_id,
+    }
+    with open(os.path.join(out_dir, CONFIG_FILENAME), "w") as f:
+        json.dump(config, f, indent=2)
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantize_dynamic(onnx_path, os.path.join(out_dir, ONNX_FILENAMES[BACKEND_ONNX_INT8]), weight_type=QuantType.QInt8)
+    logger.info(f"Exported {model_name} to {out_dir}")
+    return out_dir
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Export a SentenceTransformer to ONNX (and int8) for EMBEDDING_BACKEND=onnx/onnx-int8.")
+    parser.add_argument("--model", default=os.environ.get("EMBEDDING_MODEL", "all-MiniLM-L6-v2"), help="Model name or local path")
+    parser.add_argument("--out", help="Output directory (default: ONNX_MODEL_DIR/<model>)")
+    parser.add_argument("--no-quantize", action="store_true", help="Skip the int8 model")
+    args = parser.parse_args(argv)
+    print(export_onnx(args.model, args.out, quantize=not args.no_quantize))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
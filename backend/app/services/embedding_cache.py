@@ -0,0 +1,86 @@
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+import numpy as np
+from typing import List, Dict
+
+from .database import SQLiteDatabase, embedding_cache_db
+
+logger = logging.getLogger("chat_with_pdf_api")
+
+EMBED_CACHE_MAX_MB = int(os.environ.get("EMBED_CACHE_MAX_MB", "512"))
+
+
+def text_hash(model_name: str, text: str) -> str:
+    return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    On-disk, content-addressed cache of chunk embeddings keyed by sha256(model name + chunk text).
+    Vectors are stored as float32 blobs; least recently used entries are evicted once the cache exceeds max_bytes.
+    The database is shared by every worker process, so the size checked for eviction is read from it, not counted here.
+    """
+    def __init__(self, db: SQLiteDatabase = embedding_cache_db, max_bytes: int = EMBED_CACHE_MAX_MB * 1024 * 1024):
+        self.db = db
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, model_name: str, texts: List[str]) -> Dict[int, List[float]]:
+        """
+        Returns {index in texts: vector} for the texts that are cached.
+        """
+        keys = [text_hash(model_name, t) for t in texts]
+        found: Dict[str, List[float]] = {}
+        unique_keys = list(set(keys))
+        # Stay below SQLite's bound-parameter limit.
+        for i in range(0, len(unique_keys), 500):
+            part = unique_keys[i:i+500]
+            placeholders = ", ".join("?" for _ in part)
+            for key, blob in self.db.fetchall(f'SELECT key, vector FROM embeddings WHERE key IN ({placeholders})', part):
+                found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+        if found:
+            now = time.time()
+            with self._lock, self.db.transaction() as conn:
+                conn.executemany('UPDATE embeddings SET last_access = ? WHERE key = ?', [(now, key) for key in found])
+        result = {i: found[key] for i, key in enumerate(keys) if key in found}
+        self.hits += len(result)
+        self.misses += len(texts) - len(result)
+        return result
+
+    def put_many(self, model_name: str, texts: List[str], vectors: List[List[float]]):
+        now = time.time()
+        rows = []
+        for text, vector in zip(texts, vectors):
+            blob = np.asarray(vector, dtype=np.float32).tobytes()
+            rows.append((text_hash(model_name, text), blob, len(blob), now))
+        with self._lock, self.db.transaction() as conn:
+            conn.executemany('INSERT OR IGNORE INTO embeddings (key, vector, size, last_access) VALUES (?, ?, ?, ?)', rows)
+            total_bytes = self._total_bytes(conn)
+            if total_bytes > self.max_bytes:
+                self._evict(conn, total_bytes)
+
+    @staticmethod
+    def _total_bytes(conn: sqlite3.Connection) -> int:
+        return conn.execute('SELECT COALESCE(SUM(size), 0) FROM embeddings').fetchone()[0]
+
+    def _evict(self, conn: sqlite3.Connection, total_bytes: int):
+        """Deletes least recently used entries until the cache is at 90% of max_bytes."""
+        target = int(self.max_bytes * 0.9)
+        freed = 0
+        keys = []
+        for key, size in conn.execute('SELECT key, size FROM embeddings ORDER BY last_access ASC'):
+            if total_bytes - freed <= target:
+                break
+            keys.append((key,))
+            freed += size
+        conn.executemany('DELETE FROM embeddings WHERE key = ?', keys)
+        logger.info(f"Embedding cache evicted {len(keys)} entries ({freed} bytes)")
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "size_bytes": self._total_bytes(self.db.connection()), "max_bytes": self.max_bytes}
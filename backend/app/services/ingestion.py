@@ -0,0 +1,355 @@
+import os
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional, Callable, List
+
+from .pdf_processor import PDFTextExtractor, DEFAULT_EXTRACTION_PROFILE
+from .vector_store import VectorStore
+from .registry import registry
+from .database import SQLiteDatabase, jobs_db
+from app.utils.chunking import Chunker
+
+logger = logging.getLogger("chat_with_pdf_api")
+
+# 800 chars + 150 overlap stays under MiniLM's 256 word-piece limit for typical English text.
+CHUNK_SIZE = int(os.environ.get("CHUNK_SIZE", "800"))
+CHUNK_OVERLAP = int(os.environ.get("CHUNK_OVERLAP", "150"))
+# Number of chunks embedded and written to Chroma per batch; bounds embedding memory regardless of PDF size.
+EMBED_BATCH_SIZE = int(os.environ.get("EMBED_BATCH_SIZE", "64"))
+# Number of documents ingested concurrently; keep low so ingestion cannot starve chat traffic of CPU.
+INGEST_MAX_CONCURRENCY = int(os.environ.get("INGEST_MAX_CONCURRENCY", "1"))
+# Maximum number of queued + running jobs before uploads are rejected.
+INGEST_MAX_PENDING = int(os.environ.get("INGEST_MAX_PENDING", "100"))
+
+# Minimum seconds between progress writes to the job store.
+PROGRESS_WRITE_INTERVAL = 0.5
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..'))
+UPLOAD_DIR = os.path.join(BACKEND_DIR, 'db', 'uploads')
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+
+ProgressCallback = Callable[[Dict[str, int]], None]
+
+
+class IngestionPipeline:
+    """
+    PDF ingestion: stream extracted pages -> chunk with Chunker -> embed and write to the vector store in bounded batches.
+    """
+    def __init__(self, vector_store: VectorStore, chunker: Optional[Chunker] = None, batch_size: int = EMBED_BATCH_SIZE, extractor_cls: type = PDFTextExtractor):
+        """extractor_cls: PDFTextExtractor or a subclass (e.g. the benchmark's timing extractor)."""
+        self.vector_store = vector_store
+        self.chunker = chunker or Chunker(chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP)
+        self.batch_size = batch_size
+        self.extractor_cls = extractor_cls
+
+    def ingest(self, file_path: str, collection_name: str, progress: Optional[ProgressCallback] = None, profile: str = DEFAULT_EXTRACTION_PROFILE) -> Dict[str, Any]:
+        """
+        Ingests a PDF into collection_name using the given extraction profile. Returns a summary with page and chunk counts.
+        Pages are streamed from PDFTextExtractor.iter_pages and chunks are written as soon as a batch is full,
+        so memory stays bounded by the pages in flight plus one batch.
+        progress, if given, is called with partial counters (pages_total, pages_extracted, chunks_total, chunks_embedded).
+        """
+        report = progress or (lambda update: None)
+        pdf_processor = self.extractor_cls(file_path, profile=profile)
+        pages = 0
+        chunks_total = 0
+        chunks_embedded = 0
+        batch: List[Dict[str, Any]] = []
+
+        def flush():
+            nonlocal chunks_embedded
+            self.vector_store.add_chunks(collection_name, batch, persist_index=False)
+            chunks_embedded += len(batch)
+            batch.clear()
+            report({"chunks_embedded": chunks_embedded})
+
+        try:
+            metadata = pdf_processor.extract_metadata()
+            report({"pages_total": metadata["page_count"]})
+            for page in pdf_processor.iter_pages():
+                page["metadata"]["document_id"] = collection_name
+                page_chunks = self.chunker.chunk_page(page)
+                pages += 1
+                chunks_total += len(page_chunks)
+                report({"pages_extracted": pages, "chunks_total": chunks_total})
+                batch.extend(page_chunks)
+                if len(batch) >= self.batch_size:
+                    flush()
+            if batch:
+                flush()
+        finally:
+            pdf_processor.close()
+        self.vector_store.get_keyword_index(collection_name).save()
+        logger.info(f"Ingested {pages} pages as {chunks_total} chunks into {collection_name}")
+        return {
+            "metadata": metadata,
+            "pages": pages,
+            "chunks": chunks_total
+        }
+
+
+class IngestionJobStore:
+    """
+    SQLite-backed store for ingestion jobs, so queued and running jobs survive a restart.
+    Uses the shared WAL database layer: the worker threads, the progress throttle and request
+    handlers write concurrently.
+    """
+    COLUMNS = (
+        "job_id", "user_id", "document_id", "conversation_id", "filename", "file_path", "file_hash", "profile", "embedder", "status",
+        "pages_total", "pages_extracted", "chunks_total", "chunks_embedded", "error",
+        "created_at", "started_at", "finished_at", "source_job_id"
+    )
+    # Copied from the source job by jobs that follow one (see create_follower).
+    FOLLOWED_FIELDS = (
+        "status", "pages_total", "pages_extracted", "chunks_total", "chunks_embedded", "error", "started_at", "finished_at"
+    )
+
+    def __init__(self, db: SQLiteDatabase = jobs_db):
+        self.db = db
+
+    def create(self, user_id: str, document_id: str, conversation_id: str, filename: str, file_path: str, profile: str = DEFAULT_EXTRACTION_PROFILE, file_hash: Optional[str] = None, embedder: Optional[str] = None) -> Dict[str, Any]:
+        job = {
+            "job_id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "document_id": document_id,
+            "conversation_id": conversation_id,
+            "filename": filename,
+            "file_path": file_path,
+            "file_hash": file_hash,
+            "profile": profile,
+            "embedder": embedder,
+            "status": JOB_QUEUED,
+            "created_at": datetime.now(timezone.utc).isoformat()
+        }
+        self.db.execute('''INSERT INTO jobs (job_id, user_id, document_id, conversation_id, filename, file_path, file_hash, profile, embedder, status, created_at)
+                           VALUES (:job_id, :user_id, :document_id, :conversation_id, :filename, :file_path, :file_hash, :profile, :embedder, :status, :created_at)''', job)
+        return self.get(job["job_id"])
+
+    def create_follower(self, user_id: str, conversation_id: str, filename: str, source: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Job owned by user_id for a duplicate upload that reuses source's document. It ingests nothing
+        itself: it starts as a copy of source and follows it until source finishes (see get).
+        """
+        job = {key: None for key in self.COLUMNS}
+        job.update({key: source.get(key) for key in self.FOLLOWED_FIELDS})
+        job.update({
+            "job_id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "document_id": source["document_id"],
+            "conversation_id": conversation_id,
+            "filename": filename,
+            "profile": source["profile"],
+            "embedder": source["embedder"],
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "source_job_id": source["job_id"]
+        })
+        self.db.execute(f'''INSERT INTO jobs ({", ".join(self.COLUMNS)})
+                            VALUES ({", ".join(":" + key for key in self.COLUMNS)})''', job)
+        return self.get(job["job_id"])
+
+    def update(self, job_id: str, **fields):
+        if not fields:
+            return
+        unknown = set(fields) - set(self.COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown job fields: {sorted(unknown)}")
+        assignments = ", ".join(f"{key} = ?" for key in fields)
+        self.db.execute(f'UPDATE jobs SET {assignments} WHERE job_id = ?', (*fields.values(), job_id))
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self._get(job_id)
+        if job and job["source_job_id"] and job["status"] in (JOB_QUEUED, JOB_RUNNING):
+            job = self._follow(job)
+        return job
+
+    def _get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self.db.fetchone(f'SELECT {", ".join(self.COLUMNS)} FROM jobs WHERE job_id = ?', (job_id,))
+        return dict(zip(self.COLUMNS, row)) if row else None
+
+    def _follow(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """Brings an unfinished follower job up to date with its source job."""
+        source = self._get(job["source_job_id"])
+        if source is None:
+            fields = {"status": JOB_FAILED, "error": "The original upload's ingestion job no longer exists.", "finished_at": datetime.now(timezone.utc).isoformat()}
+        else:
+            fields = {key: source[key] for key in self.FOLLOWED_FIELDS}
+        changed = {key: value for key, value in fields.items() if job[key] != value}
+        if changed:
+            self.update(job["job_id"], **changed)
+            job.update(changed)
+        return job
+
+    def list_by_status(self, *statuses: str) -> List[Dict[str, Any]]:
+        placeholders = ", ".join("?" for _ in statuses)
+        rows = self.db.fetchall(f'SELECT {", ".join(self.COLUMNS)} FROM jobs WHERE status IN ({placeholders}) ORDER BY created_at ASC', statuses)
+        return [dict(zip(self.COLUMNS, row)) for row in rows]
+
+    def find_by_file_hash(self, file_hash: str, profile: str, embedder: str) -> Optional[Dict[str, Any]]:
+        """
+        Latest job that ingested (or is ingesting) the same file content with the same profile and
+        embedder (VectorStore.embedding_namespace), so vectors from another backend are never reused.
+        """
+        row = self.db.fetchone(f'''SELECT {", ".join(self.COLUMNS)} FROM jobs
+                                   WHERE file_hash = ? AND profile = ? AND embedder = ? AND status IN (?, ?, ?)
+                                   ORDER BY created_at DESC LIMIT 1''', (file_hash, profile, embedder, JOB_QUEUED, JOB_RUNNING, JOB_COMPLETED))
+        return dict(zip(self.COLUMNS, row)) if row else None
+
+    def forget_document(self, document_id: str):
+        """Stops a deleted document from being offered for reuse."""
+        self.db.execute('UPDATE jobs SET file_hash = NULL WHERE document_id = ?', (document_id,))
+
+    def count_pending(self) -> int:
+        return self.db.fetchone('SELECT COUNT(*) FROM jobs WHERE status IN (?, ?) AND source_job_id IS NULL', (JOB_QUEUED, JOB_RUNNING))[0]
+
+
+def job_progress(job: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Public view of a job with overall progress (0..1) and a rough ETA in seconds.
+    Extraction and embedding are weighted equally.
+    """
+    pages_total = job.get("pages_total") or 0
+    chunks_total = job.get("chunks_total") or 0
+    extract_fraction = (job.get("pages_extracted") or 0) / pages_total if pages_total else 0.0
+    embed_fraction = (job.get("chunks_embedded") or 0) / chunks_total if chunks_total else 0.0
+    fraction = 1.0 if job["status"] == JOB_COMPLETED else 0.5 * extract_fraction + 0.5 * embed_fraction
+    eta_seconds = None
+    if job["status"] == JOB_RUNNING and job.get("started_at") and fraction > 0:
+        elapsed = (datetime.now(timezone.utc) - datetime.fromisoformat(job["started_at"])).total_seconds()
+        eta_seconds = round(elapsed * (1 - fraction) / fraction, 1)
+    view = {key: job.get(key) for key in IngestionJobStore.COLUMNS if key not in ("file_path", "file_hash", "source_job_id")}
+    view.update({"progress": round(fraction, 3), "eta_seconds": eta_seconds})
+    return view
+
+
+def find_reusable_document(file_hash: str, profile: str, vector_store: VectorStore) -> Optional[Dict[str, Any]]:
+    """
+    Returns the job of an earlier upload with identical content whose collection can be reused, if any.
+    Queued/running jobs are reused too, so concurrent duplicate uploads are only ingested once.
+    The uploader gets a job of their own that follows this one (IngestionJobStore.create_follower).
+    """
+    job = ingestion_queue.store.find_by_file_hash(file_hash, profile, vector_store.embedding_namespace)
+    if not job:
+        return None
+    if job["status"] == JOB_COMPLETED and not vector_store.has_collection(job["document_id"]):
+        ingestion_queue.store.forget_document(job["document_id"])
+        return None
+    return job
+
+
+class IngestionJobQueue:
+    """
+    Bounded worker pool that runs ingestion jobs in the background and records their progress.
+    """
+    def __init__(self, store: IngestionJobStore, max_workers: int = INGEST_MAX_CONCURRENCY, max_pending: int = INGEST_MAX_PENDING):
+        self.store = store
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="ingest")
+            return self._executor
+
+    def is_full(self) -> bool:
+        return self.store.count_pending() >= self.max_pending
+
+    def submit(self, user_id: str, document_id: str, conversation_id: str, filename: str, file_path: str, profile: str = DEFAULT_EXTRACTION_PROFILE, file_hash: Optional[str] = None, embedder: Optional[str] = None) -> Dict[str, Any]:
+        job = self.store.create(user_id, document_id, conversation_id, filename, file_path, profile, file_hash, embedder)
+        self.executor.submit(self._run, job["job_id"])
+        return job
+
+    def resume_pending(self):
+        """Re-queues jobs left queued or running by a previous process. Partially written collections are cleared first."""
+        for job in self.store.list_by_status(JOB_QUEUED, JOB_RUNNING):
+            if job["source_job_id"]:
+                # Followers ingest nothing; they pick up their source job's state when read.
+                continue
+            if job["status"] == JOB_RUNNING:
+                self._clear_partial_collection(job["document_id"])
+                self.store.update(job["job_id"], status=JOB_QUEUED, pages_extracted=0, chunks_total=0, chunks_embedded=0)
+            logger.info(f"Resuming ingestion job {job['job_id']}")
+            self.executor.submit(self._run, job["job_id"])
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def _clear_partial_collection(self, document_id: str):
+        try:
+            registry.get_vector_store().delete_collection(document_id)
+        except Exception:
+            pass
+
+    def _throttled_progress(self, job_id: str, interval: float = PROGRESS_WRITE_INTERVAL):
+        """
+        Returns (report, flush): report merges counter updates and writes them at most every interval seconds;
+        flush writes whatever is still pending.
+        """
+        pending: Dict[str, int] = {}
+        last_write = 0.0
+
+        def flush():
+            nonlocal last_write
+            if pending:
+                self.store.update(job_id, **pending)
+                pending.clear()
+            last_write = time.monotonic()
+
+        def report(update: Dict[str, int]):
+            pending.update(update)
+            if time.monotonic() - last_write >= interval:
+                flush()
+
+        return report, flush
+
+    def _run(self, job_id: str):
+        job = self.store.get(job_id)
+        if not job or job["source_job_id"] or job["status"] not in (JOB_QUEUED, JOB_RUNNING):
+            return
+        if not os.path.exists(job["file_path"]):
+            self.store.update(job_id, status=JOB_FAILED, error="Uploaded file is no longer available.", finished_at=datetime.now(timezone.utc).isoformat())
+            return
+        vector_store = registry.get_vector_store()
+        # Recorded at run time: a job resumed after a restart is embedded by the current backend.
+        self.store.update(job_id, status=JOB_RUNNING, started_at=datetime.now(timezone.utc).isoformat(), embedder=vector_store.embedding_namespace)
+        start = time.perf_counter()
+        report, flush = self._throttled_progress(job_id)
+        try:
+            try:
+                pipeline = IngestionPipeline(vector_store)
+                pipeline.ingest(job["file_path"], job["document_id"], progress=report, profile=job["profile"] or DEFAULT_EXTRACTION_PROFILE)
+            finally:
+                # Counters held back by the throttle are written whether or not ingestion succeeded.
+                flush()
+        except Exception as e:
+            logger.error(f"Ingestion job {job_id} failed: {e}")
+            self._clear_partial_collection(job["document_id"])
+            self.store.update(job_id, status=JOB_FAILED, error=str(e), finished_at=datetime.now(timezone.utc).isoformat())
+        else:
+            self.store.update(job_id, status=JOB_COMPLETED, finished_at=datetime.now(timezone.utc).isoformat())
+            logger.info(f"Ingestion job {job_id} completed in {(time.perf_counter() - start):.2f}s")
+        finally:
+            self._remove_upload(job["file_path"])
+
+    def _remove_upload(self, file_path: str):
+        try:
+            os.remove(file_path)
+        except OSError as e:
+            logger.warning(f"Could not remove upload {file_path}: {e}")
+
+
+ingestion_queue = IngestionJobQueue(IngestionJobStore())
@@ -0,0 +1,145 @@
+import os
+import re
+import json
+import math
+import threading
+from collections import Counter
+from typing import List, Dict, Tuple, Optional, Iterable
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def _file_stamp(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class KeywordIndex:
+    """
+    Per-collection inverted index with BM25 scoring.
+    Postings map term -> {chunk_id: term frequency}; document lengths are kept for length normalization,
+    and each document's terms so re-adding or removing it only touches its own postings.
+    The index is updated incrementally as chunks are added and persisted as JSON next to the collection metadata.
+    """
+    def __init__(self, path: Optional[str] = None, k1: float = 1.5, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.doc_lengths: Dict[str, int] = {}
+        self.doc_terms: Dict[str, List[str]] = {}
+        # Insertion-ordered set of chunk ids (values unused).
+        self.doc_order: Dict[str, None] = {}
+        self.total_length = 0
+        # (mtime, size) of the persisted file when this copy was last loaded or saved.
+        self.file_stamp: Optional[Tuple[int, int]] = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    @property
+    def first_doc_id(self) -> Optional[str]:
+        return next(iter(self.doc_order), None)
+
+    def add(self, ids: Iterable[str], texts: Iterable[str]):
+        with self._lock:
+            for doc_id, text in zip(ids, texts):
+                if doc_id in self.doc_lengths:
+                    self._remove(doc_id)
+                tokens = tokenize(text or "")
+                counts = Counter(tokens)
+                for term, tf in counts.items():
+                    self.postings.setdefault(term, {})[doc_id] = tf
+                self.doc_terms[doc_id] = list(counts)
+                self.doc_lengths[doc_id] = len(tokens)
+                self.doc_order[doc_id] = None
+                self.total_length += len(tokens)
+
+    def _remove(self, doc_id: str):
+        for term in self.doc_terms.pop(doc_id, ()):
+            docs = self.postings.get(term)
+            if docs is not None and docs.pop(doc_id, None) is not None and not docs:
+                del self.postings[term]
+        self.total_length -= self.doc_lengths.pop(doc_id, 0)
+        self.doc_order.pop(doc_id, None)
+
+    def search(self, query_text: str, n_results: int = 10) -> List[Tuple[str, float]]:
+        """
+        Returns up to n_results (chunk_id, bm25_score) pairs, best first.
+        Only the postings of the query terms are visited.
+        """
+        terms = set(tokenize(query_text))
+        with self._lock:
+            n_docs = len(self.doc_lengths)
+            if not n_docs or not terms:
+                return []
+            avg_len = self.total_length / n_docs or 1.0
+            scores: Dict[str, float] = {}
+            for term in terms:
+                docs = self.postings.get(term)
+                if not docs:
+                    continue
+                df = len(docs)
+                idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                for doc_id, tf in docs.items():
+                    norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / avg_len)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        ranked = sorted(scores.items(), key=lambda x: x[1], reverse=True)
+        return ranked[:n_results]
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            data = {
+                "postings": self.postings,
+                "doc_lengths": self.doc_lengths,
+                "doc_order": list(self.doc_order),
+            }
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+            self.file_stamp = _file_stamp(self.path)
+
+    def changed_on_disk(self) -> bool:
+        """True if another process saved or deleted the persisted index since this copy was loaded or saved."""
+        return bool(self.path) and _file_stamp(self.path) != self.file_stamp
+
+    @classmethod
+    def load(cls, path: str) -> Optional['KeywordIndex']:
+        stamp = _file_stamp(path)
+        if stamp is None:
+            return None
+        with open(path, "r") as f:
+            data = json.load(f)
+        index = cls(path)
+        index.file_stamp = stamp
+        index.postings = data.get("postings", {})
+        index.doc_lengths = data.get("doc_lengths", {})
+        index.doc_order = dict.fromkeys(data.get("doc_order", index.doc_lengths))
+        # Not persisted: rebuilt from the postings in one pass.
+        for term, docs in index.postings.items():
+            for doc_id in docs:
+                index.doc_terms.setdefault(doc_id, []).append(term)
+        index.total_length = sum(index.doc_lengths.values())
+        return index
+
+    def delete(self):
+        with self._lock:
+            self.postings.clear()
+            self.doc_lengths.clear()
+            self.doc_terms.clear()
+            self.doc_order.clear()
+            self.total_length = 0
+            if self.path and os.path.exists(self.path):
+                os.remove(self.path)
+            self.file_stamp = None
@@ -1,18 +1,65 @@
 import os
-import requests
 import json
-from typing import Generator, Optional, Dict, Any
+import asyncio
+import logging
+import httpx
+from contextlib import aclosing
+from typing import AsyncGenerator, Optional, Dict, Any
+from app.utils.token_budget import LLM_MAX_TOKENS
+
+logger = logging.getLogger("chat_with_pdf_api")
+
+try:
+    import h2  # noqa: F401  (enables HTTP/2 in httpx)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+SSE_DONE = "[DONE]"
+SYSTEM_PROMPT = "You are a helpful assistant."
 
 class LLMClient:
     """
-    Groq API client for Llama-3.3-70B-Versatile with streaming and non-streaming support.
+    Async Groq API client for Llama-3.3-70B-Versatile with streaming and non-streaming support.
+    Uses one pooled, keep-alive (HTTP/2 when available) httpx session for all requests.
     Handles prompt construction, error handling, retries, and response validation.
     """
-    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None):
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        http_client: Optional[httpx.AsyncClient] = None,
+        max_connections: Optional[int] = None,
+        max_keepalive_connections: Optional[int] = None,
+        timeout: float = 60.0
+    ):
         self.api_key = api_key or os.getenv("GROQ_API_KEY")
         self.base_url = base_url or os.getenv("GROQ_API_BASE")
         self.model = "llama-3.3-70b-versatile"
         self.headers = {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+        self.max_connections = max_connections or int(os.getenv("LLM_MAX_CONNECTIONS", "200"))
+        self.max_keepalive_connections = max_keepalive_connections or int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "50"))
+        self.timeout = timeout
+        self._client = http_client
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                http2=HTTP2_AVAILABLE,
+                headers=self.headers,
+                timeout=httpx.Timeout(self.timeout, connect=10.0),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive_connections,
+                    keepalive_expiry=30.0
+                )
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
 
     def build_prompt(self, query: str, context: str, mode: str = "chat") -> str:
         """
@@ -41,50 +88,87 @@ class LLMClient:
                 f"\nContext:\n{context}\n\nQuestion: {query}\nAnswer:"
             )
 
-    def call_llm(self, prompt: str, max_tokens: int = 512, temperature: float = 0.2, stream: bool = False, retries: int = 3) -> Any:
-        """
-        Call Groq API for LLM completion. Supports streaming and error retries.
-        Returns: generator for streaming, string for non-streaming.
-        """
-        url = f"{self.base_url}/chat/completions"
+    def prompt_overhead(self, query: str, mode: str = "chat") -> str:
+        """Everything sent to the model except the context, for token budgeting."""
+        return f"{SYSTEM_PROMPT}\n{self.build_prompt(query, '', mode)}"
+
+    def _build_payload(self, prompt: str, max_tokens: int, temperature: float, stream: bool) -> Dict[str, Any]:
         messages = [
-            {"role": "system", "content": "You are a helpful assistant."},
+            {"role": "system", "content": SYSTEM_PROMPT},
             {"role": "user", "content": prompt}
         ]
-        payload = {
+        return {
             "model": self.model,
             "messages": messages,
             "max_tokens": max_tokens,
             "temperature": temperature,
             "stream": stream
         }
+
+    async def call_llm(self, prompt: str, max_tokens: int = LLM_MAX_TOKENS, temperature: float = 0.2, retries: int = 3) -> str:
+        """
+        Call Groq API for a non-streaming LLM completion, retrying failed requests with backoff.
+        """
+        url = f"{self.base_url}/chat/completions"
+        payload = self._build_payload(prompt, max_tokens, temperature, stream=False)
         for attempt in range(retries):
             try:
-                response = requests.post(url, headers=self.headers, json=payload, stream=stream, timeout=60)
+                response = await self.client.post(url, json=payload)
                 response.raise_for_status()
-                if stream:
-                    return self._streaming_response(response)
-                else:
-                    data = response.json()
-                    return self._validate_response(data)
+                return self._validate_response(response.json())
             except Exception as e:
                 if attempt == retries - 1:
                     raise RuntimeError(f"LLM API call failed after {retries} attempts: {e}")
-        return None
-
-    def _streaming_response(self, response: requests.Response) -> Generator[str, None, None]:
-        """Yield tokens from streaming response."""
-        for line in response.iter_lines():
-            if line:
-                try:
-                    data = line.decode("utf-8")
-                    chunk = json.loads(data)
-                    delta = chunk.get("choices", [{}])[0].get("delta", {})
-                    content = delta.get("content", "")
-                    if content:
-                        yield content
-                except Exception:
-                    continue
+                await asyncio.sleep(0.5 * 2 ** attempt)
+
+    async def stream_llm(self, prompt: str, max_tokens: int = LLM_MAX_TOKENS, temperature: float = 0.2, retries: int = 3) -> AsyncGenerator[str, None]:
+        """
+        Call Groq API with stream=True and yield content tokens as they arrive.
+        Failed requests are retried only if no token has been yielded yet.
+        Closing the generator (aclose) closes the response, which aborts the upstream request.
+        """
+        url = f"{self.base_url}/chat/completions"
+        payload = self._build_payload(prompt, max_tokens, temperature, stream=True)
+        for attempt in range(retries):
+            started = False
+            try:
+                async with self.client.stream("POST", url, json=payload) as response:
+                    response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        data = self._parse_sse_line(line)
+                        if data is None:
+                            continue
+                        if data == SSE_DONE:
+                            return
+                        content = self._extract_delta(data)
+                        if content:
+                            started = True
+                            yield content
+                return
+            except Exception as e:
+                if started or attempt == retries - 1:
+                    raise RuntimeError(f"LLM streaming call failed after {attempt + 1} attempts: {e}")
+                await asyncio.sleep(0.5 * 2 ** attempt)
+
+    @staticmethod
+    def _parse_sse_line(line: str) -> Optional[str]:
+        """
+        Returns the payload of an SSE 'data:' line, or None for blank lines, comments and other fields.
+        """
+        line = line.strip()
+        if not line.startswith("data:"):
+            return None
+        return line[len("data:"):].strip()
+
+    @staticmethod
+    def _extract_delta(data: str) -> str:
+        try:
+            chunk = json.loads(data)
+        except json.JSONDecodeError:
+            logger.warning(f"Skipping malformed SSE payload: {data[:100]}")
+            return ""
+        choices = chunk.get("choices") or [{}]
+        return choices[0].get("delta", {}).get("content") or ""
 
     def _validate_response(self, data: Dict[str, Any]) -> str:
         """Validate and extract answer from LLM response."""
@@ -92,10 +176,19 @@ class LLMClient:
             return data["choices"][0]["message"]["content"].strip()
         raise ValueError("Invalid LLM response format")
 
-    def chat(self, query: str, context: str, mode: str = "chat", **kwargs) -> str:
+    async def chat(self, query: str, context: str, mode: str = "chat", **kwargs) -> str:
         prompt = self.build_prompt(query, context, mode)
-        return self.call_llm(prompt, stream=False, **kwargs)
+        return await self.call_llm(prompt, **kwargs)
+
+    async def chat_stream(self, query: str, context: str, **kwargs) -> AsyncGenerator[str, None]:
+        prompt = self.build_prompt(query, context, mode="chat")
+        # aclosing: closing this generator must close stream_llm too, not leave it to the garbage collector.
+        async with aclosing(self.stream_llm(prompt, **kwargs)) as tokens:
+            async for token in tokens:
+                yield token
 
-    def deep_dive(self, query: str, context: str, **kwargs) -> Generator[str, None, None]:
+    async def deep_dive(self, query: str, context: str, **kwargs) -> AsyncGenerator[str, None]:
         prompt = self.build_prompt(query, context, mode="deep-dive")
-        return self.call_llm(prompt, stream=True, **kwargs)
\ No newline at end of file
+        async with aclosing(self.stream_llm(prompt, **kwargs)) as tokens:
+            async for token in tokens:
+                yield token
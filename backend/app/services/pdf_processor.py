@@ -1,14 +1,128 @@
+import os
 import fitz
 import pdfplumber
 import uuid
-from typing import List, Dict, Any
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Iterator, Optional
+
+# Extraction profiles: what is extracted besides page text.
+PROFILE_TEXT_ONLY = "text-only"
+PROFILE_TEXT_TABLES = "text+tables"
+PROFILE_FULL = "full"
+EXTRACTION_PROFILES = (PROFILE_TEXT_ONLY, PROFILE_TEXT_TABLES, PROFILE_FULL)
+DEFAULT_EXTRACTION_PROFILE = os.environ.get("PDF_EXTRACTION_PROFILE", PROFILE_TEXT_TABLES)
+
+# Worker processes used by PDFTextExtractor.iter_pages; defaults to all cores.
+PDF_EXTRACT_WORKERS = int(os.environ.get("PDF_EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+# Documents with fewer pages are extracted in-process; spawning a pool costs more than it saves.
+PARALLEL_MIN_PAGES = int(os.environ.get("PDF_PARALLEL_MIN_PAGES", "16"))
+# Minimum number of ruling lines/rectangles on a page before pdfplumber table extraction is attempted.
+TABLE_MIN_RULES = int(os.environ.get("PDF_TABLE_MIN_RULES", "4"))
+
+# Per-process handles opened once by _init_worker, so each worker reuses its own fitz/pdfplumber document.
+_worker_doc = None
+_worker_plumber = None
+_worker_profile = DEFAULT_EXTRACTION_PROFILE
+
+
+def _structured_blocks(page) -> List[Dict[str, Any]]:
+    structured_blocks = []
+    for block in page.get_text("dict").get("blocks", []):
+        if block["type"] == 0:
+            text = block.get("lines", [])
+            block_text = " ".join([span["text"] for line in text for span in line.get("spans", [])])
+            structured_blocks.append({
+                "bbox": block.get("bbox"),
+                "text": block_text,
+                "type": "text"
+            })
+        elif block["type"] == 1:
+            structured_blocks.append({
+                "bbox": block.get("bbox"),
+                "type": "image"
+            })
+    return structured_blocks
+
+
+def _page_images(page) -> List[Dict[str, Any]]:
+    """
+    Image references for a page (xref + page + size); bytes are only decoded on demand by PDFTextExtractor.load_image.
+    """
+    page_images = []
+    for img in page.get_images(full=True):
+        xref, _smask, width, height = img[:4]
+        page_images.append({
+            "xref": xref,
+            "page": page.number + 1,
+            "width": width,
+            "height": height,
+            "name": img[7]
+        })
+    return page_images
+
+
+def looks_tabular(page) -> bool:
+    """
+    Cheap PyMuPDF pre-check for tables. pdfplumber's default table strategy builds tables from ruling
+    lines and rectangle edges, so a page with fewer than TABLE_MIN_RULES of them cannot yield a table.
+    """
+    rules = 0
+    for drawing in page.get_drawings():
+        for item in drawing.get("items", []):
+            if item[0] in ("l", "re"):
+                rules += 1
+                if rules >= TABLE_MIN_RULES:
+                    return True
+    return False
+
+
+def _process_page(doc, plumber_pdf, page_num: int, profile: str = DEFAULT_EXTRACTION_PROFILE) -> Dict[str, Any]:
+    """
+    Processes one page according to the extraction profile. page_num is 0-based.
+    plumber_pdf may be None for the text-only profile.
+    """
+    page = doc.load_page(page_num)
+    blocks = _structured_blocks(page)
+    tables = []
+    if profile != PROFILE_TEXT_ONLY and looks_tabular(page):
+        tables = plumber_pdf.pages[page_num].extract_tables()
+    return {
+        "page": page_num + 1,
+        "text": " ".join(block["text"] for block in blocks if "text" in block),
+        "blocks": blocks,
+        "tables": tables,
+        "images": _page_images(page) if profile == PROFILE_FULL else []
+    }
+
+
+def _open_plumber(file_path: str, profile: str):
+    return pdfplumber.open(file_path) if profile != PROFILE_TEXT_ONLY else None
+
+
+def _init_worker(file_path: str, profile: str):
+    global _worker_doc, _worker_plumber, _worker_profile
+    _worker_doc = fitz.open(file_path)
+    _worker_plumber = _open_plumber(file_path, profile)
+    _worker_profile = profile
+
+
+def _process_page_in_worker(page_num: int) -> Dict[str, Any]:
+    return _process_page(_worker_doc, _worker_plumber, page_num, _worker_profile)
+
 
 class PDFTextExtractor:
     """
     Extracts text and basic structure from PDF using PyMuPDF.
+    profile selects what else is extracted: "text-only", "text+tables" (pdfplumber, only on pages that look tabular)
+    or "full" (tables plus image references).
     """
-    def __init__(self, file_path: str):
+    def __init__(self, file_path: str, profile: str = DEFAULT_EXTRACTION_PROFILE):
+        if profile not in EXTRACTION_PROFILES:
+            raise ValueError(f"Unknown extraction profile: {profile}. Expected one of {EXTRACTION_PROFILES}")
         self.file_path = file_path
+        self.profile = profile
         self.doc = fitz.open(file_path)
 
     def extract_text_by_page(self) -> List[Dict[str, Any]]:
@@ -34,37 +148,21 @@ class PDFTextExtractor:
         pages = []
         for page_num in range(len(self.doc)):
             page = self.doc.load_page(page_num)
-            blocks = page.get_text("dict").get("blocks", [])
-            structured_blocks = []
-            for block in blocks:
-                if block["type"] == 0:
-                    text = block.get("lines", [])
-                    block_text = " ".join([span["text"] for line in text for span in line.get("spans", [])])
-                    structured_blocks.append({
-                        "bbox": block.get("bbox"),
-                        "text": block_text,
-                        "type": "text"
-                    })
-                elif block["type"] == 1:
-                    structured_blocks.append({
-                        "bbox": block.get("bbox"),
-                        "type": "image"
-                    })
             pages.append({
                 "page": page_num + 1,
-                "blocks": structured_blocks
+                "blocks": _structured_blocks(page)
             })
         return pages
 
     def extract_tables_by_page(self) -> List[Dict[str, Any]]:
         """
-        Extracts tables from each page using pdfplumber.
+        Extracts tables from each page using pdfplumber; pages that fail the looks_tabular pre-check are skipped.
         Returns a list of dicts: [{"page": int, "tables": List[List[List[str]]]}]
         """
         tables = []
         with pdfplumber.open(self.file_path) as pdf:
             for page_num, page in enumerate(pdf.pages):
-                page_tables = page.extract_tables()
+                page_tables = page.extract_tables() if looks_tabular(self.doc.load_page(page_num)) else []
                 tables.append({
                     "page": page_num + 1,
                     "tables": page_tables
@@ -81,60 +179,77 @@ class PDFTextExtractor:
 
     def extract_images_by_page(self) -> List[Dict[str, Any]]:
         """
-        Extracts images from each page using PyMuPDF.
+        Lists image references on each page using PyMuPDF.
         Returns a list of dicts: [{"page": int, "images": List[Dict]}]
-        Each image dict contains: {"xref": int, "ext": str, "bytes": bytes}
+        Each image dict contains: {"xref": int, "page": int, "width": int, "height": int, "name": str};
+        use load_image(xref) to get the bytes.
         """
         images = []
         for page_num in range(len(self.doc)):
             page = self.doc.load_page(page_num)
-            page_images = []
-            for img in page.get_images(full=True):
-                xref = img[0]
-                base_image = self.doc.extract_image(xref)
-                image_bytes = base_image.get("image")
-                ext = base_image.get("ext")
-                page_images.append({
-                    "xref": xref,
-                    "ext": ext,
-                    "bytes": image_bytes
-                })
             images.append({
                 "page": page_num + 1,
-                "images": page_images
+                "images": _page_images(page)
             })
         return images
 
+    def load_image(self, xref: int) -> Dict[str, Any]:
+        """
+        Decodes a referenced image. Returns {"xref": int, "ext": str, "bytes": bytes}.
+        """
+        base_image = self.doc.extract_image(xref)
+        return {
+            "xref": xref,
+            "ext": base_image.get("ext"),
+            "bytes": base_image.get("image")
+        }
+
+    def iter_pages(self, workers: Optional[int] = None, max_in_flight: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Yields processed pages (text, blocks, plus tables/images per the extraction profile) one at a time, in page order.
+        Large documents are processed across a process pool where every worker opens its own fitz/pdfplumber
+        handle; at most max_in_flight pages (default 2 per worker) are held in memory at once.
+        """
+        metadata = self.extract_metadata()
+        page_count = metadata['page_count']
+        doc_id = metadata.get("document_id") or self.file_path.split("/")[-1].split(".")[0]
+        page_metadata = {**{k: v for k, v in metadata.items() if v is not None}, "document_id": doc_id}
+        workers = min(workers or PDF_EXTRACT_WORKERS, page_count)
+        for page_data in self._iter_processed_pages(page_count, workers, max_in_flight or workers * 2):
+            page_data["chunk_id"] = f"{metadata.get('document_id', str(uuid.uuid4()))}_page_{page_data['page']}"
+            page_data["metadata"] = dict(page_metadata)
+            yield page_data
+
+    def _iter_processed_pages(self, page_count: int, workers: int, max_in_flight: int) -> Iterator[Dict[str, Any]]:
+        if workers <= 1 or page_count < PARALLEL_MIN_PAGES:
+            plumber_pdf = _open_plumber(self.file_path, self.profile)
+            try:
+                for page_num in range(page_count):
+                    yield _process_page(self.doc, plumber_pdf, page_num, self.profile)
+            finally:
+                if plumber_pdf is not None:
+                    plumber_pdf.close()
+            return
+        # spawn rather than fork: the server process is multi-threaded.
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker, initargs=(self.file_path, self.profile)) as pool:
+            pending = deque()
+            next_page = 0
+            while next_page < page_count or pending:
+                while next_page < page_count and len(pending) < max_in_flight:
+                    pending.append(pool.submit(_process_page_in_worker, next_page))
+                    next_page += 1
+                yield pending.popleft().result()
+
     def preprocess_document(self) -> Dict[str, Any]:
         """
         Combines structured text, tables, images, and metadata for each page into a unified structure.
         Handles various encodings and maintains page number mapping.
-        Returns a dict with metadata and a list of pages.
+        Returns a dict with metadata and a list of pages. Use iter_pages to avoid holding the whole document in memory.
         """
-        structured_text_pages = self.extract_structured_text_by_page()
-        table_pages = self.extract_tables_by_page()
-        image_pages = self.extract_images_by_page()
-        metadata = self.extract_metadata()
-        page_count = metadata.get('page_count', len(structured_text_pages))
-        document = []
-        for i in range(page_count):
-            block_texts = [block["text"] for block in structured_text_pages[i]["blocks"] if "text" in block]
-            page_text = " ".join(block_texts)
-            chunk_id = f"{metadata.get('document_id', str(uuid.uuid4()))}_page_{i+1}"
-            doc_id = metadata.get("document_id") or self.file_path.split("/")[-1].split(".")[0]
-            page_data = {
-                "chunk_id": chunk_id,
-                "page": i + 1,
-                "text": page_text,
-                "blocks": structured_text_pages[i]["blocks"] if i < len(structured_text_pages) else [],
-                "tables": table_pages[i]["tables"] if i < len(table_pages) else [],
-                "images": image_pages[i]["images"] if i < len(image_pages) else [],
-                "metadata": {**{k: v for k, v in metadata.items() if v is not None}, "document_id": doc_id}
-            }
-            document.append(page_data)
         return {
-            "metadata": metadata,
-            "pages": document
+            "metadata": self.extract_metadata(),
+            "pages": list(self.iter_pages())
         }
 
     def close(self):
@@ -0,0 +1,150 @@
+import re
+import logging
+import threading
+from functools import lru_cache
+from typing import Dict, FrozenSet, List, Optional, Set
+
+logger = logging.getLogger("chat_with_pdf_api")
+
+# Checked in this order; the first category whose keywords or patterns match wins.
+CATEGORY_ORDER = ("summary", "data", "table", "figure")
+SEED_KEYWORDS: Dict[str, Set[str]] = {
+    "summary": {"summarize", "overview", "explain", "summary", "describe", "outline", "gist", "recap", "synthesis"},
+    "data": {"data", "dataset", "value", "values", "statistics", "statistic", "number", "numbers", "amount", "total", "average", "mean", "median", "distribution", "frequency", "percent", "percentage", "proportion", "ratio", "count", "trend", "increase", "decrease", "growth", "decline"},
+    "table": {"table", "tabular", "spreadsheet", "grid", "matrix", "sheet"},
+    "figure": {"figure", "chart", "graph", "plot", "diagram", "visualization", "image", "illustration", "picture", "map"},
+}
+PATTERNS: Dict[str, List[str]] = {
+    "summary": [r"summar(y|ize|ise)", r"overview", r"explain", r"describe", r"outline", r"gist", r"recap", r"synthesi(s|ze)"],
+    "data": [r"data", r"stat(s|istics)?", r"number(s)?", r"amount", r"total", r"average", r"mean", r"median", r"distribution", r"frequency", r"percent(age)?", r"proportion", r"ratio", r"count", r"trend", r"increase", r"decrease", r"growth", r"decline"],
+    "table": [r"table", r"tabular", r"spreadsheet", r"grid", r"matrix", r"sheet"],
+    "figure": [r"figure", r"chart", r"graph", r"plot", r"diagram", r"visualization", r"image", r"illustration", r"picture", r"map"],
+}
+# Fallback for questions that ask for numbers without naming them.
+DATA_QUESTION_PATTERN = re.compile(r"show me|list all|how many|what is the (average|mean|median|total|sum|count)")
+TOKEN_PATTERN = re.compile(r'\w+')
+# Words never substituted when building query variants.
+VARIANT_STOPWORDS = frozenset({"what", "which", "where", "when", "does", "about", "there", "their", "this", "that", "these", "those", "with", "from", "into", "have", "show", "tell", "give", "list", "many", "much"})
+QUERY_CACHE_SIZE = 4096
+
+
+def _load_wordnet():
+    """Returns (wordnet, lemmatizer), or (None, None) if the WordNet corpus is not installed."""
+    try:
+        from nltk.corpus import wordnet
+        from nltk.stem import WordNetLemmatizer
+        # The corpus loads lazily on first access; trigger it here rather than on a user query.
+        wordnet.synsets("table")
+        return wordnet, WordNetLemmatizer()
+    except LookupError:
+        logger.warning("WordNet corpus not found (nltk.download('wordnet')); classifying with seed keywords only")
+        return None, None
+
+
+class QueryClassifier:
+    """
+    Query classification and expansion with everything expensive done once: WordNet synonym sets are
+    expanded into frozen sets, the regexes are compiled into a single alternation (one named group per
+    category), and results are memoized per query.
+    Categories: summary, data, table, figure, qa (default)
+    """
+    def __init__(self):
+        self.wordnet, self.lemmatizer = _load_wordnet()
+        self.keywords: Dict[str, FrozenSet[str]] = {
+            category: frozenset(self._expand(words)) for category, words in SEED_KEYWORDS.items()
+        }
+        # A lookahead at every position tries the categories in priority order, so scanning all matches
+        # yields every category that matches anywhere, each position reporting its highest-priority one.
+        alternation = "|".join(f"(?P<{category}>{'|'.join(PATTERNS[category])})" for category in CATEGORY_ORDER)
+        self.pattern = re.compile(f"(?=(?:{alternation}))")
+        self.classify = lru_cache(maxsize=QUERY_CACHE_SIZE)(self._classify)
+        self._expand_token = lru_cache(maxsize=QUERY_CACHE_SIZE)(self._expand_token_uncached)
+        self._synonyms = lru_cache(maxsize=QUERY_CACHE_SIZE)(self._synonyms)
+
+    def _expand(self, words: Set[str]) -> Set[str]:
+        expanded = set(words)
+        if self.wordnet is not None:
+            for word in words:
+                for syn in self.wordnet.synsets(word):
+                    for lemma in syn.lemmas():
+                        expanded.add(lemma.name().replace('_', ' '))
+        return expanded
+
+    def _lemmatize(self, token: str) -> str:
+        return self.lemmatizer.lemmatize(token) if self.lemmatizer is not None else token
+
+    def _classify(self, query: str) -> str:
+        query_lc = query.lower()
+        tokens = TOKEN_PATTERN.findall(query_lc)
+        words = set(tokens) | {self._lemmatize(token) for token in tokens}
+        matched = {category for category in CATEGORY_ORDER if not self.keywords[category].isdisjoint(words)}
+        for match in self.pattern.finditer(query_lc):
+            matched.add(match.lastgroup)
+            if "summary" in matched:
+                break
+        for category in CATEGORY_ORDER:
+            if category in matched:
+                return category
+        if DATA_QUESTION_PATTERN.search(query_lc):
+            return "data"
+        return "qa"
+
+    def _expand_token_uncached(self, token: str) -> FrozenSet[str]:
+        expansions = {self._lemmatize(token)}
+        if self.wordnet is not None:
+            for syn in self.wordnet.synsets(token):
+                for lemma_obj in syn.lemmas():
+                    expansions.add(lemma_obj.name().replace('_', ' '))
+        return frozenset(expansions)
+
+    def _synonyms(self, token: str) -> List[str]:
+        """WordNet synonyms of token, most common senses first."""
+        synonyms: List[str] = []
+        if self.wordnet is not None:
+            for syn in self.wordnet.synsets(token):
+                for lemma_obj in syn.lemmas():
+                    name = lemma_obj.name().replace('_', ' ').lower()
+                    if name != token and name not in synonyms:
+                        synonyms.append(name)
+        return synonyms
+
+    def variants(self, query: str, max_variants: int = 3) -> List[str]:
+        """
+        Up to max_variants rephrasings of the query for multi-query retrieval: the lemmatized query,
+        then the query with one content word replaced by a synonym, taking the most common sense
+        of each word in turn before any second synonym.
+        """
+        tokens = TOKEN_PATTERN.findall(query.lower())
+        candidates: List[str] = []
+        lemmatized = " ".join(self._lemmatize(token) for token in tokens)
+        if lemmatized != " ".join(tokens):
+            candidates.append(lemmatized)
+        options = [(i, self._synonyms(token)) for i, token in enumerate(tokens) if len(token) > 3 and token not in VARIANT_STOPWORDS]
+        depth = 0
+        while len(candidates) < max_variants and any(depth < len(syns) for _, syns in options):
+            for i, syns in options:
+                if depth < len(syns) and len(candidates) < max_variants:
+                    candidates.append(" ".join(tokens[:i] + [syns[depth]] + tokens[i + 1:]))
+            depth += 1
+        return candidates[:max_variants]
+
+    def expand(self, query: str) -> List[str]:
+        """The query plus lemmas and WordNet synonyms of its tokens."""
+        expansions = {query}
+        for token in TOKEN_PATTERN.findall(query.lower()):
+            expansions |= self._expand_token(token)
+        return list(expansions)
+
+
+_classifier: Optional[QueryClassifier] = None
+_classifier_lock = threading.Lock()
+
+
+def get_query_classifier() -> QueryClassifier:
+    """Process-wide classifier, built on first use (or at startup via warm_up)."""
+    global _classifier
+    if _classifier is None:
+        with _classifier_lock:
+            if _classifier is None:
+                _classifier = QueryClassifier()
+    return _classifier
@@ -0,0 +1,107 @@
+import os
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("chat_with_pdf_api")
+
+QUERY_BATCHING_ENABLED = os.environ.get("QUERY_BATCHING_ENABLED", "true").lower() == "true"
+# How long the worker waits for more queries to join a batch, and the largest batch it encodes at once.
+QUERY_BATCH_WINDOW_MS = float(os.environ.get("QUERY_BATCH_WINDOW_MS", "3"))
+QUERY_MAX_BATCH = int(os.environ.get("QUERY_MAX_BATCH", "32"))
+
+
+class QueryEmbeddingBatcher:
+    """
+    Encodes query texts from all concurrent retrievals together. Callers block on a future while a
+    single worker thread collects requests for up to batch_window_ms (or max_batch texts), runs one
+    encode over the distinct texts and hands each caller its vectors. One batched forward pass uses
+    the CPU better than many batch-of-one calls contending for the GIL. The window is only waited
+    for while the previous batch showed concurrent requests, so a lone query is not delayed.
+    """
+    def __init__(self, embedder, batch_window_ms: float = QUERY_BATCH_WINDOW_MS, max_batch: int = QUERY_MAX_BATCH):
+        self.embedder = embedder
+        self.batch_window = batch_window_ms / 1000
+        self.max_batch = max_batch
+        self._queue: "queue.Queue[Optional[Tuple[List[str], Future]]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+        self.batches = 0
+        self.texts = 0
+        self._last_batch_requests = 0
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="query-embedder", daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            requests = [item]
+            size = len(item[0])
+            window = self.batch_window if self._last_batch_requests > 1 else 0.0
+            deadline = time.monotonic() + window
+            stop = False
+            while size < self.max_batch:
+                timeout = deadline - time.monotonic()
+                try:
+                    # Requests already queued always join; past the deadline nothing more is waited for.
+                    item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                requests.append(item)
+                size += len(item[0])
+            self._last_batch_requests = len(requests)
+            self._encode_batch(requests)
+            if stop:
+                return
+
+    def _encode_batch(self, requests: List[Tuple[List[str], Future]]):
+        # Identical queries in flight at the same time are encoded once.
+        distinct = list(dict.fromkeys(text for texts, _ in requests for text in texts))
+        try:
+            vectors = self.embedder.encode(distinct, batch_size=max(len(distinct), 1), show_progress_bar=False, convert_to_numpy=True).tolist()
+        except Exception as e:
+            logger.error(f"Query embedding batch of {len(distinct)} texts failed: {e}")
+            for _, future in requests:
+                future.set_exception(e)
+            return
+        self.batches += 1
+        self.texts += len(distinct)
+        by_text = dict(zip(distinct, vectors))
+        for texts, future in requests:
+            future.set_result([by_text[text] for text in texts])
+
+    def encode(self, texts: List[str]) -> List[List[float]]:
+        """Embeddings for texts, in order; blocks until the batch containing them is encoded."""
+        if not texts:
+            return []
+        self._ensure_worker()
+        future: Future = Future()
+        self._queue.put((list(texts), future))
+        return future.result()
+
+    def close(self):
+        with self._lock:
+            worker = self._worker
+            self._worker = None
+        if worker is not None and worker.is_alive():
+            self._queue.put(None)
+            worker.join(timeout=5)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "texts": self.texts,
+            "mean_batch": round(self.texts / self.batches, 2) if self.batches else None,
+        }
@@ -1,48 +1,99 @@
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from .vector_store import VectorStore
+from .query_classifier import get_query_classifier
+from .reranker import CrossEncoderReranker, RERANK_CANDIDATE_FACTOR
+from app.utils.token_budget import HISTORY_SHARE, count_tokens, pack_by_value, rank_value, take_recent
+import os
 import re
-from nltk.corpus import wordnet
-from nltk.stem import WordNetLemmatizer
+import json
+
+# Multi-query retrieval: also search up to MULTI_QUERY_VARIANTS rephrasings of the query (see expansion_queries).
+MULTI_QUERY_ENABLED = os.environ.get("RAG_MULTI_QUERY", "false").lower() == "true"
+MULTI_QUERY_VARIANTS = int(os.environ.get("RAG_MULTI_QUERY_VARIANTS", "3"))
+# Table chunks searched separately (and ranked first) for queries classified as "table".
+TABLE_FIRST_RESULTS = 3
 
 class RAGEngine:
-    def __init__(self, vector_store: VectorStore, collection_name: str):
+    def __init__(self, vector_store: VectorStore, collection_name: str, reranker: Optional[CrossEncoderReranker] = None):
         self.vector_store = vector_store
         self.collection_name = collection_name
+        self.reranker = reranker
 
-    def retrieve(self, query: str, n_results: int = 5, filters: Optional[Dict[str, Any]] = None, similarity_threshold: Optional[float] = None) -> List[Dict[str, Any]]:
+    def retrieve(self, query: str, n_results: int = 5, filters: Optional[Dict[str, Any]] = None, similarity_threshold: Optional[float] = None, multi_query: bool = MULTI_QUERY_ENABLED, **fusion_options) -> List[Dict[str, Any]]:
+        """
+        Retrieves the top n_results chunks for a query.
+        fusion_options (fusion, candidate_pool, semantic_weight, keyword_weight, rrf_k, expansion_weight) are passed to VectorStore.hybrid_query.
+        multi_query also searches rephrasings of the query (expansion_queries) in the same batched semantic search.
+        With a reranker, a wider candidate pool is re-scored by the cross-encoder within its time budget.
+        Results are cached per (collection, query, filters, n_results, options) until the collection changes.
+        """
+        if multi_query:
+            fusion_options["expansions"] = self.expansion_queries(query)
+        cache_key = (
+            self.collection_name, query, json.dumps(filters, sort_keys=True, default=str), n_results,
+            similarity_threshold, json.dumps(fusion_options, sort_keys=True, default=str), self.reranker is not None
+        )
+        # Picks up ingests and deletes by other worker processes (dropping stale cached results) first.
+        self.vector_store.get_keyword_index(self.collection_name)
+        cached = self.vector_store.retrieval_cache.get(cache_key)
+        if cached is not None:
+            return [dict(r) for r in cached]
+        ranked, complete = self._retrieve(query, n_results, filters, similarity_threshold, **fusion_options)
+        # A re-ranking that ran out of time is not cached, so the next identical query gets the re-ranked order.
+        if complete:
+            self.vector_store.retrieval_cache.set(cache_key, [dict(r) for r in ranked])
+        return ranked
+
+    def _retrieve(self, query: str, n_results: int, filters: Optional[Dict[str, Any]], similarity_threshold: Optional[float], **fusion_options) -> Tuple[List[Dict[str, Any]], bool]:
+        """Returns (ranked results, complete); complete is False if re-ranking fell back to the first-stage order."""
+        category = self.classify_query(query)
+        # With a re-ranker, fetch a wider first-stage pool for it to reorder.
+        candidate_count = n_results * RERANK_CANDIDATE_FACTOR if self.reranker is not None else n_results
         initial_results = self.vector_store.hybrid_query(
-            self.collection_name, query, n_results=n_results*2, filters=filters, similarity_threshold=similarity_threshold
+            self.collection_name, query, n_results=candidate_count, filters=filters, similarity_threshold=similarity_threshold, **fusion_options
         )
-        collection = self.vector_store.get_or_create_collection(self.collection_name)
-        all_docs = collection.get()
-        if all_docs['documents']:
-            first_chunk = {
-                'id': all_docs['ids'][0],
-                'text': all_docs['documents'][0],
-                'metadata': all_docs['metadatas'][0],
-                'hybrid_score': 1000,
-                'context_score': 1000
-            }
-            if not any(c['id'] == first_chunk['id'] for c in initial_results):
+        # Table questions: also search the table chunks on their own and rank them ahead of prose.
+        prefer_tables = filters is None and category == "table"
+        if prefer_tables:
+            table_results = self.vector_store.hybrid_query(
+                self.collection_name, query, n_results=TABLE_FIRST_RESULTS, filters={"type": "table"}, similarity_threshold=similarity_threshold, **fusion_options
+            )
+            seen = {r['id'] for r in initial_results}
+            initial_results += [r for r in table_results if r['id'] not in seen]
+        # Summary questions: the document opening (title, abstract) is a candidate even if it shares no terms with the query.
+        if filters is None and category == "summary":
+            first_chunk = self.vector_store.get_first_chunk(self.collection_name)
+            if first_chunk and not any(c['id'] == first_chunk['id'] for c in initial_results):
+                first_chunk['hybrid_score'] = initial_results[0]['hybrid_score'] if initial_results else 0.0
+                first_chunk['keyword_score'] = 0.0
+                first_chunk['distance'] = None
                 initial_results = [first_chunk] + initial_results
         query_keywords = set(re.findall(r'\w+', query.lower()))
         for r in initial_results:
             chunk_keywords = set(re.findall(r'\w+', r['text'].lower()))
             r['context_score'] = len(query_keywords & chunk_keywords)
         ranked = sorted(initial_results, key=lambda x: (x['hybrid_score'], x['context_score']), reverse=True)
-        return ranked[:n_results]
+        complete = True
+        if self.reranker is not None:
+            ranked, complete = self.reranker.rerank(query, ranked)
+        if prefer_tables:
+            # Stable sort: tables first, each group keeping its order.
+            ranked = sorted(ranked, key=lambda x: x['metadata'].get('type') == 'table', reverse=True)
+        return ranked[:n_results], complete
+
+    @staticmethod
+    def _format_chunk(chunk: Dict[str, Any]) -> str:
+        return f"[Page {chunk['metadata'].get('page', '?')}] {chunk['text']}"
+
+    def _pack_chunks(self, chunks: List[Dict[str, Any]], budget: int) -> str:
+        """Chunks (ranked best first) packed into budget tokens by relevance per token, kept in rank order."""
+        texts = [self._format_chunk(chunk) for chunk in chunks]
+        chosen = pack_by_value([(text, rank_value(rank)) for rank, text in enumerate(texts)], budget)
+        return "\n".join(texts[i] for i in chosen)
 
     def aggregate_context(self, chunks: List[Dict[str, Any]], max_tokens: int = 2000) -> str:
-        context = ""
-        token_count = 0
-        for chunk in chunks:
-            chunk_text = f"[Page {chunk['metadata'].get('page', '?')}] {chunk['text']}\n"
-            tokens = len(chunk_text.split())
-            if token_count + tokens > max_tokens:
-                break
-            context += chunk_text
-            token_count += tokens
-        return context.strip()
+        """Retrieved chunks that fit in max_tokens model tokens (see app.utils.token_budget)."""
+        return self._pack_chunks(chunks, max_tokens).strip()
 
     def create_prompt(self, query: str, context: str, mode: str = "chat") -> str:
         if mode == "deep-dive":
@@ -63,101 +114,43 @@ class RAGEngine:
 
     def expand_query(self, query: str) -> List[str]:
         """
-        Production-grade query expansion using WordNet synonyms and lemmatization.
+        Production-grade query expansion using WordNet synonyms and lemmatization (memoized per token).
         """
-        lemmatizer = WordNetLemmatizer()
-        tokens = re.findall(r'\w+', query.lower())
-        expansions = set([query])
-        for token in tokens:
-            lemma = lemmatizer.lemmatize(token)
-            expansions.add(lemma)
-            for syn in wordnet.synsets(token):
-                for lemma_obj in syn.lemmas():
-                    expansions.add(lemma_obj.name().replace('_', ' '))
-        expanded_queries = set()
-        for exp in expansions:
-            if isinstance(exp, str):
-                expanded_queries.add(exp)
-            elif isinstance(exp, (list, tuple)):
-                expanded_queries.add(' '.join(exp))
-        return list(expanded_queries)
+        return get_query_classifier().expand(query)
+
+    def expansion_queries(self, query: str, max_variants: int = MULTI_QUERY_VARIANTS) -> List[str]:
+        """Top rephrasings of the query (lemmatized form, then synonym substitutions) for multi-query retrieval."""
+        return get_query_classifier().variants(query, max_variants)
 
     def classify_query(self, query: str) -> str:
         """
         Production-grade query classification using NLP, expanded keyword sets, synonym expansion, and regex patterns.
-        Categories: summary, data, table, figure, statistics, qa (default)
+        Categories: summary, data, table, figure, qa (default). Built once and memoized per query, see QueryClassifier.
         """
-        lemmatizer = WordNetLemmatizer()
-        query_lc = query.lower()
-        tokens = re.findall(r'\w+', query_lc)
-        lemmas = set(lemmatizer.lemmatize(token) for token in tokens)
-
-        summary_keywords = {"summarize", "overview", "explain", "summary", "describe", "outline", "gist", "recap", "synthesis"}
-        data_keywords = {"data", "dataset", "value", "values", "statistics", "statistic", "number", "numbers", "amount", "total", "average", "mean", "median", "distribution", "frequency", "percent", "percentage", "proportion", "ratio", "count", "trend", "increase", "decrease", "growth", "decline"}
-        table_keywords = {"table", "tabular", "spreadsheet", "grid", "matrix", "sheet"}
-        figure_keywords = {"figure", "chart", "graph", "plot", "diagram", "visualization", "image", "illustration", "picture", "map"}
+        return get_query_classifier().classify(query)
 
-        def expand_with_wordnet(keywords):
-            expanded = set(keywords)
-            for word in keywords:
-                for syn in wordnet.synsets(word):
-                    for lemma in syn.lemmas():
-                        expanded.add(lemma.name().replace('_', ' '))
-            return expanded
-
-        summary_set = expand_with_wordnet(summary_keywords)
-        data_set = expand_with_wordnet(data_keywords)
-        table_set = expand_with_wordnet(table_keywords)
-        figure_set = expand_with_wordnet(figure_keywords)
-
-        summary_patterns = [r"summar(y|ize|ise)", r"overview", r"explain", r"describe", r"outline", r"gist", r"recap", r"synthesi(s|ze)"]
-        data_patterns = [r"data", r"stat(s|istics)?", r"number(s)?", r"amount", r"total", r"average", r"mean", r"median", r"distribution", r"frequency", r"percent(age)?", r"proportion", r"ratio", r"count", r"trend", r"increase", r"decrease", r"growth", r"decline"]
-        table_patterns = [r"table", r"tabular", r"spreadsheet", r"grid", r"matrix", r"sheet"]
-        figure_patterns = [r"figure", r"chart", r"graph", r"plot", r"diagram", r"visualization", r"image", r"illustration", r"picture", r"map"]
-
-        def match_keywords(keywords):
-            return any(word in tokens or word in lemmas for word in keywords)
-
-        def match_patterns(patterns):
-            return any(re.search(p, query_lc) for p in patterns)
-
-        if match_keywords(summary_set) or match_patterns(summary_patterns):
-            return "summary"
-        if match_keywords(data_set) or match_patterns(data_patterns):
-            return "data"
-        if match_keywords(table_set) or match_patterns(table_patterns):
-            return "table"
-        if match_keywords(figure_set) or match_patterns(figure_patterns):
-            return "figure"
-        if re.search(r"show me|list all|how many|what is the (average|mean|median|total|sum|count)", query_lc):
-            return "data"
-        return "qa"
-
-    def aggregate_conversation_context(self, conversation_history: List[str], retrieved_chunks: List[Dict[str, Any]], max_tokens: int = 2000, max_turns: int = 5) -> str:
+    def aggregate_conversation_context(self, conversation_history: List[str], retrieved_chunks: List[Dict[str, Any]], max_tokens: int = 2000, max_turns: int = 5, summary: Optional[str] = None, history_tokens: Optional[int] = None) -> str:
         """
         Sliding window context aggregation for multi-turn chat.
-        Includes the most recent N conversation turns and retrieved document context, truncated to fit max_tokens.
+        Includes the rolling summary of older turns, the most recent N conversation turns and retrieved document context, truncated to fit max_tokens.
         Args:
             conversation_history: List of previous user/assistant messages (strings, most recent last).
             retrieved_chunks: List of retrieved document chunks (as in aggregate_context).
             max_tokens: Maximum total tokens for the context window.
             max_turns: Maximum number of conversation turns to include.
+            summary: Stored summary of the turns before the window, if any.
+            history_tokens: Cap on tokens spent on summary and turns (default: HISTORY_SHARE of max_tokens); the rest goes to chunks.
         Returns:
             Aggregated context string for LLM input.
         """
+        history_budget = min(max_tokens, history_tokens if history_tokens is not None else int(max_tokens * HISTORY_SHARE))
+        summary_text = f"Summary of earlier conversation:\n{summary}\n\nRecent turns:\n" if summary else ""
+        summary_tokens = count_tokens(summary_text)
+        if summary_tokens > history_budget:
+            summary_text, summary_tokens = "", 0
         selected_turns = conversation_history[-max_turns:] if max_turns > 0 else conversation_history
-        conversation_text = "\n".join(selected_turns)
-        conversation_tokens = len(conversation_text.split())
-
-        doc_context = ""
-        doc_tokens = 0
-        for chunk in retrieved_chunks:
-            chunk_text = f"[Page {chunk['metadata'].get('page', '?')}] {chunk['text']}\n"
-            tokens = len(chunk_text.split())
-            if conversation_tokens + doc_tokens + tokens > max_tokens:
-                break
-            doc_context += chunk_text
-            doc_tokens += tokens
-
+        turns, turn_tokens = take_recent(selected_turns, history_budget - summary_tokens)
+        conversation_text = summary_text + "\n".join(turns)
+        doc_context = self._pack_chunks(retrieved_chunks, max_tokens - summary_tokens - turn_tokens)
         context = f"Conversation:\n{conversation_text}\n\nDocument Context:\n{doc_context.strip()}"
         return context.strip()
@@ -0,0 +1,216 @@
+import os
+import time
+import logging
+import resource
+import threading
+from typing import Dict, Any, Optional
+
+import chromadb
+from chromadb import Settings
+
+from .vector_store import VectorStore
+from .llm_client import LLMClient
+from .embedding_cache import EmbeddingCache
+from .embedders import create_embedder, EMBEDDING_BACKEND
+from .query_embedder import QueryEmbeddingBatcher, QUERY_BATCHING_ENABLED
+from .query_classifier import get_query_classifier
+from .reranker import CrossEncoderReranker, RERANK_ENABLED
+from .summarizer import ConversationSummarizer, LLMSummarizer, LocalSummarizer, CONVERSATION_SUMMARIZER
+
+logger = logging.getLogger("chat_with_pdf_api")
+
+DEFAULT_PERSIST_DIRECTORY = "chroma_db"
+DEFAULT_EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+EMBED_CACHE_ENABLED = os.environ.get("EMBED_CACHE_ENABLED", "true").lower() == "true"
+
+
+def _resident_memory_mb() -> Optional[float]:
+    """
+    Current resident set size of this process in MB.
+    Reads /proc on Linux and falls back to the peak RSS reported by getrusage.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        # ru_maxrss is in KB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    except Exception:
+        return None
+
+
+class ServiceRegistry:
+    """
+    Process-wide registry for expensive shared services (embedding model, Chroma client, VectorStore, LLM client).
+    Everything is created lazily once and reused by all routers; warm_up() is called at startup
+    so the first request does not pay for model loading.
+    """
+    def __init__(self, persist_directory: str = DEFAULT_PERSIST_DIRECTORY, embedding_model: str = DEFAULT_EMBEDDING_MODEL, embedding_backend: str = EMBEDDING_BACKEND):
+        self.persist_directory = persist_directory
+        self.embedding_model = embedding_model
+        self.embedding_backend = embedding_backend
+        self._lock = threading.RLock()
+        self._embedders: Dict[str, Any] = {}
+        self._chroma_client = None
+        self._vector_store: Optional[VectorStore] = None
+        self._llm_client: Optional[LLMClient] = None
+        self._summarizer: Optional[ConversationSummarizer] = None
+        self._reranker: Optional[CrossEncoderReranker] = None
+        self._query_batcher: Optional[QueryEmbeddingBatcher] = None
+        self.load_times: Dict[str, float] = {}
+        self.warmed_up = False
+
+    def _timed(self, name: str, factory):
+        start = time.perf_counter()
+        instance = factory()
+        self.load_times[name] = round((time.perf_counter() - start) * 1000, 2)
+        logger.info(f"Loaded {name} in {self.load_times[name]:.2f}ms")
+        return instance
+
+    def get_embedder(self, model_name: Optional[str] = None):
+        """The embedder for model_name on the configured backend (see services.embedders)."""
+        model_name = model_name or self.embedding_model
+        with self._lock:
+            if model_name not in self._embedders:
+                self._embedders[model_name] = self._timed(
+                    f"embedder:{model_name}@{self.embedding_backend}", lambda: create_embedder(model_name, self.embedding_backend)
+                )
+            return self._embedders[model_name]
+
+    def get_chroma_client(self):
+        with self._lock:
+            if self._chroma_client is None:
+                chroma_server = os.environ.get("CHROMA_SERVER", "false").lower() == "true"
+                if chroma_server:
+                    # ChromaDB server (Docker Compose setup)
+                    factory = lambda: chromadb.HttpClient(host="chromadb", port=8000)
+                else:
+                    # Embedded/local ChromaDB (default for local dev)
+                    factory = lambda: chromadb.Client(Settings(
+                        persist_directory=self.persist_directory,
+                        anonymized_telemetry=False
+                    ))
+                self._chroma_client = self._timed("chroma_client", factory)
+            return self._chroma_client
+
+    def get_query_batcher(self) -> Optional[QueryEmbeddingBatcher]:
+        """Shared batcher for query embeddings, or None when QUERY_BATCHING_ENABLED is off."""
+        if not QUERY_BATCHING_ENABLED:
+            return None
+        with self._lock:
+            if self._query_batcher is None:
+                self._query_batcher = QueryEmbeddingBatcher(self.get_embedder())
+            return self._query_batcher
+
+    def get_vector_store(self) -> VectorStore:
+        with self._lock:
+            if self._vector_store is None:
+                self._vector_store = VectorStore(
+                    persist_directory=self.persist_directory,
+                    embedding_model=self.embedding_model,
+                    client=self.get_chroma_client(),
+                    embedder=self.get_embedder(),
+                    embedding_cache=EmbeddingCache() if EMBED_CACHE_ENABLED else None,
+                    query_batcher=self.get_query_batcher(),
+                )
+            return self._vector_store
+
+    def get_llm_client(self) -> LLMClient:
+        with self._lock:
+            if self._llm_client is None:
+                self._llm_client = LLMClient()
+            return self._llm_client
+
+    def get_reranker(self) -> Optional[CrossEncoderReranker]:
+        """The cross-encoder re-ranker, or None when RERANK_ENABLED is off."""
+        if not RERANK_ENABLED:
+            return None
+        with self._lock:
+            if self._reranker is None:
+                self._reranker = CrossEncoderReranker()
+            return self._reranker
+
+    def get_conversation_summarizer(self) -> ConversationSummarizer:
+        with self._lock:
+            if self._summarizer is None:
+                backend = LocalSummarizer() if CONVERSATION_SUMMARIZER == "local" else LLMSummarizer(self.get_llm_client())
+                self._summarizer = ConversationSummarizer(backend)
+            return self._summarizer
+
+    def warm_up(self):
+        """Load the embedder and Chroma client eagerly (called on FastAPI startup)."""
+        start = time.perf_counter()
+        embedder = self.get_embedder()
+        # The first encode call initializes tokenizer and kernels; do it here instead of on a user query.
+        embedder.encode(["warm up"], show_progress_bar=False, convert_to_numpy=True)
+        self.get_vector_store()
+        self._timed("query_classifier", get_query_classifier)
+        reranker = self.get_reranker()
+        if reranker is not None:
+            self._timed(f"reranker:{reranker.model_name}", reranker.warm_up)
+        self.load_times["warm_up"] = round((time.perf_counter() - start) * 1000, 2)
+        self.warmed_up = True
+
+    async def shutdown(self):
+        if self._summarizer is not None:
+            await self._summarizer.shutdown()
+        if self._llm_client is not None:
+            await self._llm_client.aclose()
+        if self._reranker is not None:
+            self._reranker.close()
+        if self._query_batcher is not None:
+            self._query_batcher.close()
+        with self._lock:
+            self._query_batcher = None
+            self._llm_client = None
+            self._summarizer = None
+            self._reranker = None
+            self._vector_store = None
+            self._chroma_client = None
+            self._embedders.clear()
+            self.warmed_up = False
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {
+            "warmed_up": self.warmed_up,
+            "embedding_model": self.embedding_model,
+            "embedding_backend": self.embedding_backend,
+            "load_times_ms": dict(self.load_times),
+            "resident_memory_mb": _resident_memory_mb(),
+        }
+        if self._vector_store is not None:
+            stats["query_embedding_cache"] = self._vector_store.query_embedding_cache.stats()
+            stats["retrieval_cache"] = self._vector_store.retrieval_cache.stats()
+            if self._vector_store.embedding_cache is not None:
+                stats["embedding_cache"] = self._vector_store.embedding_cache.stats()
+        if self._reranker is not None:
+            stats["reranker"] = self._reranker.stats()
+        if self._query_batcher is not None:
+            stats["query_batcher"] = self._query_batcher.stats()
+        return stats
+
+
+registry = ServiceRegistry()
+
+
+def get_vector_store() -> VectorStore:
+    """FastAPI dependency returning the process-wide VectorStore."""
+    return registry.get_vector_store()
+
+
+def get_llm_client() -> LLMClient:
+    """FastAPI dependency returning the process-wide pooled LLMClient."""
+    return registry.get_llm_client()
+
+
+def get_conversation_summarizer() -> ConversationSummarizer:
+    """FastAPI dependency returning the process-wide rolling conversation summarizer."""
+    return registry.get_conversation_summarizer()
+
+
+def get_reranker() -> Optional[CrossEncoderReranker]:
+    """FastAPI dependency returning the process-wide re-ranker (None when disabled)."""
+    return registry.get_reranker()
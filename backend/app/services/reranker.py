@@ -0,0 +1,158 @@
+import os
+import time
+import queue
+import hashlib
+import logging
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.utils.cache import LRUTTLCache
+
+logger = logging.getLogger("chat_with_pdf_api")
+
+RERANK_ENABLED = os.environ.get("RERANK_ENABLED", "false").lower() == "true"
+RERANKER_MODEL = os.environ.get("RERANKER_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+# Per-request wait for scores; past it the first-stage order is used (the scores still land in the cache).
+RERANK_TIME_BUDGET_MS = float(os.environ.get("RERANK_TIME_BUDGET_MS", "150"))
+# How long the worker waits for more requests to join a batch, and the largest batch it scores at once.
+RERANK_BATCH_WINDOW_MS = float(os.environ.get("RERANK_BATCH_WINDOW_MS", "3"))
+RERANK_MAX_BATCH = int(os.environ.get("RERANK_MAX_BATCH", "64"))
+RERANK_CACHE_SIZE = int(os.environ.get("RERANK_CACHE_SIZE", "20000"))
+RERANK_CACHE_TTL = float(os.environ.get("RERANK_CACHE_TTL", "86400"))
+# First-stage candidates fetched per result when re-ranking.
+RERANK_CANDIDATE_FACTOR = int(os.environ.get("RERANK_CANDIDATE_FACTOR", "4"))
+
+
+def _pair_key(query: str, text: str) -> Tuple[str, str]:
+    return query, hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class CrossEncoderReranker:
+    """
+    Second-stage re-ranker scoring (query, chunk) pairs with a small local cross-encoder.
+    A single worker thread owns the model and scores pairs from all concurrent requests in one
+    batch; each request waits at most its time budget and otherwise keeps the first-stage order.
+    Scores are cached per (query, chunk text).
+    """
+    def __init__(self, model=None, model_name: str = RERANKER_MODEL, time_budget_ms: float = RERANK_TIME_BUDGET_MS,
+                 batch_window_ms: float = RERANK_BATCH_WINDOW_MS, max_batch: int = RERANK_MAX_BATCH):
+        self.model_name = model_name
+        self._model = model
+        self.time_budget_ms = time_budget_ms
+        self.batch_window = batch_window_ms / 1000
+        self.max_batch = max_batch
+        self.score_cache = LRUTTLCache(RERANK_CACHE_SIZE, RERANK_CACHE_TTL)
+        self._queue: "queue.Queue[Optional[Tuple[List[Tuple[str, str]], Future]]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+        self.timeouts = 0
+        self.batches = 0
+
+    @property
+    def model(self):
+        with self._lock:
+            if self._model is None:
+                from sentence_transformers import CrossEncoder
+                self._model = CrossEncoder(self.model_name)
+            return self._model
+
+    def warm_up(self):
+        self.model.predict([("warm up", "warm up")], show_progress_bar=False)
+        self._ensure_worker()
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="reranker", daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            requests = [item]
+            size = len(item[0])
+            deadline = time.monotonic() + self.batch_window
+            stop = False
+            while size < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                requests.append(item)
+                size += len(item[0])
+            self._score_batch(requests)
+            if stop:
+                return
+
+    def _score_batch(self, requests: List[Tuple[List[Tuple[str, str]], Future]]):
+        pairs = [pair for request_pairs, _ in requests for pair in request_pairs]
+        try:
+            scores = self.model.predict(pairs, batch_size=self.max_batch, show_progress_bar=False).tolist()
+        except Exception as e:
+            logger.error(f"Re-ranking batch of {len(pairs)} pairs failed: {e}")
+            for _, future in requests:
+                future.set_exception(e)
+            return
+        self.batches += 1
+        offset = 0
+        for request_pairs, future in requests:
+            request_scores = scores[offset:offset + len(request_pairs)]
+            offset += len(request_pairs)
+            for (query, text), score in zip(request_pairs, request_scores):
+                self.score_cache.set(_pair_key(query, text), score)
+            future.set_result(request_scores)
+
+    def score(self, query: str, texts: List[str], time_budget_ms: Optional[float] = None) -> Optional[List[float]]:
+        """Cross-encoder scores for each text, or None if they are not ready within the time budget."""
+        scores: List[Optional[float]] = [self.score_cache.get(_pair_key(query, text)) for text in texts]
+        missing = [i for i, s in enumerate(scores) if s is None]
+        if missing:
+            self._ensure_worker()
+            future: Future = Future()
+            self._queue.put(([(query, texts[i]) for i in missing], future))
+            budget = self.time_budget_ms if time_budget_ms is None else time_budget_ms
+            try:
+                for i, s in zip(missing, future.result(timeout=budget / 1000)):
+                    scores[i] = s
+            except FutureTimeoutError:
+                self.timeouts += 1
+                logger.warning(f"Re-ranking exceeded {budget:.0f}ms for {len(missing)} pairs; keeping first-stage order")
+                return None
+            except Exception:
+                return None
+        return scores
+
+    def rerank(self, query: str, candidates: List[Dict[str, Any]], top_n: Optional[int] = None, time_budget_ms: Optional[float] = None) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Returns (results, reranked). results are the candidates sorted by 'rerank_score' if scoring
+        finished within the budget, else the candidates in their original order; both cut to top_n.
+        """
+        top_n = top_n or len(candidates)
+        if not candidates:
+            return [], True
+        scores = self.score(query, [c['text'] for c in candidates], time_budget_ms)
+        if scores is None:
+            return candidates[:top_n], False
+        for candidate, s in zip(candidates, scores):
+            candidate['rerank_score'] = float(s)
+        return sorted(candidates, key=lambda c: c['rerank_score'], reverse=True)[:top_n], True
+
+    def close(self):
+        with self._lock:
+            worker = self._worker
+            self._worker = None
+        if worker is not None and worker.is_alive():
+            self._queue.put(None)
+            worker.join(timeout=5)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"model": self.model_name, "batches": self.batches, "timeouts": self.timeouts, "score_cache": self.score_cache.stats()}
@@ -0,0 +1,202 @@
+import os
+import asyncio
+import logging
+from collections import deque
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Optional
+
+from starlette.websockets import WebSocket
+
+logger = logging.getLogger("chat_with_pdf_api")
+
+# Tokens arriving within this window (or until the frame reaches STREAM_FLUSH_MAX_CHARS) share one frame.
+# The first frame of an answer is always sent immediately so time to first token is unchanged.
+STREAM_FLUSH_INTERVAL_MS = float(os.environ.get("STREAM_FLUSH_INTERVAL_MS", "30"))
+STREAM_FLUSH_MAX_CHARS = int(os.environ.get("STREAM_FLUSH_MAX_CHARS", "256"))
+# Tokens buffered per socket between the LLM and a client that reads slower than the model writes.
+STREAM_SEND_BUFFER = int(os.environ.get("STREAM_SEND_BUFFER", "256"))
+# When the buffer is full: coalesce = merge into the newest buffered entry and keep reading the LLM,
+# wait = stop reading the LLM until the client catches up, close = give up on the client.
+BUFFER_POLICY_COALESCE = "coalesce"
+BUFFER_POLICY_WAIT = "wait"
+BUFFER_POLICY_CLOSE = "close"
+BUFFER_POLICIES = (BUFFER_POLICY_COALESCE, BUFFER_POLICY_WAIT, BUFFER_POLICY_CLOSE)
+STREAM_BUFFER_POLICY = os.environ.get("STREAM_BUFFER_POLICY", BUFFER_POLICY_COALESCE)
+
+# Close code for a client dropped by the close policy ("try again later").
+SLOW_CLIENT_CLOSE_CODE = 1013
+
+
+class ClientDisconnected(Exception):
+    """The client went away (or a send to it failed) while an answer was streaming."""
+
+
+class SlowClientError(Exception):
+    """The send buffer filled up under the close policy."""
+
+
+class SendBuffer:
+    """Bounded FIFO of text between the LLM reader and the websocket sender."""
+    def __init__(self, max_items: int = STREAM_SEND_BUFFER, policy: str = STREAM_BUFFER_POLICY):
+        if policy not in BUFFER_POLICIES:
+            raise ValueError(f"Unknown buffer policy: {policy}. Expected one of {BUFFER_POLICIES}")
+        self.max_items = max(1, max_items)
+        self.policy = policy
+        self._items: Deque[str] = deque()
+        self._closed = False
+        self._readable = asyncio.Event()
+        self._writable = asyncio.Event()
+        self._writable.set()
+        self.coalesced = 0
+
+    async def put(self, text: str):
+        while len(self._items) >= self.max_items:
+            if self._closed:
+                return
+            if self.policy == BUFFER_POLICY_COALESCE:
+                self._items[-1] += text
+                self.coalesced += 1
+                return
+            if self.policy == BUFFER_POLICY_CLOSE:
+                raise SlowClientError(f"Client is more than {self.max_items} tokens behind")
+            self._writable.clear()
+            await self._writable.wait()
+        self._items.append(text)
+        self._readable.set()
+
+    def close(self):
+        """No more puts; get() returns None once the buffer is drained and a put waiting for room returns."""
+        self._closed = True
+        self._readable.set()
+        self._writable.set()
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[str]:
+        """Next entry, or None when closed and drained. Raises asyncio.TimeoutError after timeout seconds."""
+        # A timer wakes the wait at the deadline instead of asyncio.wait_for, which before Python 3.12
+        # can swallow a cancellation that races with the event being set.
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while not self._items:
+            if self._closed:
+                return None
+            if deadline is not None and loop.time() >= deadline:
+                raise asyncio.TimeoutError()
+            self._readable.clear()
+            timer = loop.call_at(deadline, self._readable.set) if deadline is not None else None
+            try:
+                await self._readable.wait()
+            finally:
+                if timer is not None:
+                    timer.cancel()
+        item = self._items.popleft()
+        self._writable.set()
+        return item
+
+
+class TokenStreamer:
+    """
+    Forwards an LLM token stream to a client as {"token": text} frames.
+    A reader task drains the model into a bounded SendBuffer while a sender task micro-batches it
+    into frames, so a slow client neither gets one frame per token nor (with the coalesce policy)
+    holds the upstream request open. On any exit the token iterator is closed, which aborts the
+    upstream HTTP request; text holds whatever the model produced so far.
+    """
+    def __init__(
+        self,
+        send: Callable[[Dict[str, Any]], Awaitable[None]],
+        flush_interval_ms: float = STREAM_FLUSH_INTERVAL_MS,
+        max_frame_chars: int = STREAM_FLUSH_MAX_CHARS,
+        buffer_size: int = STREAM_SEND_BUFFER,
+        policy: str = STREAM_BUFFER_POLICY
+    ):
+        self.send = send
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_frame_chars = max_frame_chars
+        self.buffer = SendBuffer(buffer_size, policy)
+        self._parts = []
+        self.frames = 0
+
+    @property
+    def text(self) -> str:
+        return "".join(self._parts)
+
+    async def stream(self, tokens: AsyncIterator[str]) -> str:
+        """Streams tokens to the client and returns the full text. Raises ClientDisconnected or SlowClientError."""
+        reader = asyncio.create_task(self._read(tokens))
+        sender = asyncio.create_task(self._send_frames())
+        try:
+            await asyncio.wait({reader, sender}, return_when=asyncio.FIRST_EXCEPTION)
+            if sender.done() and sender.exception() is not None:
+                raise ClientDisconnected(str(sender.exception())) from sender.exception()
+            await reader
+            await sender
+        finally:
+            # Closing first releases a sender or reader blocked on the buffer even if a cancellation is lost.
+            self.buffer.close()
+            for task in (reader, sender):
+                task.cancel()
+            await asyncio.gather(reader, sender, return_exceptions=True)
+        return self.text
+
+    async def _read(self, tokens: AsyncIterator[str]):
+        async with aclosing(tokens):
+            async for token in tokens:
+                if not token:
+                    continue
+                self._parts.append(token)
+                await self.buffer.put(token)
+        self.buffer.close()
+
+    async def _send_frames(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            first = await self.buffer.get()
+            if first is None:
+                return
+            parts, size = [first], len(first)
+            if self.frames:
+                deadline = loop.time() + self.flush_interval
+                while size < self.max_frame_chars:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = await self.buffer.get(remaining)
+                    except asyncio.TimeoutError:
+                        break
+                    if item is None:
+                        break
+                    parts.append(item)
+                    size += len(item)
+            await self.send({"token": "".join(parts)})
+            self.frames += 1
+
+
+async def run_until_disconnect(websocket: WebSocket, work: Awaitable[Any]) -> Any:
+    """
+    Runs work while watching the socket; if the client disconnects first, work is cancelled
+    (aborting any LLM stream inside it) and ClientDisconnected is raised. Frames the client sends
+    meanwhile are ignored, so use this only where the client is not expected to talk.
+    """
+    task = asyncio.ensure_future(work)
+    watcher = asyncio.create_task(_wait_for_disconnect(websocket))
+    try:
+        await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+        if not task.done():
+            raise ClientDisconnected("Client disconnected")
+        return task.result()
+    finally:
+        for t in (task, watcher):
+            t.cancel()
+        await asyncio.gather(task, watcher, return_exceptions=True)
+
+
+async def _wait_for_disconnect(websocket: WebSocket):
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+    except Exception:
+        # receive() after a disconnect raises; either way the client is gone.
+        return
@@ -0,0 +1,120 @@
+import os
+import re
+import asyncio
+import logging
+from typing import List, Optional, Set
+
+from app.models.conversation import ConversationSession, Message
+from app.services.database import conversations_db
+from app.utils.token_budget import count_tokens
+from .llm_client import LLMClient
+
+logger = logging.getLogger("chat_with_pdf_api")
+
+# Fold older turns into the summary once the unsummarized ones exceed this many tokens.
+SUMMARY_TRIGGER_TOKENS = int(os.environ.get("CONVERSATION_SUMMARY_TRIGGER_TOKENS", "1200"))
+# Most recent messages always left verbatim; at least as many as the chat path loads.
+SUMMARY_KEEP_RECENT = int(os.environ.get("CONVERSATION_SUMMARY_KEEP_RECENT", "5"))
+SUMMARY_MAX_TOKENS = int(os.environ.get("CONVERSATION_SUMMARY_MAX_TOKENS", "300"))
+# "llm" calls the chat model; "local" uses the extractive stub (no network, deterministic).
+CONVERSATION_SUMMARIZER = os.environ.get("CONVERSATION_SUMMARIZER", "llm")
+
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
+
+def _truncate_words(text: str, max_words: int) -> str:
+    """Keeps the first max_words words, preserving line breaks."""
+    kept, remaining = [], max_words
+    for line in text.splitlines():
+        words = line.split()
+        if len(words) > remaining:
+            if remaining > 0:
+                kept.append(" ".join(words[:remaining]) + " ...")
+            break
+        kept.append(line)
+        remaining -= len(words)
+    return "\n".join(kept)
+
+
+class LocalSummarizer:
+    """
+    Extractive summarizer: keeps the first sentence of each folded message.
+    Half the budget goes to the previous summary so the earliest context is never pushed out entirely.
+    """
+    async def __call__(self, previous_summary: Optional[str], messages: List[Message], max_tokens: int) -> str:
+        lines = [f"{m.role}: {_SENTENCE_END.split(m.content.strip(), 1)[0]}" for m in messages if m.content.strip()]
+        new_part = _truncate_words("\n".join(lines), max_tokens // 2 if previous_summary else max_tokens)
+        if not previous_summary:
+            return new_part
+        return f"{_truncate_words(previous_summary, max_tokens - count_tokens(new_part))}\n{new_part}"
+
+
+class LLMSummarizer:
+    """Asks the chat model to merge the folded messages into the running summary."""
+    def __init__(self, llm_client: LLMClient):
+        self.llm_client = llm_client
+
+    async def __call__(self, previous_summary: Optional[str], messages: List[Message], max_tokens: int) -> str:
+        transcript = "\n".join(f"{m.role}: {m.content}" for m in messages)
+        prompt = (
+            "You maintain a running summary of a conversation between a user and an assistant about a PDF document.\n"
+            "Update the summary with the new messages. Keep facts, figures, page references, decisions and open questions; "
+            f"drop pleasantries. Answer with the updated summary only, in at most {max_tokens} words.\n\n"
+            f"Current summary:\n{previous_summary or '(none)'}\n\n"
+            f"New messages:\n{transcript}"
+        )
+        summary = await self.llm_client.call_llm(prompt, max_tokens=max_tokens * 2, temperature=0.0)
+        return summary.strip()
+
+
+class ConversationSummarizer:
+    """
+    Rolling summarization: after a turn is saved, messages older than the keep_recent tail are folded
+    into sessions.summary in the background once they exceed trigger_tokens. Chat context is then
+    summary + recent turns, so its size stays bounded however long the conversation gets.
+    """
+    def __init__(self, summarizer, trigger_tokens: int = SUMMARY_TRIGGER_TOKENS, keep_recent: int = SUMMARY_KEEP_RECENT, max_tokens: int = SUMMARY_MAX_TOKENS):
+        self.summarizer = summarizer
+        self.trigger_tokens = trigger_tokens
+        self.keep_recent = keep_recent
+        self.max_tokens = max_tokens
+        self._in_flight: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+
+    def schedule(self, session: ConversationSession) -> Optional[asyncio.Task]:
+        """Starts a background refresh for the session unless one is already running."""
+        if session.session_id in self._in_flight:
+            return None
+        self._in_flight.add(session.session_id)
+        task = asyncio.create_task(self.refresh(session))
+        self._tasks.add(task)
+
+        def _done(t: asyncio.Task):
+            self._tasks.discard(t)
+            self._in_flight.discard(session.session_id)
+        task.add_done_callback(_done)
+        return task
+
+    async def refresh(self, session: ConversationSession) -> bool:
+        """Folds pending messages into the summary if they are over budget. Returns True if a new summary was stored."""
+        try:
+            pending = await conversations_db.run(session.unsummarized_messages, self.keep_recent)
+            if not pending or sum(count_tokens(m.content) for m in pending) < self.trigger_tokens:
+                return False
+            summary = await self.summarizer(session.summary, pending, self.max_tokens)
+            if not summary:
+                return False
+            saved = await conversations_db.run(session.save_summary, summary, pending[-1].id)
+            if saved:
+                logger.info(f"Summarized {len(pending)} messages of conversation {session.session_id} up to message {pending[-1].id}")
+            return saved
+        except Exception as e:
+            # The next turn retries; the chat itself is unaffected.
+            logger.error(f"Conversation summarization failed for {session.session_id}: {e}")
+            return False
+
+    async def shutdown(self):
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
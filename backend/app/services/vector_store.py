@@ -1,16 +1,43 @@
 import chromadb
 from chromadb import Settings
-from sentence_transformers import SentenceTransformer
-from typing import List, Dict, Any, Optional
-import re
+from typing import List, Dict, Any, Optional, Callable
 import os
 import json
+import threading
+from .keyword_index import KeywordIndex
+from .embedding_cache import EmbeddingCache
+from .query_embedder import QueryEmbeddingBatcher
+from .embedders import create_embedder
+from app.utils.fusion import FUSION_MODES, reciprocal_rank_fusion, weighted_score_fusion
+from app.utils.cache import LRUTTLCache
+
+QUERY_EMBEDDING_CACHE_SIZE = int(os.environ.get("QUERY_EMBEDDING_CACHE_SIZE", "2048"))
+QUERY_EMBEDDING_CACHE_TTL = float(os.environ.get("QUERY_EMBEDDING_CACHE_TTL", "86400"))
+RETRIEVAL_CACHE_SIZE = int(os.environ.get("RETRIEVAL_CACHE_SIZE", "1024"))
+RETRIEVAL_CACHE_TTL = float(os.environ.get("RETRIEVAL_CACHE_TTL", "600"))
+
+def _best_distance(result_lists: List[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """Merges semantic result lists, keeping each chunk's smallest distance; closest first."""
+    best: Dict[str, Dict[str, Any]] = {}
+    for results in result_lists:
+        for r in results:
+            if r['id'] not in best or r['distance'] < best[r['id']]['distance']:
+                best[r['id']] = r
+    return sorted(best.values(), key=lambda x: x['distance'])
 
 class VectorStore:
-    def __init__(self, persist_directory: str = "chroma_db", embedding_model: str = "all-MiniLM-L6-v2"):
+    def __init__(self, persist_directory: str = "chroma_db", embedding_model: str = "all-MiniLM-L6-v2", client=None, embedder=None, embedding_cache: Optional[EmbeddingCache] = None, query_batcher: Optional[QueryEmbeddingBatcher] = None):
+        """
+        client/embedder can be injected to share one Chroma client and model across the process
+        (see services.registry); otherwise they are created here, the embedder with the configured
+        EMBEDDING_BACKEND (see services.embedders). embedding_cache, if given, lets
+        chunks whose text was embedded before reuse the stored vector. query_batcher, if given,
+        encodes query embeddings together with those of concurrent requests.
+        """
         self.persist_directory = persist_directory
-        chroma_server = os.environ.get("CHROMA_SERVER", "false").lower() == "true"
-        if chroma_server:
+        if client is not None:
+            self.client = client
+        elif os.environ.get("CHROMA_SERVER", "false").lower() == "true":
             # ChromaDB server (Docker Compose setup)
             self.client = chromadb.HttpClient(host="chromadb", port=8000)
         else:
@@ -20,16 +47,34 @@ class VectorStore:
                 anonymized_telemetry=False
             ))
         self.embedding_model = embedding_model
-        self.embedder = SentenceTransformer(embedding_model)
+        self.embedder = embedder if embedder is not None else create_embedder(embedding_model)
+        # Cached chunk vectors are keyed by backend too, so int8 vectors never mix with torch ones.
+        self.embedding_namespace = getattr(self.embedder, "name", embedding_model)
+        self.embedding_cache = embedding_cache
+        self.query_batcher = query_batcher
+        # query text -> embedding, and (collection, query, filters, n, options) -> ranked results (see RAGEngine.retrieve)
+        self.query_embedding_cache = LRUTTLCache(QUERY_EMBEDDING_CACHE_SIZE, QUERY_EMBEDDING_CACHE_TTL)
+        self.retrieval_cache = LRUTTLCache(RETRIEVAL_CACHE_SIZE, RETRIEVAL_CACHE_TTL)
+        self._keyword_indexes: Dict[str, KeywordIndex] = {}
+        self._index_lock = threading.Lock()
 
     def get_or_create_collection(self, name: str):
         return self.client.get_or_create_collection(name)
 
-    def embed_chunks(self, chunks: List[Dict[str, Any]]) -> List[List[float]]:
+    def embed_chunks(self, chunks: List[Dict[str, Any]], batch_size: int = 32) -> List[List[float]]:
         texts = [chunk['text'] for chunk in chunks]
-        return self.embedder.encode(texts, show_progress_bar=False, convert_to_numpy=True).tolist()
+        if self.embedding_cache is None:
+            return self.embedder.encode(texts, batch_size=batch_size, show_progress_bar=False, convert_to_numpy=True).tolist()
+        embeddings = self.embedding_cache.get_many(self.embedding_namespace, texts)
+        missing = [i for i in range(len(texts)) if i not in embeddings]
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            vectors = self.embedder.encode(missing_texts, batch_size=batch_size, show_progress_bar=False, convert_to_numpy=True).tolist()
+            self.embedding_cache.put_many(self.embedding_namespace, missing_texts, vectors)
+            embeddings.update(zip(missing, vectors))
+        return [embeddings[i] for i in range(len(texts))]
 
-    def add_chunks(self, collection_name: str, chunks: List[Dict[str, Any]]):
+    def add_chunks(self, collection_name: str, chunks: List[Dict[str, Any]], persist_index: bool = True):
         collection = self.get_or_create_collection(collection_name)
         embeddings = self.embed_chunks(chunks)
         ids = [chunk['chunk_id'] for chunk in chunks]
@@ -41,69 +86,195 @@ class VectorStore:
             metadatas=metadatas,
             documents=documents
         )
+        index = self.get_keyword_index(collection_name)
+        index.add(ids, documents)
+        if persist_index:
+            index.save()
+        self.invalidate_cached_results(collection_name)
+
+    def invalidate_cached_results(self, collection_name: str):
+        """Drops cached retrieval results for a collection whose contents changed."""
+        self.retrieval_cache.invalidate(lambda key: key[0] == collection_name)
 
-    def add_chunks_batch(self, collection_name: str, chunks: List[Dict[str, Any]], batch_size: int = 100):
+    def encode_query(self, query_text: str) -> List[float]:
+        """Embeds a query, reusing the embedding of an identical earlier query."""
+        return self.encode_queries([query_text])[0]
+
+    def encode_queries(self, query_texts: List[str]) -> List[List[float]]:
+        """Embeds several queries with one batched encode call for those not already cached."""
+        embeddings = [self.query_embedding_cache.get(text) for text in query_texts]
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            texts = [query_texts[i] for i in missing]
+            if self.query_batcher is not None:
+                vectors = self.query_batcher.encode(texts)
+            else:
+                vectors = self.embedder.encode(texts, show_progress_bar=False, convert_to_numpy=True).tolist()
+            for i, vector in zip(missing, vectors):
+                self.query_embedding_cache.set(query_texts[i], vector)
+                embeddings[i] = vector
+        return embeddings
+
+    def add_chunks_batch(self, collection_name: str, chunks: List[Dict[str, Any]], batch_size: int = 100, on_batch: Optional[Callable[[int], None]] = None):
         """
         Add chunks in batches for large documents.
+        on_batch, if given, is called with the number of chunks written after each batch.
         """
         for i in range(0, len(chunks), batch_size):
-            self.add_chunks(collection_name, chunks[i:i+batch_size])
+            batch = chunks[i:i+batch_size]
+            self.add_chunks(collection_name, batch, persist_index=False)
+            if on_batch:
+                on_batch(len(batch))
+        self.get_keyword_index(collection_name).save()
+
+    def _get_keyword_index_path(self, collection_name: str) -> str:
+        return os.path.join(self.persist_directory, f"{collection_name}_kwindex.json")
+
+    def get_keyword_index(self, collection_name: str) -> KeywordIndex:
+        """
+        Returns the inverted keyword index for a collection, loading it from disk on first use.
+        Collections ingested before the index existed are indexed once from their stored documents.
+        A cached index is reloaded when another worker process saved or deleted its file since.
+        """
+        with self._index_lock:
+            index = self._keyword_indexes.get(collection_name)
+            if index is not None:
+                if not index.changed_on_disk():
+                    return index
+                # Results cached from the old copy are stale as well.
+                self.invalidate_cached_results(collection_name)
+                if not os.path.exists(index.path):
+                    # Deleted by another worker; don't recreate the collection by re-indexing it.
+                    index = KeywordIndex(index.path)
+                    self._keyword_indexes[collection_name] = index
+                    return index
+            os.makedirs(self.persist_directory, exist_ok=True)
+            path = self._get_keyword_index_path(collection_name)
+            index = KeywordIndex.load(path)
+            if index is None:
+                index = KeywordIndex(path)
+                all_docs = self.get_or_create_collection(collection_name).get(include=["documents"])
+                if all_docs['ids']:
+                    index.add(all_docs['ids'], all_docs['documents'])
+                    index.save()
+            self._keyword_indexes[collection_name] = index
+            return index
+
+    def get_first_chunk(self, collection_name: str) -> Optional[Dict[str, Any]]:
+        """Returns the first ingested chunk of a collection without scanning it."""
+        first_id = self.get_keyword_index(collection_name).first_doc_id
+        if first_id is None:
+            return None
+        result = self.get_or_create_collection(collection_name).get(ids=[first_id])
+        if not result['ids']:
+            return None
+        return {'id': result['ids'][0], 'text': result['documents'][0], 'metadata': result['metadatas'][0]}
 
     def query(self, collection_name: str, query_text: str, n_results: int = 5, filters: Optional[Dict[str, Any]] = None, similarity_threshold: Optional[float] = None) -> List[Dict[str, Any]]:
+        return self.query_many(collection_name, [query_text], n_results, filters, similarity_threshold)[0]
+
+    def query_many(self, collection_name: str, query_texts: List[str], n_results: int = 5, filters: Optional[Dict[str, Any]] = None, similarity_threshold: Optional[float] = None) -> List[List[Dict[str, Any]]]:
+        """
+        Semantic search for several queries at once: one batched encode and one multi-vector collection.query.
+        Returns one result list (closest first) per query.
+        """
         collection = self.get_or_create_collection(collection_name)
-        query_embedding = self.embedder.encode([query_text], show_progress_bar=False, convert_to_numpy=True).tolist()
+        query_embeddings = self.encode_queries(query_texts)
         chroma_filters = filters if filters else None
         results = collection.query(
-            query_embeddings=query_embedding,
-            n_results=n_results * 2,
+            query_embeddings=query_embeddings,
+            n_results=n_results,
             where=chroma_filters
         )
-        scored_results = []
-        for i, (id_, doc, meta, dist) in enumerate(zip(results["ids"][0], results["documents"][0], results["metadatas"][0], results["distances"][0])):
-            if similarity_threshold is None or dist <= similarity_threshold:
-                scored_results.append({
-                    "id": id_,
-                    "text": doc,
-                    "metadata": meta,
-                    "distance": dist
-                })
-        scored_results = sorted(scored_results, key=lambda x: x['distance'])
-        return scored_results[:n_results]
+        all_results = []
+        for q in range(len(query_texts)):
+            scored_results = []
+            for id_, doc, meta, dist in zip(results["ids"][q], results["documents"][q], results["metadatas"][q], results["distances"][q]):
+                if similarity_threshold is None or dist <= similarity_threshold:
+                    scored_results.append({
+                        "id": id_,
+                        "text": doc,
+                        "metadata": meta,
+                        "distance": dist
+                    })
+            scored_results = sorted(scored_results, key=lambda x: x['distance'])
+            all_results.append(scored_results[:n_results])
+        return all_results
 
     def keyword_search(self, collection_name: str, query_text: str, n_results: int = 10, filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
         """
-        Simple keyword search over documents in the collection.
-        Returns top n_results with the most keyword overlap.
+        BM25 keyword search over the collection's inverted index.
+        Returns top n_results; only the matching chunks are fetched from the collection.
         """
+        # Over-fetch when filtering, since some candidates may be dropped by the where clause.
+        candidate_count = n_results * 4 if filters else n_results
+        hits = self.get_keyword_index(collection_name).search(query_text, candidate_count)
+        if not hits:
+            return []
         collection = self.get_or_create_collection(collection_name)
-        all_docs = collection.get()
-        query_keywords = set(re.findall(r'\w+', query_text.lower()))
+        found = collection.get(ids=[id_ for id_, _ in hits], where=filters if filters else None)
+        docs_by_id = {id_: (doc, meta) for id_, doc, meta in zip(found['ids'], found['documents'], found['metadatas'])}
         scored = []
-        for doc, meta, id_ in zip(all_docs['documents'], all_docs['metadatas'], all_docs['ids']):
-            doc_keywords = set(re.findall(r'\w+', doc.lower()))
-            overlap = len(query_keywords & doc_keywords)
+        for id_, score in hits:
+            if id_ not in docs_by_id:
+                continue
+            doc, meta = docs_by_id[id_]
             scored.append({
                 'id': id_,
                 'text': doc,
                 'metadata': meta,
-                'keyword_score': overlap
+                'keyword_score': score
             })
-        scored = sorted(scored, key=lambda x: x['keyword_score'], reverse=True)
         return scored[:n_results]
 
-    def hybrid_query(self, collection_name: str, query_text: str, n_results: int = 5, filters: Optional[Dict[str, Any]] = None, similarity_threshold: Optional[float] = None) -> List[Dict[str, Any]]:
+    def hybrid_query(
+        self,
+        collection_name: str,
+        query_text: str,
+        n_results: int = 5,
+        filters: Optional[Dict[str, Any]] = None,
+        similarity_threshold: Optional[float] = None,
+        fusion: str = "rrf",
+        candidate_pool: Optional[int] = None,
+        semantic_weight: float = 1.0,
+        keyword_weight: float = 1.0,
+        rrf_k: int = 60,
+        expansions: Optional[List[str]] = None,
+        expansion_weight: float = 0.5
+    ) -> List[Dict[str, Any]]:
         """
-        Hybrid search: combine semantic and keyword search, re-rank by combined score.
+        Hybrid search: fetch candidate_pool results from both semantic and keyword search and fuse them.
+        fusion="rrf" uses reciprocal-rank fusion; fusion="weighted" uses a weighted sum of min-max normalized
+        scores (1 - distance for semantic, BM25 for keyword). Hits found by only one side are kept.
+        expansions (alternative phrasings of the query) are searched semantically in the same batched call;
+        with rrf each expansion is its own ranked list weighted by expansion_weight * semantic_weight, with
+        weighted fusion a chunk keeps its best distance over all phrasings.
         """
+        if fusion not in FUSION_MODES:
+            raise ValueError(f"Unknown fusion mode: {fusion}. Expected one of {FUSION_MODES}")
         chroma_filters = filters if filters else None
-        semantic_results = self.query(collection_name, query_text, n_results * 2, chroma_filters, similarity_threshold)
-        keyword_results = self.keyword_search(collection_name, query_text, n_results * 2, chroma_filters)
-        keyword_scores = {r['id']: r['keyword_score'] for r in keyword_results}
-        for r in semantic_results:
-            r['keyword_score'] = keyword_scores.get(r['id'], 0)
-            r['hybrid_score'] = 1.0 + r['keyword_score']
-        ranked = sorted(semantic_results, key=lambda x: x['hybrid_score'], reverse=True)
-        return ranked[:n_results]
+        pool = max(candidate_pool or n_results * 3, n_results)
+        semantic_lists = self.query_many(collection_name, [query_text] + list(expansions or []), pool, chroma_filters, similarity_threshold)
+        semantic_results = semantic_lists[0]
+        keyword_results = self.keyword_search(collection_name, query_text, pool, chroma_filters)
+        weights = [semantic_weight, keyword_weight]
+        if fusion == "rrf":
+            expansion_weights = [semantic_weight * expansion_weight] * (len(semantic_lists) - 1)
+            # Expansion lists go first so the original query's distance is the one kept on merged results.
+            fused = reciprocal_rank_fusion(semantic_lists[1:] + [semantic_results, keyword_results], weights=expansion_weights + weights, k=rrf_k)
+        else:
+            if len(semantic_lists) > 1:
+                semantic_results = _best_distance(semantic_lists)
+            fused = weighted_score_fusion(
+                [semantic_results, keyword_results],
+                score_keys=["distance", "keyword_score"],
+                weights=weights,
+                lower_is_better=[True, False]
+            )
+        for r in fused:
+            r.setdefault('keyword_score', 0.0)
+            r.setdefault('distance', None)
+        return fused[:n_results]
 
     def _get_metadata_path(self, collection_name: str) -> str:
         return os.path.join(self.persist_directory, f"{collection_name}_meta.json")
@@ -123,6 +294,13 @@ class VectorStore:
                 return json.load(f)
         return {"document_id": collection_name, "name": collection_name, "upload_time": ""}
 
+    def has_collection(self, name: str) -> bool:
+        try:
+            self.client.get_collection(name)
+            return True
+        except Exception:
+            return False
+
     def list_collections(self) -> list:
         collections = self.client.list_collections()
         result = []
@@ -133,3 +311,7 @@ class VectorStore:
 
     def delete_collection(self, name: str):
         self.client.delete_collection(name)
+        self.invalidate_cached_results(name)
+        with self._index_lock:
+            index = self._keyword_indexes.pop(name, None) or KeywordIndex(self._get_keyword_index_path(name))
+        index.delete()
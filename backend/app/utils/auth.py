@@ -0,0 +1,72 @@
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+import jwt
+
+from app.utils.cache import LRUTTLCache
+
+JWT_SECRET = os.environ.get("JWT_SECRET")
+JWT_ALGORITHM = os.environ.get("JWT_ALGORITHM")
+# Verified tokens kept in memory; an entry never outlives the token's exp claim.
+TOKEN_CACHE_SIZE = int(os.environ.get("TOKEN_CACHE_SIZE", "4096"))
+TOKEN_CACHE_TTL = float(os.environ.get("TOKEN_CACHE_TTL", "3600"))
+
+
+class AuthenticationError(Exception):
+    """Raised for a missing, malformed, expired or otherwise invalid token."""
+
+
+@dataclass(frozen=True)
+class Principal:
+    """The authenticated caller: verified once per request, then passed down explicitly."""
+    user_id: str
+    token: str = field(repr=False)
+    payload: Dict[str, Any] = field(default_factory=dict, compare=False, repr=False)
+    expires_at: Optional[float] = None  # exp claim (unix time), None if the token has none
+
+
+class TokenVerifier:
+    """
+    Decodes JWTs and caches the resulting Principal by token, so repeated requests with the
+    same token (every websocket message, every API call of a session) skip HMAC and JSON decoding.
+    """
+    def __init__(self, secret: Optional[str] = JWT_SECRET, algorithm: Optional[str] = JWT_ALGORITHM, cache_size: int = TOKEN_CACHE_SIZE, cache_ttl: float = TOKEN_CACHE_TTL):
+        self.secret = secret
+        self.algorithm = algorithm
+        self.cache = LRUTTLCache(cache_size, cache_ttl)
+        self.cache_ttl = cache_ttl
+
+    def verify(self, token: Optional[str]) -> Principal:
+        if not token:
+            raise AuthenticationError("Missing authentication token.")
+        principal = self.cache.get(token)
+        if principal is not None:
+            return principal
+        try:
+            payload = jwt.decode(token, self.secret, algorithms=[self.algorithm])
+        except Exception as e:
+            raise AuthenticationError("Invalid authentication token.") from e
+        user_id = payload.get("user_id")
+        if not user_id:
+            raise AuthenticationError("Token has no user_id.")
+        exp = payload.get("exp")
+        principal = Principal(user_id=str(user_id), token=token, payload=payload, expires_at=float(exp) if exp is not None else None)
+        ttl = self.cache_ttl
+        if principal.expires_at is not None:
+            ttl = min(ttl, principal.expires_at - time.time())
+        if ttl > 0:
+            self.cache.set(token, principal, ttl=ttl)
+        return principal
+
+    def stats(self) -> Dict[str, Any]:
+        return self.cache.stats()
+
+
+token_verifier = TokenVerifier()
+
+
+def authenticate(token: Optional[str]) -> Principal:
+    """Verifies token with the process-wide TokenVerifier; raises AuthenticationError."""
+    return token_verifier.verify(token)
@@ -13,6 +13,31 @@ class Chunker:
         sections = re.split(r'(?:\n\s*\n|\n\s*#)', text)
         return [s.strip() for s in sections if s.strip()]
 
+    def split_long_section(self, section: str) -> List[str]:
+        """
+        Splits a section longer than chunk_size at sentence boundaries; sentences that are
+        still too long are cut at chunk_size characters.
+        """
+        if len(section) <= self.chunk_size:
+            return [section]
+        pieces = []
+        current = ""
+        for sentence in re.split(r'(?<=[.!?])\s+', section):
+            while len(sentence) > self.chunk_size:
+                if current:
+                    pieces.append(current)
+                    current = ""
+                pieces.append(sentence[:self.chunk_size])
+                sentence = sentence[self.chunk_size:]
+            if current and len(current) + len(sentence) + 1 > self.chunk_size:
+                pieces.append(current)
+                current = sentence
+            else:
+                current = f"{current} {sentence}" if current else sentence
+        if current:
+            pieces.append(current)
+        return pieces
+
     def chunk_with_overlap(self, sections: List[str]) -> List[str]:
         """
         Chunks sections into fixed-size windows with overlap, preserving boundaries where possible.
@@ -20,6 +45,7 @@ class Chunker:
         chunks = []
         current_chunk = []
         current_length = 0
+        sections = [piece for section in sections for piece in self.split_long_section(section)]
         for section in sections:
             section_length = len(section)
             if current_length + section_length > self.chunk_size:
@@ -35,12 +61,36 @@ class Chunker:
             chunks.append('\n'.join(current_chunk))
         return [c for c in chunks if c.strip()]
 
+    def table_to_text(self, table: List[List[Any]]) -> List[str]:
+        """
+        Renders a table as pipe-separated rows, split into pieces of at most chunk_size characters.
+        The header row is repeated at the top of every piece.
+        """
+        rows = [' | '.join('' if cell is None else str(cell).strip() for cell in row) for row in table if row]
+        rows = [row for row in rows if row.strip(' |')]
+        if not rows:
+            return []
+        header, body = rows[0], rows[1:]
+        pieces = []
+        current = [header]
+        current_length = len(header)
+        for row in body:
+            if len(current) > 1 and current_length + len(row) + 1 > self.chunk_size:
+                pieces.append('\n'.join(current))
+                current = [header]
+                current_length = len(header)
+            current.append(row)
+            current_length += len(row) + 1
+        pieces.append('\n'.join(current))
+        return pieces
+
     def chunk_page(self, page: Dict[str, Any]) -> List[Dict[str, Any]]:
         """
         Chunks a single page's text and attaches metadata (page number, tables, images).
+        Each text block is treated as a semantic section; extracted tables become separate chunks of type "table". Page-level metadata (e.g. document_id) is kept on every chunk.
         Returns a list of chunk dicts.
         """
-        text = '\n'.join([block['text'] for block in page.get('blocks', []) if block.get('type') == 'text'])
+        text = '\n\n'.join([block['text'] for block in page.get('blocks', []) if block.get('type') == 'text'])
         sections = self.split_text_semantic(text)
         text_chunks = self.chunk_with_overlap(sections)
         chunks = []
@@ -52,11 +102,28 @@ class Chunker:
                 'tables': page.get('tables', []),
                 'images': page.get('images', []),
                 'metadata': {
+                    **page.get('metadata', {}),
                     'chunk_index': idx,
-                    'page': page['page']
+                    'page': page['page'],
+                    'type': 'text'
                 }
             }
             chunks.append(chunk)
+        table_pieces = [piece for table in page.get('tables', []) for piece in self.table_to_text(table)]
+        for idx, table_text in enumerate(table_pieces):
+            chunks.append({
+                'chunk_id': f"{page['page']}_t{idx+1}",
+                'page': page['page'],
+                'text': table_text,
+                'tables': [],
+                'images': [],
+                'metadata': {
+                    **page.get('metadata', {}),
+                    'chunk_index': len(text_chunks) + idx,
+                    'page': page['page'],
+                    'type': 'table'
+                }
+            })
         return chunks
 
     def chunk_document(self, document: Dict[str, Any]) -> List[Dict[str, Any]]:
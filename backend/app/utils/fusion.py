@@ -0,0 +1,57 @@
+from typing import List, Dict, Any, Optional, Sequence
+
+FUSION_MODES = ("rrf", "weighted")
+
+
+def _merge_candidates(result_lists: Sequence[List[Dict[str, Any]]]) -> Dict[str, Dict[str, Any]]:
+    """Union of all result lists keyed by chunk id; fields from every list are kept on the merged dict."""
+    merged: Dict[str, Dict[str, Any]] = {}
+    for results in result_lists:
+        for r in results:
+            merged.setdefault(r['id'], {}).update(r)
+    return merged
+
+
+def reciprocal_rank_fusion(result_lists: Sequence[List[Dict[str, Any]]], weights: Optional[Sequence[float]] = None, k: int = 60) -> List[Dict[str, Any]]:
+    """
+    Reciprocal-rank fusion: score(d) = sum_i w_i / (k + rank_i(d)), rank starting at 1.
+    Each input list must already be sorted best first. Returns merged results sorted by 'hybrid_score'.
+    """
+    weights = weights or [1.0] * len(result_lists)
+    merged = _merge_candidates(result_lists)
+    scores = {id_: 0.0 for id_ in merged}
+    for results, weight in zip(result_lists, weights):
+        for rank, r in enumerate(results, start=1):
+            scores[r['id']] += weight / (k + rank)
+    for id_, r in merged.items():
+        r['hybrid_score'] = scores[id_]
+    return sorted(merged.values(), key=lambda x: x['hybrid_score'], reverse=True)
+
+
+def _min_max(values: Dict[str, float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    lo, hi = min(values.values()), max(values.values())
+    if hi == lo:
+        return {id_: 1.0 for id_ in values}
+    return {id_: (v - lo) / (hi - lo) for id_, v in values.items()}
+
+
+def weighted_score_fusion(result_lists: Sequence[List[Dict[str, Any]]], score_keys: Sequence[str], weights: Optional[Sequence[float]] = None, lower_is_better: Optional[Sequence[bool]] = None) -> List[Dict[str, Any]]:
+    """
+    Weighted sum of min-max normalized scores. score_keys names the raw score field of each list
+    (e.g. 'distance' for semantic, 'keyword_score' for BM25); lower_is_better flips distance-like scores.
+    A candidate missing from a list contributes 0 for that list.
+    """
+    weights = weights or [1.0] * len(result_lists)
+    lower_is_better = lower_is_better or [False] * len(result_lists)
+    merged = _merge_candidates(result_lists)
+    totals = {id_: 0.0 for id_ in merged}
+    for results, key, weight, invert in zip(result_lists, score_keys, weights, lower_is_better):
+        raw = {r['id']: (-r[key] if invert else r[key]) for r in results if r.get(key) is not None}
+        for id_, norm in _min_max(raw).items():
+            totals[id_] += weight * norm
+    weight_sum = sum(weights) or 1.0
+    for id_, r in merged.items():
+        r['hybrid_score'] = totals[id_] / weight_sum
+    return sorted(merged.values(), key=lambda x: x['hybrid_score'], reverse=True)
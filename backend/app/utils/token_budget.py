@@ -0,0 +1,142 @@
+import os
+import math
+import logging
+import threading
+from functools import lru_cache
+from typing import List, Optional, Sequence, Tuple
+
+logger = logging.getLogger("chat_with_pdf_api")
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..'))
+# HuggingFace tokenizer.json for the chat model (e.g. Llama 3); nothing is downloaded at runtime.
+TOKENIZER_PATH = os.environ.get("TOKENIZER_PATH", os.path.join(BACKEND_DIR, "models", "tokenizer.json"))
+# Fallback estimate when no tokenizer file is present. Llama 3 averages ~4 characters per token on
+# English prose and fewer on numbers/tables; 3.5 errs towards overcounting so the prompt never overflows.
+CHARS_PER_TOKEN = float(os.environ.get("TOKEN_ESTIMATE_CHARS_PER_TOKEN", "3.5"))
+LLM_CONTEXT_TOKENS = int(os.environ.get("LLM_CONTEXT_TOKENS", "8192"))
+LLM_MAX_TOKENS = int(os.environ.get("LLM_MAX_TOKENS", "1024"))
+# Upper bound on the share of the prompt budget spent on conversation history; unused history budget goes to chunks.
+HISTORY_SHARE = float(os.environ.get("CONTEXT_HISTORY_SHARE", "0.3"))
+
+_tokenizer = None
+_tokenizer_loaded = False
+_tokenizer_lock = threading.Lock()
+
+
+def get_tokenizer():
+    """Loads the local tokenizer once; returns None (heuristic counting) if it is unavailable."""
+    global _tokenizer, _tokenizer_loaded
+    if _tokenizer_loaded:
+        return _tokenizer
+    with _tokenizer_lock:
+        if not _tokenizer_loaded:
+            try:
+                from tokenizers import Tokenizer
+                _tokenizer = Tokenizer.from_file(TOKENIZER_PATH)
+                logger.info(f"Loaded tokenizer from {TOKENIZER_PATH}")
+            except ImportError:
+                logger.warning("tokenizers is not installed; using the character-based token estimate")
+            except Exception as e:
+                logger.warning(f"No tokenizer at {TOKENIZER_PATH} ({e}); using the character-based token estimate")
+            _tokenizer_loaded = True
+    return _tokenizer
+
+
+def estimate_tokens(text: str) -> int:
+    if not text:
+        return 0
+    return max(len(text.split()), math.ceil(len(text) / CHARS_PER_TOKEN))
+
+
+@lru_cache(maxsize=8192)
+def count_tokens(text: str) -> int:
+    """Token count of text for the chat model; memoized since the same chunks are counted turn after turn."""
+    tokenizer = get_tokenizer()
+    if tokenizer is None:
+        return estimate_tokens(text)
+    return len(tokenizer.encode(text, add_special_tokens=False).ids)
+
+
+class ContextBudget:
+    """
+    Split of the model's context window: the prompt template (system), generation, conversation
+    history and retrieved chunks. history is a cap; whatever it leaves unused goes to chunks.
+    """
+    def __init__(self, total: int, system: int, generation: int, history: int, chunks: int):
+        self.total = total
+        self.system = system
+        self.generation = generation
+        self.history = history
+        self.chunks = chunks
+
+    @property
+    def context(self) -> int:
+        """Tokens available for history and chunks together."""
+        return self.history + self.chunks
+
+    def to_dict(self):
+        return {"total": self.total, "system": self.system, "generation": self.generation, "history": self.history, "chunks": self.chunks}
+
+
+def split_budget(prompt_template: str, total: int = LLM_CONTEXT_TOKENS, generation: int = LLM_MAX_TOKENS, history_share: float = HISTORY_SHARE) -> ContextBudget:
+    """
+    prompt_template: the full prompt without context (system message, instructions and question).
+    """
+    system = count_tokens(prompt_template)
+    available = max(0, total - generation - system)
+    history = int(available * history_share)
+    return ContextBudget(total=total, system=system, generation=generation, history=history, chunks=available - history)
+
+
+def pack_by_value(items: Sequence[Tuple[str, float]], budget: int) -> List[int]:
+    """
+    Chooses which (text, value) items to include within budget tokens, greedily by value per token
+    and skipping items that no longer fit instead of stopping at the first one. The greedy set is
+    compared with the single most valuable item that fits, which bounds how badly density-first
+    packing can do when one long item dominates. Returns the chosen indexes in their original order.
+    """
+    costs = [count_tokens(text) for text, _ in items]
+    order = sorted(range(len(items)), key=lambda i: items[i][1] / max(costs[i], 1), reverse=True)
+    chosen, used, value = [], 0, 0.0
+    for i in order:
+        if used + costs[i] <= budget:
+            chosen.append(i)
+            used += costs[i]
+            value += items[i][1]
+    fitting = [i for i in range(len(items)) if costs[i] <= budget]
+    if fitting:
+        best = max(fitting, key=lambda i: items[i][1])
+        if items[best][1] > value:
+            chosen = [best]
+    return sorted(chosen)
+
+
+def rank_value(rank: int) -> float:
+    """Relevance value of the chunk at a 0-based retrieval rank (reciprocal rank)."""
+    return 1.0 / (rank + 1)
+
+
+def take_recent(texts: Sequence[str], budget: int, separator: str = "\n") -> Tuple[List[str], int]:
+    """Most recent texts (last in the list) that fit in budget tokens, oldest first, and their token count."""
+    kept: List[str] = []
+    used = 0
+    sep_tokens = count_tokens(separator) if separator.strip() else 0
+    for text in reversed(texts):
+        cost = count_tokens(text) + sep_tokens
+        if used + cost > budget:
+            break
+        kept.append(text)
+        used += cost
+    kept.reverse()
+    return kept, used
+
+
+def reset_tokenizer(path: Optional[str] = None):
+    """Drops the loaded tokenizer and cached counts (e.g. after TOKENIZER_PATH changes)."""
+    global _tokenizer, _tokenizer_loaded, TOKENIZER_PATH
+    with _tokenizer_lock:
+        if path:
+            TOKENIZER_PATH = path
+        _tokenizer = None
+        _tokenizer_loaded = False
+    count_tokens.cache_clear()
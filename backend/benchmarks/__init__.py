@@ -0,0 +1,4 @@
+"""
+Offline retrieval quality and latency benchmarks for the backend.
+Run from backend/: python -m benchmarks.run --help
+"""
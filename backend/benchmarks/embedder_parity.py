@@ -0,0 +1,149 @@
+"""
+Embedding backend parity: vectors of an ONNX backend against the torch SentenceTransformer.
+
+    cd backend
+    python -m app.services.embedders --model all-MiniLM-L6-v2
+    python -m benchmarks.embedder_parity --backend onnx-int8 --min-cosine 0.98
+
+Encodes synthetic queries and chunk-sized passages with both backends and reports per-text cosine
+agreement, whether each query keeps its nearest passage, throughput, load time and the memory
+each backend added. Exits 1 if the lowest cosine falls below --min-cosine. For end-to-end
+retrieval quality, run benchmarks.run with --embedding-backend and --baseline.
+"""
+import sys
+import json
+import time
+import random
+import argparse
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from app.services.embedders import create_embedder, BACKEND_TORCH, BACKEND_ONNX, BACKEND_ONNX_INT8
+from app.services.registry import DEFAULT_EMBEDDING_MODEL, _resident_memory_mb
+
+from .metrics import latency_summary
+from .synthetic import FACT_TEMPLATES, NAMES, DEVICES, CITIES, _filler_paragraph
+from .query_embedding import make_queries
+
+# Lowest acceptable cosine between a text's ONNX and torch vectors (also enforced by tests/test_embedder_parity.py).
+PARITY_MIN_COSINE = 0.98
+
+
+def make_passages(count: int, seed: int) -> List[str]:
+    """Chunk-like passages: a fact from the synthetic corpus surrounded by filler text."""
+    rng = random.Random(seed)
+    passages = []
+    for i in range(count):
+        fact, _ = FACT_TEMPLATES[i % len(FACT_TEMPLATES)]
+        sentence = fact.format(
+            name=f"{rng.choice(NAMES)} {i}", device=rng.choice(DEVICES), num=rng.randint(10, 9999),
+            city=rng.choice(CITIES), year=rng.randint(1990, 2024),
+        )
+        passages.append(" ".join([_filler_paragraph(rng, rng.randint(1, 3)), sentence, _filler_paragraph(rng, rng.randint(2, 6))]))
+    return passages
+
+
+def load(model_name: str, backend: str, onnx_dir: Optional[str]):
+    memory_before = _resident_memory_mb()
+    start = time.perf_counter()
+    embedder = create_embedder(model_name, backend, onnx_dir)
+    embedder.encode(["warm up"], show_progress_bar=False, convert_to_numpy=True)
+    load_ms = round((time.perf_counter() - start) * 1000, 2)
+    memory_after = _resident_memory_mb()
+    added = round(memory_after - memory_before, 1) if memory_before is not None and memory_after is not None else None
+    return embedder, {"load_ms": load_ms, "memory_added_mb": added}
+
+
+def encode(embedder, texts: List[str], batch_size: int, repeats: int) -> Dict[str, Any]:
+    latencies = []
+    vectors = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        vectors = embedder.encode(texts, batch_size=batch_size, show_progress_bar=False, convert_to_numpy=True)
+        latencies.append((time.perf_counter() - start) * 1000)
+    single = []
+    for text in texts[:min(len(texts), 100)]:
+        start = time.perf_counter()
+        embedder.encode([text], show_progress_bar=False, convert_to_numpy=True)
+        single.append((time.perf_counter() - start) * 1000)
+    best = min(latencies)
+    return {
+        "vectors": np.asarray(vectors, dtype=np.float32),
+        "texts_per_s": round(len(texts) / (best / 1000), 1),
+        "single_latency_ms": latency_summary(single),
+    }
+
+
+def _normalized(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+
+
+def cosine_agreement(reference: np.ndarray, candidate: np.ndarray) -> Dict[str, float]:
+    cosines = np.sum(_normalized(reference) * _normalized(candidate), axis=1)
+    return {
+        "min": round(float(cosines.min()), 5),
+        "mean": round(float(cosines.mean()), 5),
+        "p01": round(float(np.percentile(cosines, 1)), 5),
+    }
+
+
+def nearest_agreement(ref_queries: np.ndarray, ref_passages: np.ndarray, queries: np.ndarray, passages: np.ndarray) -> float:
+    """Share of queries whose nearest passage is the same under both backends."""
+    reference = np.argmax(_normalized(ref_queries) @ _normalized(ref_passages).T, axis=1)
+    candidate = np.argmax(_normalized(queries) @ _normalized(passages).T, axis=1)
+    return round(float(np.mean(reference == candidate)), 4)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Compare an ONNX embedding backend with torch.")
+    parser.add_argument("--embedding-model", default=DEFAULT_EMBEDDING_MODEL, help="Model name or local path")
+    parser.add_argument("--backend", choices=[BACKEND_ONNX, BACKEND_ONNX_INT8], nargs="+", default=[BACKEND_ONNX_INT8])
+    parser.add_argument("--onnx-dir", help="Export directory (default: ONNX_MODEL_DIR/<model>)")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--passages", type=int, default=500)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--repeats", type=int, default=3, help="Batch timings keep the best of this many runs")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--min-cosine", type=float, default=PARITY_MIN_COSINE, help="Fail if any text's cosine to torch is lower")
+    args = parser.parse_args(argv)
+
+    queries = make_queries(args.queries, args.seed)
+    passages = make_passages(args.passages, args.seed)
+    report: Dict[str, Any] = {"embedding_model": args.embedding_model, "queries": len(queries), "passages": len(passages), "backends": {}}
+    reference = None
+    failures = []
+    for backend in [BACKEND_TORCH] + args.backend:
+        embedder, loaded = load(args.embedding_model, backend, args.onnx_dir)
+        query_run = encode(embedder, queries, args.batch_size, args.repeats)
+        passage_run = encode(embedder, passages, args.batch_size, args.repeats)
+        entry = {
+            **loaded,
+            "queries_per_s": query_run["texts_per_s"],
+            "passages_per_s": passage_run["texts_per_s"],
+            "single_query_latency_ms": query_run["single_latency_ms"],
+        }
+        if reference is None:
+            reference = (query_run["vectors"], passage_run["vectors"], entry)
+        else:
+            ref_queries, ref_passages, ref_entry = reference
+            entry["query_cosine"] = cosine_agreement(ref_queries, query_run["vectors"])
+            entry["passage_cosine"] = cosine_agreement(ref_passages, passage_run["vectors"])
+            entry["nearest_passage_agreement"] = nearest_agreement(ref_queries, ref_passages, query_run["vectors"], passage_run["vectors"])
+            entry["speedup"] = {
+                "queries": round(entry["queries_per_s"] / ref_entry["queries_per_s"], 2),
+                "passages": round(entry["passages_per_s"] / ref_entry["passages_per_s"], 2),
+            }
+            lowest = min(entry["query_cosine"]["min"], entry["passage_cosine"]["min"])
+            if lowest < args.min_cosine:
+                failures.append(f"{backend}: min cosine {lowest} < {args.min_cosine}")
+        report["backends"][backend] = entry
+        del embedder
+    print(json.dumps(report, indent=2))
+    for failure in failures:
+        print(f"PARITY FAILURE {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
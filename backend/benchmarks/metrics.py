@@ -0,0 +1,69 @@
+import math
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+
+def percentile(values: Sequence[float], pct: float) -> Optional[float]:
+    """Linear-interpolated percentile (pct in 0..100); None for no values."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    lo, hi = math.floor(rank), math.ceil(rank)
+    if lo == hi:
+        return ordered[lo]
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (rank - lo)
+
+
+def latency_summary(samples_ms: Sequence[float]) -> Dict[str, Any]:
+    def rounded(value):
+        return round(value, 3) if value is not None else None
+    return {
+        "count": len(samples_ms),
+        "mean": rounded(sum(samples_ms) / len(samples_ms)) if samples_ms else None,
+        "p50": rounded(percentile(samples_ms, 50)),
+        "p95": rounded(percentile(samples_ms, 95)),
+        "p99": rounded(percentile(samples_ms, 99)),
+        "max": rounded(max(samples_ms)) if samples_ms else None,
+    }
+
+
+class StageTimer:
+    """Collects wall-clock samples (ms) per named stage."""
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+
+    def record(self, stage: str, elapsed_ms: float):
+        self.samples[stage].append(elapsed_ms)
+
+    def wrap(self, stage: str, fn: Callable) -> Callable:
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.record(stage, (time.perf_counter() - start) * 1000)
+        return timed
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        return {stage: latency_summary(samples) for stage, samples in sorted(self.samples.items())}
+
+
+def first_hit_rank(retrieved_pages: Iterable[Any], relevant_pages: Iterable[Any]) -> Optional[int]:
+    """1-based rank of the first retrieved chunk on a relevant page, or None."""
+    relevant = set(relevant_pages)
+    for rank, page in enumerate(retrieved_pages, start=1):
+        if page in relevant:
+            return rank
+    return None
+
+
+def quality_summary(ranks: Sequence[Optional[int]], ks: Sequence[int]) -> Dict[str, Any]:
+    """recall@k (share of queries with a relevant chunk in the top k) and MRR over the first-hit ranks."""
+    total = len(ranks) or 1
+    summary: Dict[str, Any] = {"queries": len(ranks)}
+    for k in ks:
+        summary[f"recall@{k}"] = round(sum(1 for r in ranks if r is not None and r <= k) / total, 4)
+    summary["mrr"] = round(sum(1.0 / r for r in ranks if r is not None) / total, 4)
+    return summary
@@ -0,0 +1,102 @@
+"""
+Query embedding throughput: batch-of-one encode calls versus QueryEmbeddingBatcher under concurrency.
+
+    cd backend
+    python -m benchmarks.query_embedding --concurrency 1 8 32 --queries 2000
+
+Reports queries/second and per-query latency for both paths, plus the largest absolute difference
+between their vectors (batching must not change results beyond float noise).
+"""
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+from app.services.query_embedder import QueryEmbeddingBatcher, QUERY_BATCH_WINDOW_MS, QUERY_MAX_BATCH
+from app.services.registry import DEFAULT_EMBEDDING_MODEL
+from app.services.embedders import create_embedder, EMBEDDING_BACKENDS, EMBEDDING_BACKEND
+
+from .metrics import latency_summary
+from .stubs import HashEmbedder
+from .synthetic import FACT_TEMPLATES, NAMES, DEVICES
+
+
+def make_queries(count: int, seed: int) -> List[str]:
+    rng = random.Random(seed)
+    queries = []
+    for i in range(count):
+        _, questions = FACT_TEMPLATES[i % len(FACT_TEMPLATES)]
+        queries.append(rng.choice(questions).format(name=f"{rng.choice(NAMES)} {i}", device=rng.choice(DEVICES)))
+    return queries
+
+
+def run(encode_one: Callable[[str], List[float]], queries: List[str], concurrency: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    vectors: Dict[str, List[float]] = {}
+    lock = threading.Lock()
+
+    def task(query: str):
+        start = time.perf_counter()
+        vector = encode_one(query)
+        elapsed = (time.perf_counter() - start) * 1000
+        with lock:
+            latencies.append(elapsed)
+            vectors[query] = vector
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(task, queries))
+    wall = time.perf_counter() - start
+    return {"qps": round(len(queries) / wall, 1), "latency_ms": latency_summary(latencies), "vectors": vectors}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Query embedding throughput with and without micro-batching.")
+    parser.add_argument("--embedder", choices=["model", "hash"], default="model")
+    parser.add_argument("--embedding-model", default=DEFAULT_EMBEDDING_MODEL, help="Model name or local path")
+    parser.add_argument("--embedding-backend", choices=EMBEDDING_BACKENDS, default=EMBEDDING_BACKEND)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--batch-window-ms", type=float, default=QUERY_BATCH_WINDOW_MS)
+    parser.add_argument("--max-batch", type=int, default=QUERY_MAX_BATCH)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args(argv)
+
+    if args.embedder == "hash":
+        embedder = HashEmbedder()
+    else:
+        embedder = create_embedder(args.embedding_model, args.embedding_backend)
+    embedder.encode(["warm up"], show_progress_bar=False, convert_to_numpy=True)
+    queries = make_queries(args.queries, args.seed)
+
+    def encode_single(query: str) -> List[float]:
+        return embedder.encode([query], show_progress_bar=False, convert_to_numpy=True).tolist()[0]
+
+    report = {"embedder": args.embedder if args.embedder == "hash" else f"{args.embedding_model}@{args.embedding_backend}", "queries": len(queries), "runs": []}
+    for concurrency in args.concurrency:
+        batcher = QueryEmbeddingBatcher(embedder, batch_window_ms=args.batch_window_ms, max_batch=args.max_batch)
+        try:
+            single = run(encode_single, queries, concurrency)
+            batched = run(lambda q: batcher.encode([q])[0], queries, concurrency)
+        finally:
+            batcher.close()
+        max_diff = max(float(np.max(np.abs(np.asarray(single["vectors"][q]) - np.asarray(batched["vectors"][q])))) for q in queries)
+        report["runs"].append({
+            "concurrency": concurrency,
+            "single": {"qps": single["qps"], "latency_ms": single["latency_ms"]},
+            "batched": {"qps": batched["qps"], "latency_ms": batched["latency_ms"], **batcher.stats()},
+            "speedup": round(batched["qps"] / single["qps"], 2),
+            "max_abs_diff": max_diff,
+        })
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,253 @@
+"""
+Retrieval quality and latency benchmark.
+
+Ingests every PDF in a directory (or a generated synthetic corpus), runs a query set with known
+answer pages through RAGEngine and reports recall@k, MRR and p50/p95/p99 latency per stage as JSON.
+The LLM is always the offline StubLLMClient; --embedder hash also avoids downloading a model.
+
+    cd backend
+    python -m benchmarks.run --synthetic 3 --pages 20 --embedder hash --output bench.json
+    python -m benchmarks.run --pdf-dir ./pdfs --queries ./pdfs/queries.json --baseline bench.json
+
+queries.json: [{"document": "<file name in pdf-dir>", "query": "...", "pages": [3], "kind": "optional label"}]
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import platform
+import tempfile
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import chromadb
+from chromadb import Settings
+
+from app.services.vector_store import VectorStore
+from app.services.pdf_processor import PDFTextExtractor, EXTRACTION_PROFILES, DEFAULT_EXTRACTION_PROFILE
+from app.services.ingestion import IngestionPipeline, CHUNK_SIZE, CHUNK_OVERLAP, EMBED_BATCH_SIZE
+from app.services.rag_engine import RAGEngine
+from app.services.registry import DEFAULT_EMBEDDING_MODEL
+from app.services.embedders import create_embedder, EMBEDDING_BACKENDS, EMBEDDING_BACKEND
+from app.utils.chunking import Chunker
+from app.utils.fusion import FUSION_MODES
+from app.utils.token_budget import split_budget
+from app.utils.citations import extract_citations_from_chunks
+
+from .metrics import StageTimer, first_hit_rank, quality_summary
+from .stubs import HashEmbedder, StubLLMClient
+from .synthetic import generate_corpus
+
+logger = logging.getLogger("chat_with_pdf_api")
+
+# Failed queries listed in the report, to see what went wrong without rerunning.
+MAX_REPORTED_FAILURES = 25
+
+
+def timed_extractor(timer: StageTimer) -> type:
+    """PDFTextExtractor subclass recording the time to produce each page."""
+    class TimedPDFTextExtractor(PDFTextExtractor):
+        def iter_pages(self, *args, **kwargs):
+            pages = super().iter_pages(*args, **kwargs)
+            while True:
+                start = time.perf_counter()
+                try:
+                    page = next(pages)
+                except StopIteration:
+                    return
+                timer.record("extraction_page", (time.perf_counter() - start) * 1000)
+                yield page
+    return TimedPDFTextExtractor
+
+
+def build_vector_store(args, work_dir: str, timer: StageTimer) -> VectorStore:
+    if args.embedder == "hash":
+        embedder, model_name = HashEmbedder(), "hash-embedder"
+    else:
+        embedder, model_name = create_embedder(args.embedding_model, args.embedding_backend), args.embedding_model
+    vector_store = VectorStore(
+        persist_directory=work_dir,
+        embedding_model=model_name,
+        client=chromadb.EphemeralClient(Settings(anonymized_telemetry=False)),
+        embedder=embedder,
+    )
+    # Instance attributes shadow the methods, so IngestionPipeline's calls are timed too.
+    vector_store.embed_chunks = timer.wrap("embedding_batch", vector_store.embed_chunks)
+    vector_store.add_chunks = timer.wrap("embed_and_write_batch", vector_store.add_chunks)
+    return vector_store
+
+
+def ingest_corpus(args, vector_store: VectorStore, pdf_dir: str, documents: List[str], timer: StageTimer) -> Dict[str, Any]:
+    chunker = Chunker(chunk_size=args.chunk_size, overlap=args.chunk_overlap)
+    chunker.chunk_page = timer.wrap("chunking_page", chunker.chunk_page)
+    pipeline = IngestionPipeline(vector_store, chunker=chunker, batch_size=args.batch_size, extractor_cls=timed_extractor(timer))
+    pages = chunks = 0
+    for index, filename in enumerate(documents):
+        start = time.perf_counter()
+        result = pipeline.ingest(os.path.join(pdf_dir, filename), collection_name(index), profile=args.profile)
+        timer.record("ingest_document", (time.perf_counter() - start) * 1000)
+        pages += result["pages"]
+        chunks += result["chunks"]
+    return {"documents": len(documents), "pages": pages, "chunks": chunks}
+
+
+def collection_name(index: int) -> str:
+    return f"bench_{index:04d}"
+
+
+def run_queries(args, vector_store: VectorStore, documents: List[str], queries: List[Dict[str, Any]], timer: StageTimer) -> Dict[str, Any]:
+    collections = {filename: collection_name(i) for i, filename in enumerate(documents)}
+    llm_client = StubLLMClient()
+    reranker = None
+    if args.rerank:
+        from app.services.reranker import CrossEncoderReranker
+        reranker = CrossEncoderReranker()
+        reranker.warm_up()
+    n_results = max(args.k)
+    ranks: List[Optional[int]] = []
+    ranks_by_kind: Dict[str, List[Optional[int]]] = defaultdict(list)
+    failures = []
+    loop = asyncio.new_event_loop()
+    try:
+        for q in queries:
+            if q["document"] not in collections:
+                raise SystemExit(f"Query refers to unknown document {q['document']!r}")
+            rag = RAGEngine(vector_store, collections[q["document"]], reranker=reranker)
+            options = {"multi_query": args.multi_query, "fusion": args.fusion}
+            # Cold: nothing cached for this query.
+            vector_store.retrieval_cache.clear()
+            vector_store.query_embedding_cache.clear()
+            start = time.perf_counter()
+            results = rag.retrieve(q["query"], n_results=n_results, **options)
+            timer.record("retrieval", (time.perf_counter() - start) * 1000)
+            start = time.perf_counter()
+            rag.retrieve(q["query"], n_results=n_results, **options)
+            timer.record("retrieval_cached", (time.perf_counter() - start) * 1000)
+
+            start = time.perf_counter()
+            budget = split_budget(llm_client.prompt_overhead(q["query"], mode="deep-dive"), history_share=0.0)
+            context = rag.aggregate_context(results, max_tokens=budget.chunks)
+            timer.record("context_aggregation", (time.perf_counter() - start) * 1000)
+
+            start = time.perf_counter()
+            answer = loop.run_until_complete(llm_client.chat(q["query"], context, mode="deep-dive", max_tokens=budget.generation))
+            extract_citations_from_chunks(results, answer)
+            timer.record("answer_stub_llm", (time.perf_counter() - start) * 1000)
+
+            retrieved_pages = [r["metadata"].get("page") for r in results]
+            rank = first_hit_rank(retrieved_pages, q["pages"])
+            ranks.append(rank)
+            ranks_by_kind[q.get("kind", "default")].append(rank)
+            if (rank is None or rank > min(args.k)) and len(failures) < MAX_REPORTED_FAILURES:
+                failures.append({"document": q["document"], "query": q["query"], "pages": q["pages"], "retrieved_pages": retrieved_pages})
+    finally:
+        loop.run_until_complete(llm_client.aclose())
+        loop.close()
+        if reranker is not None:
+            reranker.close()
+    quality = quality_summary(ranks, args.k)
+    quality["by_kind"] = {kind: quality_summary(kind_ranks, args.k) for kind, kind_ranks in sorted(ranks_by_kind.items())}
+    return {"quality": quality, "failures": failures}
+
+
+def compare_with_baseline(report: Dict[str, Any], baseline: Dict[str, Any], max_quality_drop: float, max_latency_increase: Optional[float]) -> List[str]:
+    """Returns human-readable regressions of report against baseline (empty if none)."""
+    regressions = []
+    for metric, value in report["quality"].items():
+        if metric in ("queries", "by_kind") or metric not in baseline.get("quality", {}):
+            continue
+        if baseline["quality"][metric] - value > max_quality_drop:
+            regressions.append(f"{metric}: {baseline['quality'][metric]} -> {value}")
+    if max_latency_increase is not None:
+        for stage, stats in report["latency_ms"].items():
+            old = baseline.get("latency_ms", {}).get(stage, {}).get("p95")
+            if old and stats.get("p95") is not None and stats["p95"] > old * (1 + max_latency_increase):
+                regressions.append(f"{stage} p95: {old}ms -> {stats['p95']}ms")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Retrieval quality and latency benchmark (offline).")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--pdf-dir", help="Directory of PDFs to ingest (use with --queries)")
+    source.add_argument("--synthetic", type=int, metavar="N", help="Generate N synthetic PDFs with known answers")
+    parser.add_argument("--queries", help="Query set JSON (default: <pdf-dir>/queries.json)")
+    parser.add_argument("--pages", type=int, default=20, help="Pages per synthetic PDF")
+    parser.add_argument("--seed", type=int, default=7, help="Seed for the synthetic corpus")
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 3, 5], help="Cutoffs for recall@k")
+    parser.add_argument("--embedder", choices=["model", "hash"], default="model", help="'hash' needs no model download")
+    parser.add_argument("--embedding-model", default=DEFAULT_EMBEDDING_MODEL)
+    parser.add_argument("--embedding-backend", choices=EMBEDDING_BACKENDS, default=EMBEDDING_BACKEND, help="onnx backends need an export (python -m app.services.embedders)")
+    parser.add_argument("--profile", choices=EXTRACTION_PROFILES, default=DEFAULT_EXTRACTION_PROFILE)
+    parser.add_argument("--fusion", choices=FUSION_MODES, default="rrf")
+    parser.add_argument("--multi-query", action="store_true", help="Enable multi-query retrieval")
+    parser.add_argument("--rerank", action="store_true", help="Re-rank with the cross-encoder (downloads RERANKER_MODEL)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--chunk-overlap", type=int, default=CHUNK_OVERLAP)
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE)
+    parser.add_argument("--output", help="Write the JSON report here (default: stdout)")
+    parser.add_argument("--baseline", help="Earlier report to compare with; exits 1 on regression")
+    parser.add_argument("--max-quality-drop", type=float, default=0.02, help="Allowed absolute drop of recall@k/MRR")
+    parser.add_argument("--max-latency-increase", type=float, default=None, help="Allowed relative p95 increase, e.g. 0.25 (off by default: timing is noisy)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    args.k = sorted(set(args.k))
+    logging.basicConfig(level=logging.WARNING)
+    timer = StageTimer()
+    with tempfile.TemporaryDirectory(prefix="pdf-bench-") as work_dir:
+        if args.synthetic:
+            pdf_dir = os.path.join(work_dir, "corpus")
+            generate_corpus(pdf_dir, documents=args.synthetic, pages=args.pages, seed=args.seed)
+        else:
+            pdf_dir = args.pdf_dir
+        with open(args.queries or os.path.join(pdf_dir, "queries.json")) as f:
+            queries = json.load(f)
+        documents = sorted(name for name in os.listdir(pdf_dir) if name.lower().endswith(".pdf"))
+        vector_store = build_vector_store(args, os.path.join(work_dir, "store"), timer)
+        corpus = ingest_corpus(args, vector_store, pdf_dir, documents, timer)
+        results = run_queries(args, vector_store, documents, queries, timer)
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "source": f"synthetic:{args.synthetic}x{args.pages}:seed={args.seed}" if args.synthetic else os.path.abspath(args.pdf_dir),
+            "embedder": args.embedder if args.embedder == "hash" else f"{args.embedding_model}@{args.embedding_backend}",
+            "profile": args.profile,
+            "fusion": args.fusion,
+            "multi_query": args.multi_query,
+            "rerank": args.rerank,
+            "chunk_size": args.chunk_size,
+            "chunk_overlap": args.chunk_overlap,
+            "batch_size": args.batch_size,
+            "k": args.k,
+            "python": platform.python_version(),
+        },
+        "corpus": corpus,
+        "quality": results["quality"],
+        "latency_ms": timer.summary(),
+        "failures": results["failures"],
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_with_baseline(report, json.load(f), args.max_quality_drop, args.max_latency_increase)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,48 @@
+import re
+import hashlib
+from typing import AsyncGenerator, List
+
+import numpy as np
+
+from app.services.llm_client import LLMClient
+
+
+class HashEmbedder:
+    """
+    Deterministic bag-of-words embedder (feature hashing) with the SentenceTransformer.encode signature.
+    Needs no model download, so CI runs are offline and reproducible; absolute quality is lower than MiniLM.
+    """
+    def __init__(self, dimension: int = 384):
+        self.dimension = dimension
+
+    def encode(self, texts: List[str], batch_size: int = 32, show_progress_bar: bool = False, convert_to_numpy: bool = True, **kwargs):
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in re.findall(r'\w+', text.lower()):
+                vectors[row, int(hashlib.md5(word.encode("utf-8")).hexdigest(), 16) % self.dimension] += 1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+
+class StubLLMClient(LLMClient):
+    """
+    Offline LLMClient: answers with the first context line (which carries its page marker) instead
+    of calling the API, so prompt building, streaming and citation extraction run without a network.
+    """
+    def __init__(self):
+        super().__init__(api_key="stub", base_url="http://stub.invalid")
+
+    @staticmethod
+    def _answer(prompt: str) -> str:
+        match = re.search(r'Context:\n(.*)', prompt)
+        first_line = match.group(1).strip() if match else ""
+        page = re.match(r'\[Page (\d+)\]', first_line)
+        return f"{first_line[:200]} (page {page.group(1)})" if page else "Not found in document."
+
+    async def call_llm(self, prompt: str, max_tokens: int = 512, temperature: float = 0.2, retries: int = 3) -> str:
+        return self._answer(prompt)
+
+    async def stream_llm(self, prompt: str, max_tokens: int = 512, temperature: float = 0.2, retries: int = 3) -> AsyncGenerator[str, None]:
+        for token in re.findall(r'\S+\s*', self._answer(prompt)):
+            yield token
@@ -0,0 +1,109 @@
+import os
+import json
+import random
+from typing import Any, Dict, List
+
+import fitz
+
+# (fact sentence, [direct question, paraphrased question]); the paraphrase shares few words with the fact.
+FACT_TEMPLATES = [
+    ("The maximum operating temperature of the {name} {device} is {num} degrees.",
+     ["What is the maximum operating temperature of the {name} {device}?", "How hot can the {name} {device} get while running?"]),
+    ("The {name} {device} was manufactured in {city} in {year}.",
+     ["Where was the {name} {device} manufactured?", "Which city produced the {name} {device}?"]),
+    ("Annual maintenance of the {name} {device} costs {num} dollars.",
+     ["How much does annual maintenance of the {name} {device} cost?", "What is the yearly upkeep price of the {name} {device}?"]),
+    ("The {name} {device} weighs {num} kilograms when fully assembled.",
+     ["How much does the {name} {device} weigh when assembled?", "What is the mass of the {name} {device}?"]),
+]
+NAMES = ["Falcon", "Orion", "Juniper", "Cobalt", "Sierra", "Nimbus", "Atlas", "Vesper", "Quartz", "Harbor", "Lumen", "Tundra", "Zephyr", "Granite", "Meridian", "Aurora"]
+DEVICES = ["pump", "turbine", "compressor", "valve", "generator", "reactor", "conveyor", "boiler"]
+CITIES = ["Lisbon", "Osaka", "Denver", "Tallinn", "Porto", "Nagoya", "Calgary", "Ghent"]
+REGIONS = ["North", "South", "East", "West", "Central"]
+QUARTERS = ["first quarter", "second quarter", "third quarter", "fourth quarter"]
+FILLER_WORDS = (
+    "system process report analysis method result value design component operation standard procedure "
+    "section overview material structure performance schedule review measurement budget inspection team "
+    "project facility quality safety control network capacity supply planning document policy record "
+    "general specific primary secondary internal external annual regular initial final detailed typical "
+    "describes includes requires provides supports indicates follows ensures reviews maintains improves"
+).split()
+
+
+def _filler_paragraph(rng: random.Random, sentences: int = 5) -> str:
+    out = []
+    for _ in range(sentences):
+        words = [rng.choice(FILLER_WORDS) for _ in range(rng.randint(9, 16))]
+        out.append(" ".join(words).capitalize() + ".")
+    return " ".join(out)
+
+
+def _draw_table(page: fitz.Page, top: float, rows: List[List[str]]):
+    """Ruled table so the extractor's table pre-check (ruling lines) picks the page up."""
+    col_width, row_height, left = 140, 20, 72
+    for r, row in enumerate(rows):
+        for c, cell in enumerate(row):
+            rect = fitz.Rect(left + c * col_width, top + r * row_height, left + (c + 1) * col_width, top + (r + 1) * row_height)
+            page.draw_rect(rect)
+            page.insert_text((rect.x0 + 4, rect.y0 + 14), cell, fontsize=9)
+
+
+def generate_document(path: str, pages: int, rng: random.Random, doc_index: int, table_every: int = 5) -> List[Dict[str, Any]]:
+    """Writes one PDF and returns its queries: [{"query", "pages", "kind"}]."""
+    doc = fitz.open()
+    queries: List[Dict[str, Any]] = []
+    for page_num in range(1, pages + 1):
+        page = doc.new_page()
+        page.insert_text((72, 60), f"Technical report {doc_index + 1}, section {page_num}", fontsize=13)
+        if table_every and page_num % table_every == 0:
+            quarter = QUARTERS[(page_num // table_every - 1) % len(QUARTERS)]
+            page.insert_text((72, 90), f"Regional results for the {quarter} of report {doc_index + 1}", fontsize=11)
+            rows = [["Region", "Units", "Revenue"]]
+            for region in REGIONS:
+                rows.append([region, str(rng.randint(100, 999)), f"{rng.randint(10, 99)}.{rng.randint(0, 9)}M"])
+            _draw_table(page, 110, rows)
+            region_row = rng.choice(rows[1:])
+            queries.append({
+                "query": f"What revenue did the {region_row[0]} region report for the {quarter} in report {doc_index + 1}?",
+                "pages": [page_num],
+                "kind": "table",
+            })
+            continue
+        template, questions = FACT_TEMPLATES[(page_num + doc_index) % len(FACT_TEMPLATES)]
+        values = {
+            "name": f"{rng.choice(NAMES)} {doc_index + 1}{page_num:02d}",
+            "device": rng.choice(DEVICES),
+            "num": rng.randint(10, 9999),
+            "city": rng.choice(CITIES),
+            "year": rng.randint(1990, 2024),
+        }
+        fact = template.format(**values)
+        paragraphs = [_filler_paragraph(rng) for _ in range(3)]
+        paragraphs.insert(rng.randint(0, len(paragraphs)), fact)
+        page.insert_textbox(fitz.Rect(72, 80, 540, 760), "\n\n".join(paragraphs), fontsize=10)
+        kind = "paraphrase" if page_num % 2 else "direct"
+        queries.append({
+            "query": questions[1 if kind == "paraphrase" else 0].format(**values),
+            "pages": [page_num],
+            "kind": kind,
+        })
+    doc.save(path)
+    doc.close()
+    return queries
+
+
+def generate_corpus(out_dir: str, documents: int = 3, pages: int = 20, seed: int = 7) -> List[Dict[str, Any]]:
+    """
+    Generates documents synthetic PDFs in out_dir plus queries.json with one query per page
+    (direct wording, paraphrase or table lookup) and its answer page. Same seed, same corpus.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    rng = random.Random(seed)
+    queries: List[Dict[str, Any]] = []
+    for i in range(documents):
+        filename = f"synthetic_{i + 1:02d}.pdf"
+        for q in generate_document(os.path.join(out_dir, filename), pages, rng, i):
+            queries.append({"document": filename, **q})
+    with open(os.path.join(out_dir, "queries.json"), "w") as f:
+        json.dump(queries, f, indent=2)
+    return queries
@@ -0,0 +1,50 @@
+"""
+Parity of the ONNX embedding backends with torch on a fixed corpus of synthetic queries and passages.
+
+    cd backend
+    python -m app.services.embedders --model all-MiniLM-L6-v2
+    python -m pytest tests
+
+Every text's ONNX vector must have a cosine of at least PARITY_MIN_COSINE to its torch vector.
+Skipped when torch or sentence-transformers is not installed, and per backend when the model
+(EMBEDDING_MODEL) has no ONNX export in ONNX_MODEL_DIR.
+"""
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("sentence_transformers")
+pytest.importorskip("onnxruntime")
+
+from app.services.embedders import create_embedder, onnx_model_dir, ONNX_FILENAMES, BACKEND_TORCH, BACKEND_ONNX, BACKEND_ONNX_INT8
+from app.services.registry import DEFAULT_EMBEDDING_MODEL
+from benchmarks.embedder_parity import PARITY_MIN_COSINE, make_passages, _normalized
+from benchmarks.query_embedding import make_queries
+
+CORPUS_SIZE = 100
+SEED = 7
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    return make_queries(CORPUS_SIZE, SEED) + make_passages(CORPUS_SIZE, SEED)
+
+
+@pytest.fixture(scope="module")
+def torch_vectors(corpus):
+    return create_embedder(DEFAULT_EMBEDDING_MODEL, BACKEND_TORCH).encode(corpus, convert_to_numpy=True)
+
+
+@pytest.mark.parametrize("backend", [BACKEND_ONNX, BACKEND_ONNX_INT8])
+def test_onnx_vectors_match_torch(backend, corpus, request):
+    if not os.path.exists(os.path.join(onnx_model_dir(DEFAULT_EMBEDDING_MODEL), ONNX_FILENAMES[backend])):
+        pytest.skip(f"No {backend} export of {DEFAULT_EMBEDDING_MODEL}; run: python -m app.services.embedders --model {DEFAULT_EMBEDDING_MODEL}")
+    # Loaded only once an export exists, so a missing export skips without loading the torch model.
+    torch_vectors = request.getfixturevalue("torch_vectors")
+    vectors = create_embedder(DEFAULT_EMBEDDING_MODEL, backend).encode(corpus, convert_to_numpy=True)
+    assert vectors.shape == torch_vectors.shape
+    cosines = np.sum(_normalized(np.asarray(torch_vectors, dtype=np.float32)) * _normalized(vectors), axis=1)
+    worst = int(np.argmin(cosines))
+    assert cosines[worst] >= PARITY_MIN_COSINE, f"{backend}: cosine {cosines[worst]:.4f} < {PARITY_MIN_COSINE} for {corpus[worst][:80]!r}"
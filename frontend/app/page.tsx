@@ -7,6 +7,7 @@ import { LoginPage } from "@/components/auth/login-page"
 import { RegisterPage } from "@/components/auth/register-page"
 import { SidebarProvider } from "@/components/ui/sidebar"
 import { FadeMessage } from "@/components/ui/fade-message"
+import { IngestionJob, useIngestionJob } from "@/hooks/use-ingestion-job"
 
 type AuthView = "login" | "register"
 
@@ -21,6 +22,14 @@ export default function ChatPDFApp() {
   const [refreshDocs, setRefreshDocs] = useState(0)
   const [documents, setDocuments] = useState<any[]>([])
   const [uploading, setUploading] = useState(false)
+  const { job: ingestionJob, track: trackIngestion, reset: resetIngestion } = useIngestionJob((job: IngestionJob) => {
+    if (job.status === "completed") {
+      setUploadSuccess("PDF processed. You can start chatting.")
+      setRefreshDocs((prev) => prev + 1)
+    } else {
+      setUploadError(job.error || "PDF processing failed.")
+    }
+  })
 
   useEffect(() => {
     const token = localStorage.getItem("token")
@@ -101,6 +110,7 @@ export default function ChatPDFApp() {
     setSelectedConversation(null);
     setUploadError(null);
     setUploadSuccess(null);
+    resetIngestion();
   }
 
   const handlePDFUpload = async (file: File) => {
@@ -128,7 +138,17 @@ export default function ChatPDFApp() {
       setSelectedPDF(data.document_id);
       setSelectedConversation(data.conversation_id);
       setActiveView("chat");
-      setUploadSuccess(data.message || "PDF uploaded and processed.");
+      // Ingestion runs in the background; chat stays disabled until the job completes.
+      trackIngestion({
+        job_id: data.job_id,
+        document_id: data.document_id,
+        conversation_id: data.conversation_id,
+        status: data.status,
+        progress: data.status === "completed" ? 1 : 0,
+      });
+      if (data.status !== "completed") {
+        setUploadSuccess(data.message || "PDF uploaded and queued for processing.");
+      }
       setRefreshDocs((prev) => prev + 1);
       await fetchDocuments();
     } catch (error) {
@@ -208,6 +228,7 @@ export default function ChatPDFApp() {
               documents={documents}
               fetchDocuments={fetchDocuments}
               onChat={handleChat}
+              ingestionJob={ingestionJob}
             />
           </div>
         </div>
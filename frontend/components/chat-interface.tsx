@@ -5,11 +5,14 @@ import { Send, Bot, User, FileText, ToggleLeft, ToggleRight } from "lucide-react
 import { Button } from "@/components/ui/button"
 import { Input } from "@/components/ui/input"
 import { Badge } from "@/components/ui/badge"
+import { Progress } from "@/components/ui/progress"
+import { IngestionJob } from "@/hooks/use-ingestion-job"
 import { CitationPanel } from "@/components/citation-panel"
 
 interface ChatInterfaceProps {
   selectedConversation: string | null
   selectedPDF?: string | null
+  ingestionJob?: IngestionJob | null
 }
 
 interface Message {
@@ -27,7 +30,7 @@ interface Citation {
   relevance: number
 }
 
-export function ChatInterface({ selectedConversation, selectedPDF }: ChatInterfaceProps) {
+export function ChatInterface({ selectedConversation, selectedPDF, ingestionJob }: ChatInterfaceProps) {
   const [messages, setMessages] = useState<Message[]>([])
   const [inputValue, setInputValue] = useState("")
   const [isDeepDive, setIsDeepDive] = useState(false)
@@ -35,6 +38,12 @@ export function ChatInterface({ selectedConversation, selectedPDF }: ChatInterfa
   const [selectedCitations, setSelectedCitations] = useState<Citation[]>([])
   const [showCitations, setShowCitations] = useState(false)
   const messagesEndRef = useRef<HTMLDivElement>(null)
+  // One chat socket per open conversation, reused for every multi-turn message.
+  const chatSocketRef = useRef<WebSocket | null>(null)
+  const chatSocketReadyRef = useRef<Promise<WebSocket> | null>(null)
+  const turnHandlerRef = useRef<((data: any) => void) | null>(null)
+  // Retrieval has nothing to search until the document's ingestion job completes.
+  const chatDisabled = !!ingestionJob && ingestionJob.status !== "completed"
 
   const scrollToBottom = () => {
     messagesEndRef.current?.scrollIntoView({ behavior: "smooth" })
@@ -87,8 +96,59 @@ export function ChatInterface({ selectedConversation, selectedPDF }: ChatInterfa
     fetchHistory()
   }, [selectedConversation])
 
+  useEffect(() => {
+    return () => {
+      chatSocketRef.current?.close()
+      chatSocketRef.current = null
+      chatSocketReadyRef.current = null
+      turnHandlerRef.current = null
+    }
+  }, [selectedConversation])
+
+  const openChatSocket = (): Promise<WebSocket> => {
+    if (chatSocketReadyRef.current && chatSocketRef.current && chatSocketRef.current.readyState <= WebSocket.OPEN) {
+      return chatSocketReadyRef.current
+    }
+    const token = localStorage.getItem("token")
+    const wsProtocol = window.location.protocol === "https:" ? "wss" : "ws"
+    const wsUrl = `${wsProtocol}://${window.location.host}/api/chat/stream?conversation_id=${selectedConversation}&token=${token}`
+    const ws = new WebSocket(wsUrl)
+    chatSocketRef.current = ws
+    let keepalive: ReturnType<typeof setInterval> | undefined
+    const ready = new Promise<WebSocket>((resolve, reject) => {
+      ws.onmessage = (event) => {
+        const data = JSON.parse(event.data)
+        if (data.type === "ready") {
+          keepalive = setInterval(() => ws.send(JSON.stringify({ type: "ping" })), 30000)
+          resolve(ws)
+          return
+        }
+        if (data.type === "pong") return
+        if (turnHandlerRef.current) {
+          turnHandlerRef.current(data)
+        } else if (data.error) {
+          reject(new Error(data.error))
+        }
+      }
+      ws.onerror = () => reject(new Error("WebSocket error"))
+      ws.onclose = () => {
+        clearInterval(keepalive)
+        if (chatSocketRef.current === ws) {
+          chatSocketRef.current = null
+          chatSocketReadyRef.current = null
+        }
+        if (turnHandlerRef.current) {
+          turnHandlerRef.current({ error: "Connection closed. Please try again." })
+        }
+        reject(new Error("WebSocket closed"))
+      }
+    })
+    chatSocketReadyRef.current = ready
+    return ready
+  }
+
   const handleSendMessage = async () => {
-    if (!inputValue.trim() || !selectedConversation) return
+    if (!inputValue.trim() || !selectedConversation || chatDisabled) return
 
     const newMessage: Message = {
       id: Date.now().toString(),
@@ -197,14 +257,8 @@ export function ChatInterface({ selectedConversation, selectedPDF }: ChatInterfa
     setMessages((prev) => [...prev, aiMessage])
 
     try {
-      const token = localStorage.getItem("token")
-      console.log("[MultiTurn] JWT token sent:", token)
-      const wsProtocol = window.location.protocol === "https:" ? "wss" : "ws"
-      const wsUrl = `${wsProtocol}://${window.location.host}/api/chat/stream?conversation_id=${selectedConversation}&message=${encodeURIComponent(inputValue)}&token=${token}`
-      const ws = new WebSocket(wsUrl)
-
-      ws.onmessage = (event) => {
-        const data = JSON.parse(event.data)
+      const ws = await openChatSocket()
+      turnHandlerRef.current = (data) => {
         if (data.token) {
           setMessages((prev) => {
             return prev.map((msg) =>
@@ -225,27 +279,21 @@ export function ChatInterface({ selectedConversation, selectedPDF }: ChatInterfa
           setSelectedCitations(data.citations)
         }
         if (data.done) {
+          turnHandlerRef.current = null
           setIsLoading(false)
-          ws.close()
         }
         if (data.error) {
+          turnHandlerRef.current = null
           setIsLoading(false)
           setMessages((prev) => prev.filter((msg) => msg.id !== aiMessageId))
           alert(data.error)
-          ws.close()
         }
       }
-      ws.onerror = () => {
-        setIsLoading(false)
-        setMessages((prev) => prev.filter((msg) => msg.id !== aiMessageId))
-        alert("WebSocket error. Please try again.")
-        ws.close()
-      }
-      ws.onclose = () => {
-        setIsLoading(false)
-      }
+      ws.send(JSON.stringify({ type: "message", message: newMessage.content }))
     } catch (err) {
+      turnHandlerRef.current = null
       setIsLoading(false)
+      setMessages((prev) => prev.filter((msg) => msg.id !== aiMessageId))
       alert("Failed to connect to chat stream.")
     }
   }
@@ -376,19 +424,38 @@ export function ChatInterface({ selectedConversation, selectedPDF }: ChatInterfa
 
         <div className="flex-shrink-0 p-4 border-t border-gray-700 bg-[#232326]">
           <div className="max-w-4xl mx-auto">
+            {chatDisabled && ingestionJob && (
+              <div className="mb-3">
+                {ingestionJob.status === "failed" ? (
+                  <p className="text-sm text-red-400">Processing failed: {ingestionJob.error || "unknown error"}</p>
+                ) : (
+                  <>
+                    <div className="flex justify-between text-xs text-gray-400 mb-1">
+                      <span>{ingestionJob.status === "queued" ? "Waiting to process your PDF..." : "Processing your PDF..."}</span>
+                      <span>
+                        {Math.round((ingestionJob.progress || 0) * 100)}%
+                        {ingestionJob.eta_seconds != null && ` · about ${Math.ceil(ingestionJob.eta_seconds)}s left`}
+                      </span>
+                    </div>
+                    <Progress value={(ingestionJob.progress || 0) * 100} className="h-2 bg-[#1C1C1E]" />
+                  </>
+                )}
+              </div>
+            )}
             <div className="flex space-x-3">
               <div className="flex-1 relative">
                 <Input
                   value={inputValue}
                   onChange={(e) => setInputValue(e.target.value)}
-                  placeholder={`Ask a question about your PDF... (${isDeepDive ? "Deep-dive" : "Multi-turn"} mode)`}
+                  placeholder={chatDisabled ? "Chat opens once your PDF is processed" : `Ask a question about your PDF... (${isDeepDive ? "Deep-dive" : "Multi-turn"} mode)`}
+                  disabled={chatDisabled}
                   className="bg-[#1C1C1E] border-gray-600 text-white placeholder-gray-400 pr-12 rounded-xl"
                   onKeyDown={(e) => e.key === "Enter" && handleSendMessage()}
                 />
               </div>
               <Button
                 onClick={handleSendMessage}
-                disabled={!inputValue.trim() || isLoading}
+                disabled={!inputValue.trim() || isLoading || chatDisabled}
                 className="bg-[#FFB020] hover:bg-[#FFD700] text-black rounded-xl px-6"
               >
                 <Send className="h-4 w-4" />
@@ -1,6 +1,7 @@
 "use client"
 
 import { ChatInterface } from "@/components/chat-interface"
+import { IngestionJob } from "@/hooks/use-ingestion-job"
 
 interface MainPanelProps {
   activeView: "documents" | "chat"
@@ -12,12 +13,15 @@ interface MainPanelProps {
   documents: any[]
   fetchDocuments: () => void
   onChat?: (documentId: string) => void
+  ingestionJob?: IngestionJob | null
 }
 
-export function MainPanel({ activeView, selectedPDF, selectedConversation }: MainPanelProps) {
+export function MainPanel({ activeView, selectedPDF, selectedConversation, ingestionJob }: MainPanelProps) {
+  // Only the upload's own conversation waits for its ingestion job.
+  const pendingJob = ingestionJob && ingestionJob.conversation_id === selectedConversation ? ingestionJob : null
   return (
     <div className="h-full bg-[#1C1C1E]">
-      <ChatInterface selectedConversation={selectedConversation} />
+      <ChatInterface selectedConversation={selectedConversation} ingestionJob={pendingJob} />
     </div>
   )
 }
@@ -49,26 +49,34 @@ export function Sidebar({
 }: SidebarProps) {
   const [conversations, setConversations] = useState<ConversationItem[]>([])
   const [loadingConvos, setLoadingConvos] = useState(false)
+  // Conversations are listed a page at a time; next_cursor fetches the following (older) page.
+  const [nextCursor, setNextCursor] = useState<string | null>(null)
+  const [loadingMore, setLoadingMore] = useState(false)
+
+  const fetchConversationPage = async (cursor: string | null) => {
+    const token = localStorage.getItem("token")
+    const url = cursor ? `/api/conversations?cursor=${encodeURIComponent(cursor)}` : "/api/conversations"
+    const res = await fetch(url, {
+      headers: {
+        Authorization: token ? `Bearer ${token}` : "",
+      },
+    })
+    if (!res.ok) throw new Error(`Failed to load conversations: ${res.status}`)
+    const data = await res.json()
+    return { conversations: (data.conversations || []) as ConversationItem[], nextCursor: (data.next_cursor as string | null) ?? null }
+  }
 
   useEffect(() => {
     if (activeView === "chat") {
       const fetchConversations = async () => {
         setLoadingConvos(true)
         try {
-          const token = localStorage.getItem("token")
-          const res = await fetch("/api/conversations", {
-            headers: {
-              Authorization: token ? `Bearer ${token}` : "",
-            },
-          })
-          if (res.ok) {
-            const data = await res.json()
-            setConversations(data.conversations || [])
-          } else {
-            setConversations([])
-          }
+          const page = await fetchConversationPage(null)
+          setConversations(page.conversations)
+          setNextCursor(page.nextCursor)
         } catch {
           setConversations([])
+          setNextCursor(null)
         }
         setLoadingConvos(false)
       }
@@ -76,6 +84,22 @@ export function Sidebar({
     }
   }, [activeView, refreshDocs])
 
+  const loadMoreConversations = async () => {
+    if (!nextCursor || loadingMore) return
+    setLoadingMore(true)
+    try {
+      const page = await fetchConversationPage(nextCursor)
+      setConversations(prev => {
+        const seen = new Set(prev.map(c => c.id))
+        return [...prev, ...page.conversations.filter(c => !seen.has(c.id))]
+      })
+      setNextCursor(page.nextCursor)
+    } catch {
+      // Keep the cursor so the user can retry.
+    }
+    setLoadingMore(false)
+  }
+
   useEffect(() => {
     const handler = (e: any) => {
       if (e.detail && e.detail.documentId) {
@@ -287,6 +311,18 @@ export function Sidebar({
                 </div>
               ))
             )}
+            {!loadingConvos && nextCursor && (
+              <Button
+                variant="ghost"
+                size="sm"
+                className="w-full text-gray-400 hover:text-white hover:bg-gray-700"
+                onClick={loadMoreConversations}
+                disabled={loadingMore}
+              >
+                {loadingMore ? <Loader2 className="animate-spin mr-2 h-4 w-4" /> : null}
+                {loadingMore ? "Loading..." : "Load older conversations"}
+              </Button>
+            )}
           </div>
         )}
       </div>
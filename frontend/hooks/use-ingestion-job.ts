@@ -0,0 +1,109 @@
+import * as React from "react"
+
+const POLL_INTERVAL_MS = 1000
+
+export interface IngestionJob {
+  job_id: string
+  document_id: string
+  conversation_id: string | null
+  status: "queued" | "running" | "completed" | "failed"
+  progress: number
+  eta_seconds?: number | null
+  error?: string | null
+}
+
+const isFinished = (job: IngestionJob) => job.status === "completed" || job.status === "failed"
+
+// Follows an ingestion job through the progress websocket, polling the job endpoint if the socket fails.
+export function useIngestionJob(onFinished?: (job: IngestionJob) => void) {
+  const [job, setJob] = React.useState<IngestionJob | null>(null)
+  const socketRef = React.useRef<WebSocket | null>(null)
+  const pollRef = React.useRef<ReturnType<typeof setTimeout> | null>(null)
+  const onFinishedRef = React.useRef(onFinished)
+  onFinishedRef.current = onFinished
+
+  const stop = React.useCallback(() => {
+    if (socketRef.current) {
+      const socket = socketRef.current
+      socketRef.current = null
+      socket.close()
+    }
+    if (pollRef.current) {
+      clearTimeout(pollRef.current)
+      pollRef.current = null
+    }
+  }, [])
+
+  const track = React.useCallback((initial: IngestionJob) => {
+    stop()
+    setJob(initial)
+    if (isFinished(initial)) {
+      onFinishedRef.current?.(initial)
+      return
+    }
+    const token = localStorage.getItem("token")
+    let finished = false
+
+    const update = (next: IngestionJob) => {
+      if (finished) return
+      setJob(next)
+      if (isFinished(next)) {
+        finished = true
+        stop()
+        onFinishedRef.current?.(next)
+      }
+    }
+
+    const poll = async () => {
+      pollRef.current = null
+      try {
+        const res = await fetch(`/api/documents/jobs/${initial.job_id}`, {
+          headers: {
+            Authorization: token ? `Bearer ${token}` : "",
+          },
+        })
+        if (res.status === 404) {
+          update({ ...initial, status: "failed", error: "Ingestion job not found." })
+          return
+        }
+        if (res.ok) {
+          update(await res.json())
+        }
+      } catch {
+        // Retried on the next poll.
+      }
+      if (!finished) {
+        pollRef.current = setTimeout(poll, POLL_INTERVAL_MS)
+      }
+    }
+
+    const wsProtocol = window.location.protocol === "https:" ? "wss" : "ws"
+    const ws = new WebSocket(`${wsProtocol}://${window.location.host}/api/documents/jobs/${initial.job_id}/progress?token=${token}`)
+    socketRef.current = ws
+    ws.onmessage = (event) => {
+      const data = JSON.parse(event.data)
+      if (data.error && !data.job_id) {
+        update({ ...initial, status: "failed", error: data.error })
+        return
+      }
+      update(data)
+    }
+    // The socket closes after the final status; closing earlier (or failing to connect) falls back to polling.
+    ws.onclose = () => {
+      if (socketRef.current !== ws) return
+      socketRef.current = null
+      if (!finished && !pollRef.current) {
+        poll()
+      }
+    }
+  }, [stop])
+
+  const reset = React.useCallback(() => {
+    stop()
+    setJob(null)
+  }, [stop])
+
+  React.useEffect(() => stop, [stop])
+
+  return { job, track, reset }
+}